@@ -0,0 +1,92 @@
+import logging
+import time
+
+from common import PROFILES
+from ratelimit import RateLimiter
+
+
+class Account:
+    """一个 cookie 对应一个账号，设备参数由 common.PROFILES 按 cookie 缓存"""
+
+    def __init__(self, name: str, cookie: str):
+        self.name = name
+        self.cookie = cookie
+        self.requests = 0
+        self.empty_streak = 0
+        self.quarantines = 0
+        self.quarantined_until = 0.0
+        self.first_request_at = None
+
+    @property
+    def quarantined(self) -> bool:
+        return time.monotonic() < self.quarantined_until
+
+    @property
+    def rps(self) -> float:
+        if self.first_request_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.first_request_at
+        return self.requests / elapsed if elapsed > 0 else 0.0
+
+
+class AccountPool:
+    """
+    多账号轮换：每次请求选择当前令牌最多（剩余额度最多）的账号；
+    连续返回空评论列表的账号会被隔离一段时间
+    """
+
+    def __init__(self, cookies: list[str], limiter: RateLimiter, quarantine_after: int = 3,
+                 quarantine_time: float = 600):
+        cookies = [cookie for cookie in cookies if cookie is not None]
+        if not cookies:
+            cookies = ['']
+        self.accounts = [Account(f"account-{i}", cookie) for i, cookie in enumerate(cookies)]
+        self.limiter = limiter
+        self.quarantine_after = quarantine_after
+        self.quarantine_time = quarantine_time
+
+    def pick(self, url: str) -> Account:
+        candidates = [account for account in self.accounts if not account.quarantined]
+        if not candidates:
+            # 全部被隔离时不停下来，使用最早解除隔离的账号
+            account = min(self.accounts, key=lambda a: a.quarantined_until)
+            logging.warning(f"All accounts are quarantined, falling back to {account.name}.")
+        else:
+            account = max(candidates, key=lambda a: (self.limiter.bucket(url, a.cookie).available(), -a.requests))
+        if account.first_request_at is None:
+            account.first_request_at = time.monotonic()
+        account.requests += 1
+        return account
+
+    def report(self, account: Account, data: dict, key: str = "comments", cursor=None) -> bool:
+        """
+        根据返回的数据判断账号是否被软封：还有更多（has_more）却返回空列表，或者还有更多但翻页位置没有前进
+        （cursor 是这次请求的位置），都视为一次空响应。没有更多时列表为空或 null 是正常的（视频没有评论、
+        回复都被删除了），不算。返回是否为空响应
+        """
+        data = data if isinstance(data, dict) else {}
+        has_more = bool(data.get("has_more"))
+        next_cursor = data.get("max_cursor" if key == "aweme_list" else "cursor")
+        stuck = has_more and cursor is not None and next_cursor is not None and str(next_cursor) == str(cursor)
+        if not (has_more and not data.get(key)) and not stuck:
+            account.empty_streak = 0
+            return False
+        account.empty_streak += 1
+        if account.empty_streak >= self.quarantine_after:
+            account.empty_streak = 0
+            account.quarantines += 1
+            account.quarantined_until = time.monotonic() + self.quarantine_time
+            PROFILES.invalidate(account.cookie)
+            logging.warning(f"{account.name} keeps returning empty {key}, quarantined for {self.quarantine_time}s.")
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            account.name: {
+                "requests": account.requests,
+                "rps": round(account.rps, 3),
+                "quarantined": account.quarantined,
+                "quarantines": account.quarantines,
+            }
+            for account in self.accounts
+        }
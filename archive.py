@@ -0,0 +1,304 @@
+"""
+列式归档：新增的评论和回复按入库日期和视频分区写成 Parquet（或 Arrow IPC）文件，
+compact 把每个分区一天内的小文件合并成一个按评论时间排序的文件。目录结构（hive 分区）：
+
+    archive/{comments|replies}/date=YYYY-MM-DD/video={视频ID}/{HH}-{纳秒时间戳}.parquet   每批新增的行
+    archive/{comments|replies}/date=YYYY-MM-DD/video={视频ID}/day-{纳秒时间戳}.parquet    合并后的文件
+
+读取时按 date、video 分区和文件内各列的统计信息（如 评论时间）跳过用不到的文件和行组，
+Arrow 格式不压缩，可以直接内存映射读取。需要 pyarrow（pip install pyarrow）
+
+    python archive.py compact [--today] [--import-csv [--remove-csv]]
+    python archive.py stats
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from db import COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+# 视频ID 由分区目录表示，不写入文件
+FILE_COLUMNS = {table_name: [c for c in columns if c != "视频ID"] for table_name, columns in COLUMNS.items()}
+CSV_NAME = re.compile(r"^(.+)_(comments|replies)\.csv$")
+# 已经导入归档的增量 CSV，位于归档根目录
+IMPORTED_CSV = "imported_csv.json"
+
+
+def _to_table(rows: pd.DataFrame, columns: list[str]) -> "pa.Table":
+    # 所有列都按字符串保存，和数据库中的 TEXT 一致；从 CSV 读入的数字ID也转成字符串
+    arrays = []
+    for column in columns:
+        values = rows[column].astype(object) if column in rows else pd.Series([None] * len(rows), dtype=object)
+        arrays.append(pa.array([None if pd.isna(v) else v if isinstance(v, str) else str(v) for v in values],
+                               pa.string()))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+class Archive:
+    def __init__(self, root: str = "archive", fmt: str = "parquet"):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("The columnar archive needs pyarrow: pip install pyarrow")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown archive format {fmt}, expected one of {', '.join(FORMATS)}")
+        self.root = root
+        self.fmt = fmt
+        self.ext = FORMATS[fmt]
+
+    def partition(self, table_name: str, date: str, video_id) -> str:
+        return os.path.join(self.root, table_name, f"date={date}", f"video={video_id}")
+
+    def _write_file(self, table: "pa.Table", path: str):
+        # 先写以 . 开头的临时文件（读取时会被忽略），写完再改名，读者不会看到写了一半的文件
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+        if self.fmt == "parquet":
+            pq.write_table(table, partial, compression="zstd")
+        else:
+            with pa.ipc.new_file(partial, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(partial, path)
+
+    def _read_file(self, path: str) -> "pa.Table":
+        if self.fmt == "parquet":
+            return pq.read_table(path)
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _read_metadata(self, path: str) -> dict:
+        if self.fmt == "parquet":
+            schema = pq.read_schema(path)
+        else:
+            with pa.memory_map(path) as source:
+                schema = pa.ipc.open_file(source).schema
+        return {key.decode(): value.decode() for key, value in (schema.metadata or {}).items()}
+
+    def write(self, table_name: str, video_id, rows: pd.DataFrame, when: datetime = None) -> str:
+        """把一批新增的行写成分区 date=入库日期/video=视频ID 下的一个新文件，返回文件路径"""
+        when = when or datetime.now()
+        path = os.path.join(self.partition(table_name, when.strftime('%Y-%m-%d'), video_id),
+                            f"{when.strftime('%H')}-{time.time_ns()}{self.ext}")
+        self._write_file(_to_table(rows, FILE_COLUMNS[table_name]), path)
+        return path
+
+    def _compact_partition(self, folder: str, table_name: str) -> int:
+        """合并一个分区中的所有文件，返回合并掉的文件数"""
+        files = sorted(f for f in os.listdir(folder) if f.endswith(self.ext) and not f.startswith("."))
+        # 上次合并在写完新文件之后、删除旧文件之前中断：按新文件中记录的来源删掉旧文件
+        for name in [f for f in files if f.startswith("day-")]:
+            sources = json.loads(self._read_metadata(os.path.join(folder, name)).get("compacted_from", "[]"))
+            for source in set(sources) & set(files):
+                os.remove(os.path.join(folder, source))
+                files.remove(source)
+        if len(files) <= 1:
+            return 0
+        table = pa.concat_tables([self._read_file(os.path.join(folder, f)) for f in files])
+        # 同一条评论可能被导入两次（例如 CSV 导入和抓取时的归档都有），按 评论ID 去重
+        frame = (table.to_pandas().drop_duplicates("评论ID", keep="last")
+                 .sort_values(["评论时间", "评论ID"], kind="stable"))
+        table = _to_table(frame, FILE_COLUMNS[table_name])
+        table = table.replace_schema_metadata({"compacted_from": json.dumps(files)})
+        self._write_file(table, os.path.join(folder, f"day-{time.time_ns()}{self.ext}"))
+        for name in files:
+            os.remove(os.path.join(folder, name))
+        return len(files)
+
+    def compact(self, include_today: bool = False) -> dict:
+        """
+        Merge the files of each (date, video) partition into one file sorted by 评论时间.
+        Only days before today are compacted unless include_today; files written after a compaction are merged the
+        next time. Readers running during a compaction may briefly see a partition's rows twice.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        partitions = merged = 0
+        for table_name in COLUMNS:
+            table_root = os.path.join(self.root, table_name)
+            if not os.path.isdir(table_root):
+                continue
+            for date_dir in sorted(os.listdir(table_root)):
+                if not date_dir.startswith("date=") or (date_dir[5:] >= today and not include_today):
+                    continue
+                for video_dir in sorted(os.listdir(os.path.join(table_root, date_dir))):
+                    count = self._compact_partition(os.path.join(table_root, date_dir, video_dir), table_name)
+                    if count:
+                        partitions += 1
+                        merged += count
+        result = {"partitions": partitions, "files_merged": merged}
+        logging.info(f"Archive compaction: {result}")
+        return result
+
+    def _load_imported(self) -> dict:
+        path = os.path.join(self.root, IMPORTED_CSV)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_imported(self, imported: dict):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, IMPORTED_CSV)
+        with open(path + ".part", "w", encoding="utf-8") as f:
+            json.dump(imported, f, ensure_ascii=False)
+        os.replace(path + ".part", path)
+
+    def import_csv(self, folder: str = "data", include_today: bool = False, remove: bool = False) -> dict:
+        """
+        Move the incremental CSVs data/{date}/{hour}/{video_id}_{table}.csv into the archive, one file per date,
+        video and table. remove deletes the CSVs (and empty folders) once their rows are archived.
+        Imported files are recorded in archive/imported_csv.json (mtime, size and row count), so running it again
+        without remove skips them; a CSV that has grown since (rows are only appended) imports only the new rows.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        files = rows = skipped = 0
+        if not os.path.isdir(folder):
+            return {"csv_files": 0, "rows": 0, "skipped": 0}
+        imported = self._load_imported()
+        for date in sorted(os.listdir(folder)):
+            date_folder = os.path.join(folder, date)
+            if not os.path.isdir(date_folder) or not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
+                continue
+            if date >= today and not include_today:
+                continue
+            groups: dict[tuple[str, str], list[str]] = {}
+            for hour in sorted(os.listdir(date_folder)):
+                hour_folder = os.path.join(date_folder, hour)
+                if not os.path.isdir(hour_folder):
+                    continue
+                for name in sorted(os.listdir(hour_folder)):
+                    match = CSV_NAME.match(name)
+                    if match:
+                        groups.setdefault((match.group(2), match.group(1)), []).append(os.path.join(hour_folder, name))
+            for (table_name, video_id), paths in groups.items():
+                frames, seen = [], {}
+                for csv_path in paths:
+                    key = os.path.abspath(csv_path)
+                    stat = os.stat(csv_path)
+                    entry = imported.get(key)
+                    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                        skipped += 1
+                        continue
+                    frame = pd.read_csv(csv_path, dtype=str)
+                    seen[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "rows": len(frame)}
+                    # 之前导入过、之后又追加了行的文件只导入新增的部分
+                    if entry and stat.st_size >= entry["size"]:
+                        frame = frame.iloc[entry["rows"]:]
+                    frames.append(frame)
+                frame = pd.concat(frames, ignore_index=True) if frames else None
+                if frame is not None and len(frame):
+                    path = os.path.join(self.partition(table_name, date, video_id), f"csv-{time.time_ns()}{self.ext}")
+                    self._write_file(_to_table(frame, FILE_COLUMNS[table_name]), path)
+                    files += len(frames)
+                    rows += len(frame)
+                if remove:
+                    for csv_path in paths:
+                        os.remove(csv_path)
+                        imported.pop(os.path.abspath(csv_path), None)
+                elif seen:
+                    imported.update(seen)
+                # 每组写完就记录，中途失败时重新运行不会重复导入已经写入的组
+                if remove or seen:
+                    self._save_imported(imported)
+            if remove:
+                for hour in os.listdir(date_folder):
+                    hour_folder = os.path.join(date_folder, hour)
+                    if os.path.isdir(hour_folder) and not os.listdir(hour_folder):
+                        os.rmdir(hour_folder)
+                if not os.listdir(date_folder):
+                    shutil.rmtree(date_folder)
+        result = {"csv_files": files, "rows": rows, "skipped": skipped}
+        logging.info(f"Archived incremental CSVs: {result}")
+        return result
+
+    def dataset(self, table_name: str) -> "ds.Dataset":
+        """整张表的 pyarrow Dataset，date 和 video 是分区列；文件通过内存映射读取"""
+        partitions = pa.schema([("date", pa.string()), ("video", pa.string())])
+        schema = pa.schema([(c, pa.string()) for c in FILE_COLUMNS[table_name]] + list(partitions))
+        return ds.dataset(os.path.abspath(os.path.join(self.root, table_name)), schema=schema,
+                          format="parquet" if self.fmt == "parquet" else "ipc",
+                          partitioning=ds.partitioning(partitions, flavor="hive"),
+                          filesystem=fs.LocalFileSystem(use_mmap=True))
+
+    def read(self, table_name: str, video_id=None, since=None, until=None, columns: list[str] = None) -> pd.DataFrame:
+        """
+        Read archived rows. video_id (one id or a list) prunes partitions; since/until filter 评论时间 and are pushed
+        down to the row-group statistics. since also skips dates before it, since a comment is never stored before
+        it was written.
+        """
+        if not os.path.isdir(os.path.join(self.root, table_name)):
+            return pd.DataFrame(columns=columns or FILE_COLUMNS[table_name] + ["date", "video"])
+        conditions = []
+        if video_id is not None:
+            video_ids = [video_id] if isinstance(video_id, (str, int)) else list(video_id)
+            conditions.append(ds.field("video").isin([str(v) for v in video_ids]))
+        if since is not None:
+            since = since.strftime('%Y-%m-%d %H:%M:%S') if isinstance(since, datetime) else str(since)
+            conditions.append(ds.field("date") >= since[:10])
+            conditions.append(ds.field("评论时间") >= since)
+        if until is not None:
+            until = until.strftime('%Y-%m-%d %H:%M:%S') if isinstance(until, datetime) else str(until)
+            conditions.append(ds.field("评论时间") <= until)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return self.dataset(table_name).to_table(columns=columns, filter=expression).to_pandas()
+
+    def stats(self) -> dict:
+        result = {}
+        for table_name in COLUMNS:
+            partitions = files = size = 0
+            for folder, _, names in os.walk(os.path.join(self.root, table_name)):
+                names = [n for n in names if n.endswith(self.ext) and not n.startswith(".")]
+                if names:
+                    partitions += 1
+                    files += len(names)
+                    size += sum(os.path.getsize(os.path.join(folder, n)) for n in names)
+            result[table_name] = {"partitions": partitions, "files": files, "bytes": size}
+        return result
+
+
+def from_config(config) -> "Archive | None":
+    """config 中 archive_format 为 None 时不归档"""
+    fmt = getattr(config, "archive_format", None)
+    return Archive(getattr(config, "archive_dir", "archive"), fmt) if fmt else None
+
+
+def main():
+    import config
+    from main import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("compact", help="把每个分区的小文件合并成一个每天的文件")
+    p.add_argument("--today", action="store_true", help="同时合并今天的分区")
+    p.add_argument("--import-csv", action="store_true", help="先把 data/{日期}/{小时} 中的增量 CSV 导入归档")
+    p.add_argument("--remove-csv", action="store_true", help="导入后删除这些 CSV")
+    sub.add_parser("stats", help="各表的分区数、文件数和大小")
+    args = parser.parse_args()
+
+    setup_logging(config.logs_dir)
+    archive = Archive(getattr(config, "archive_dir", "archive"), getattr(config, "archive_format", None) or "parquet")
+    if args.command == "compact":
+        if args.import_csv:
+            archive.import_csv(include_today=args.today, remove=args.remove_csv)
+        archive.compact(include_today=args.today)
+    print(json.dumps(archive.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,693 @@
+"""
+性能基准脚本
+
+    python benchmark.py sign [-n 2000]
+    python benchmark.py replies [--comments 2000 --replies 10000]
+    python benchmark.py normalize [--comments 50000]
+    python benchmark.py offload [-n 2000 --workers 0]
+    python benchmark.py search [--rows 1000000]
+    python benchmark.py badwords [--comments 200000 --keywords 1000]
+    python benchmark.py export [--rows 500000]
+    python benchmark.py archive [--rows 300000 --videos 20 --days 14 --batches 24]
+    python benchmark.py lookup [--comments 200000 --replies 400000 --ids 20000]
+    python benchmark.py e2e [--videos 4 --comments 2000 --replies 5 --latency 0.02 --throttle 0.01 --offload process]
+
+e2e 会启动 mock_server.py，把 main.crawl 的请求全部转发到本地，跑完整个抓取和入库流程
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import httpx
+import pandas as pd
+
+from common import COMMON_HEADERS
+
+QUERY = ("device_platform=webapp&aid=6383&channel=channel_pc_web&aweme_id=7411856833750519090&cursor=0&count=50"
+         "&item_type=0&update_version_code=170400&pc_client_type=1&version_code=190500&version_name=19.5.0"
+         "&cookie_enabled=true&screen_width=2560&screen_height=1440&browser_language=zh-CN")
+
+
+def bench_sign(n: int):
+    import signer
+    from abogus import PythonSigner
+
+    user_agent = COMMON_HEADERS["User-Agent"]
+    items = [("sign_datail", f"{QUERY}&msToken={i}", user_agent) for i in range(n)]
+    backends = {
+        "python": PythonSigner(),
+        "pool": signer.SignerPool(2),
+    }
+    for name, backend in backends.items():
+        backend.sign(*items[0])  # 预热
+        start = time.perf_counter()
+        for item in items:
+            backend.sign(*item)
+        single = n / (time.perf_counter() - start)
+        start = time.perf_counter()
+        asyncio.run(backend.sign_many(items))
+        batch = n / (time.perf_counter() - start)
+        print(f"{name:>8}: {single:10.0f} signs/s single, {batch:10.0f} signs/s batch")
+        backend.close()
+
+
+def make_comments(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [{
+        "cid": str(7400000000000000000 + i),
+        "text": f"评论{i}\n",
+        "create_time": 1700000000 + rng.randint(0, 10 ** 6),
+        "user": {"nickname": f"user{rng.randint(0, n)}"},
+        "reply_comment_total": 0,
+    } for i in range(n)]
+
+
+def make_replies(comments: list[dict], n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    replies = []
+    for i in range(n):
+        parent = rng.choice(comments)["cid"]
+        siblings = [r for r in replies[-20:] if r["reply_id"] == parent]
+        target = rng.choice(siblings) if siblings and rng.random() < 0.5 else None
+        replies.append({
+            "cid": str(7500000000000000000 + i),
+            "text": f"回复{i}",
+            "create_time": 1700000000 + rng.randint(0, 10 ** 6),
+            "user": {"nickname": f"replier{rng.randint(0, n)}"},
+            "reply_id": parent,
+            "reply_to_reply_id": target["cid"] if target else "0",
+            "reply_to_username": target["user"]["nickname"] if target else "",
+        })
+    return replies
+
+
+def process_replies_legacy(replies: list[dict], comments: pd.DataFrame) -> pd.DataFrame:
+    # 改为索引之前的实现：每条回复都扫描一遍整个评论表，仅用于对比
+    data = []
+    for c in replies:
+        matching_comments = comments.loc[comments['评论ID'] == c["reply_id"], '用户昵称']
+        if not matching_comments.empty:
+            reply_to_user = matching_comments.iloc[0]
+        else:
+            reply_to_user = c["reply_to_username"]
+        data.append({
+            "评论ID": c["cid"],
+            "评论内容": c["text"].replace("\n", "").replace("\r", ""),
+            "评论时间": datetime.fromtimestamp(c["create_time"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "用户昵称": c["user"]["nickname"],
+            "回复的评论": c["reply_id"],
+            "具体的回复对象": c["reply_to_reply_id"] if c["reply_to_reply_id"] != "0" else c["reply_id"],
+            "回复给谁": reply_to_user
+        })
+    return pd.DataFrame(data)
+
+
+def bench_replies(n_comments: int, n_replies: int):
+    from main import process_comments, process_replies
+
+    raw_comments = make_comments(n_comments)
+    raw_replies = make_replies(raw_comments, n_replies)
+    comments = process_comments(raw_comments)
+    for name, fn in (("indexed", process_replies), ("legacy", process_replies_legacy)):
+        start = time.perf_counter()
+        fn(raw_replies, comments)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: {elapsed:8.3f}s, {n_replies / elapsed:10.0f} replies/s")
+
+
+def process_comments_legacy(comments: list[dict]) -> pd.DataFrame:
+    # 列式整理之前的实现：逐条构造字典、逐条格式化时间，仅用于对比
+    return pd.DataFrame([{
+        "评论ID": c["cid"],
+        "评论内容": c["text"].replace("\n", "").replace("\r", ""),
+        "评论时间": datetime.fromtimestamp(c["create_time"]).strftime("%Y-%m-%d %H:%M:%S"),
+        "用户昵称": c["user"]["nickname"],
+    } for c in comments])
+
+
+def bench_normalize(n_comments: int):
+    from main import process_comments
+
+    raw_comments = make_comments(n_comments)
+    results = {}
+    for name, fn in (("columnar", process_comments), ("legacy", process_comments_legacy)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        results[name] = fn(raw_comments)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:>8}: {elapsed:8.3f}s, {n_comments / elapsed:10.0f} comments/s, peak {peak / 2 ** 20:7.1f} MiB")
+    same = results["columnar"].astype(str).equals(results["legacy"].astype(str))
+    print(f"output identical: {same}")
+
+
+class LocalTransport(httpx.AsyncBaseTransport):
+    """把所有请求转发到本地模拟服务器"""
+
+    def __init__(self, base: str, limits: httpx.Limits):
+        self.base = httpx.URL(base)
+        self.inner = httpx.AsyncHTTPTransport(limits=limits)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme=self.base.scheme, host=self.base.host, port=self.base.port)
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    # Linux 上单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def start_mock_server(args) -> tuple[subprocess.Popen, str]:
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_server.py"),
+               "--port", "0", "--comments", str(args.comments), "--replies", str(args.replies),
+               "--videos", str(args.videos), "--latency", str(args.latency), "--throttle", str(args.throttle),
+               "--error", str(args.error), "--max-rps", str(args.max_rps)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("listening on "):
+        server.kill()
+        raise RuntimeError("mock server failed to start")
+    return server, line.split()[-1]
+
+
+def make_raw_page(n: int, seed: int = 0) -> bytes:
+    """接近线上大小的一页评论（每条带完整的用户信息、头像地址等），用于解码的压测"""
+    rng = random.Random(seed)
+    comments = []
+    for i in range(n):
+        uid = rng.randint(10 ** 10, 10 ** 11)
+        comments.append({
+            "cid": str(7400000000000000000 + i), "text": f"评论{i} " * rng.randint(1, 20),
+            "aweme_id": "7400000000000000000", "create_time": 1700000000 + rng.randint(0, 10 ** 6),
+            "digg_count": rng.randint(0, 1000), "status": 1, "reply_id": "0", "reply_comment_total": rng.randint(0, 30),
+            "user": {
+                "uid": str(uid), "short_id": "0", "nickname": f"user{uid}", "signature": "签名 " * 10,
+                "avatar_thumb": {"uri": f"100x100/aweme-avatar/{uid}", "width": 720, "height": 720, "url_list": [
+                    f"https://p{k}.douyinpic.com/aweme/100x100/aweme-avatar/{uid}.jpeg?from=2956013662"
+                    for k in range(3)]},
+                "sec_uid": f"MS4wLjABAAAA{uid:x}" * 3, "region": "CN", "language": "zh-Hans",
+                "is_star": False, "follow_status": 0, "custom_verify": "", "enterprise_verify_reason": "",
+            },
+            "label_list": None, "is_author_digged": False, "user_digged": 0, "ip_label": "广东",
+            "text_extra": [], "image_list": None, "is_hot": False, "level": 1,
+        })
+    return json.dumps({"status_code": 0, "comments": comments, "cursor": n, "has_more": 1, "total": n * 100,
+                       "extra": {"now": 1700000000000}, "log_pb": {"impr_id": "x" * 40}},
+                      ensure_ascii=False).encode()
+
+
+def bench_offload(n: int, concurrency: int, workers: int, batch: int):
+    import offload
+    import signer
+    from common import PROFILES, DeviceProfile
+    from main import process_comments, request_json
+    from ratelimit import RateLimiter
+    from session import CrawlSession
+
+    cookie = "sessionid=bench; s_v_web_id=verify_bench"
+    PROFILES._profiles[cookie] = DeviceProfile(cookie, "7400000000000000001", ttl=10 ** 6)
+    body = make_raw_page(50)
+    uri = "https://www.douyin.com/aweme/v1/web/comment/list/"
+    signer.configure("python")
+    print(f"{n} requests, body {len(body) / 1024:.0f} KiB, {os.cpu_count()} CPUs")
+    # 请求走完整的 request_json -> CrawlSession.get 路径，只是响应由 MockTransport 直接返回
+    # 每次返回同一页，只把 cursor 改成请求位置之后，否则会被当作翻页卡住（软封）
+    head, tail = body.split(b'"cursor": 50,', 1)
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        cursor = int(request.url.params.get("cursor", 0)) + 50
+        return httpx.Response(200, headers={"content-type": "application/json"},
+                              content=head + f'"cursor": {cursor},'.encode() + tail)
+
+    transport = httpx.MockTransport(respond)
+
+    async def run() -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = RateLimiter(rate=10 ** 6, burst=10 ** 6, max_rate=10 ** 6)
+
+        async with CrawlSession(limiter=limiter, cookies=[cookie], transport=transport) as session:
+            async def one(i: int):
+                async with semaphore:
+                    params = {"aweme_id": "7400000000000000000", "cursor": str(i * 50), "count": "50", "item_type": 0}
+                    data = await request_json(session, uri, params)
+                    return process_comments(data["comments"])
+
+            return await asyncio.gather(*(one(i) for i in range(n)))
+
+    frames = {}
+    for mode in ("inline", "process"):
+        offload.configure(mode, workers, batch, sign_backend="python")
+        if offload.get_offloader().enabled:
+            asyncio.run(run())  # 预热：启动子进程
+        cpu, start = time.process_time(), time.perf_counter()
+        frames[mode] = asyncio.run(run())
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+        offload.close()
+        print(f"{mode:>8}: {n / elapsed:8.0f} req/s, main process CPU {cpu / n * 1000:6.3f} ms/request")
+    same = all(a.equals(b) for a, b in zip(frames["inline"], frames["process"]))
+    print(f"output identical: {same}")
+    signer.close()
+
+
+WORDS = ["哈工大", "军训", "学长", "食堂", "宿舍", "好看", "加油", "哈哈哈", "图书馆", "考研", "毕业", "操场",
+         "太阳", "晒黑", "教官", "同学", "母校", "想家", "冲冲冲", "期末", "论文", "实验室", "早八", "打卡"]
+
+
+def make_text(rng: random.Random) -> str:
+    # 随机汉字（常用字区间）中偶尔夹杂关键词，接近真实评论的长度和分布
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        parts.append("".join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(rng.randint(2, 12))))
+        if rng.random() < 0.05:
+            parts.append(rng.choice(WORDS))
+    return "".join(parts)
+
+
+def bench_search(n_rows: int, repeat: int, limit: int):
+    from db import crdb
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="douyin-search-")
+    rows = pd.DataFrame({
+        "评论ID": [str(7400000000000000000 + i) for i in range(n_rows)],
+        "评论内容": [make_text(rng) for _ in range(n_rows)],
+        "评论时间": [datetime.fromtimestamp(1700000000 + i * 30).strftime("%Y-%m-%d %H:%M:%S") for i in range(n_rows)],
+        "用户昵称": [f"用户{rng.randint(0, n_rows)}" for _ in range(n_rows)],
+        "视频ID": [str(7411856833750519090 + i % 50) for i in range(n_rows)],
+    })
+    try:
+        results = {}
+        for name, indexed in (("LIKE", False), ("FTS5", True)):
+            db = crdb(os.path.join(workdir, f"{name}.db"), search_index=indexed)
+            start = time.perf_counter()
+            for i in range(0, n_rows, 10000):
+                db.insert_rows("comments", rows.iloc[i:i + 10000])
+            insert = n_rows / (time.perf_counter() - start)
+            print(f"{name:>5}: insert {insert:9.0f} rows/s")
+            for keyword, filters in (("图书馆", {}), ("实验室", {"video_id": 7411856833750519091}),
+                                     ("冲冲冲", {"since": "2023-11-15", "until": "2023-11-20"}), ("考研", {})):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    found = db.search(keyword, limit=limit, **filters)
+                elapsed = (time.perf_counter() - start) / repeat
+                # 全部匹配的行用于比较两种方式的结果是否一致
+                results.setdefault(keyword, []).append(set(db.search(keyword, limit=n_rows, **filters)["评论ID"]))
+                print(f"       {keyword:>4} {str(filters):>48}: {len(results[keyword][-1]):7d} matches, "
+                      f"top {len(found)} in {elapsed * 1000:8.2f} ms")
+            db.close()
+        same = all(a == b for a, b in results.values())
+        print(f"same rows: {same}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_badwords(n_comments: int, n_keywords: int):
+    from comments import BadComment
+    from db import crdb
+    from matcher import RuleSet
+
+    rng = random.Random(0)
+    keywords = ["".join(chr(rng.randint(0x4E00, 0x4E00 + 3000)) for _ in range(rng.randint(2, 4)))
+                for _ in range(n_keywords)] + WORDS[:5]
+    texts = [make_text(rng) for _ in range(n_comments)]
+    rules = RuleSet(keywords, [r"https?://\S+", r"v[x信]\s*[:：]?\s*[a-z0-9_-]{5,}"])
+    print(f"{n_comments} comments, {len(rules)} rules")
+
+    start = time.perf_counter()
+    automaton = [rules.match(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    print(f"aho-corasick: {n_comments / elapsed:10.0f} comments/s")
+    # 逐个关键词 in 查找，仅用于对比
+    lowered = [k.casefold() for k in rules.automaton.keywords]
+    start = time.perf_counter()
+    naive = [[k for k in lowered if k in text.casefold()] for text in texts]
+    elapsed = time.perf_counter() - start
+    print(f"  naive scan: {n_comments / elapsed:10.0f} comments/s")
+    same = all(sorted(k for k in a if not k.startswith("re:")) == sorted(b) for a, b in zip(automaton, naive))
+    print(f"same matches: {same}")
+
+    # 完整的增量扫描：从 crdb 读取、匹配、批量写入 bad_comments.db
+    workdir = tempfile.mkdtemp(prefix="douyin-badwords-")
+    try:
+        db = crdb(os.path.join(workdir, "comments_replies.db"), search_index=False)
+        db.insert_rows("comments", pd.DataFrame({
+            "评论ID": [str(7400000000000000000 + i) for i in range(n_comments)], "评论内容": texts,
+            "评论时间": "2024-09-01 00:00:00", "用户昵称": "user", "视频ID": "7411856833750519090"}))
+        db.close()
+        bc = BadComment(os.path.join(workdir, "bad_comments.db"))
+        print(f"  first scan: {bc.scan(rules, os.path.join(workdir, 'comments_replies.db'))}")
+        print(f" second scan: {bc.scan(rules, os.path.join(workdir, 'comments_replies.db'))}")
+        bc.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_e2e(args):
+    # 模拟服务器在单独的进程里，不和抓取进程抢 GIL，也不计入峰值内存
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    import main as crawler
+    import offload
+    import signer
+    from metrics import STAGES
+
+    server, base = start_mock_server(args)
+    workdir = tempfile.mkdtemp(prefix="douyin-bench-")
+    cwd = os.getcwd()
+    config = SimpleNamespace(
+        query_type="creator" if args.creator else "detail",
+        creator_ids=[f"MS4wLjABAAAAbench{i:04d}" for i in range(args.videos)],
+        count=1,
+        aweme_ids=[7400000000000000000 + i for i in range(args.videos)],
+        cookie="",
+        cookies=[f"sessionid=bench{i}; s_v_web_id=verify_bench{i}" for i in range(args.accounts)],
+        max_concurrency=args.concurrency,
+        per_video_concurrency=args.per_video,
+        max_parallel_videos=args.parallel_videos,
+        rate_limit=args.rate,
+        rate_limit_burst=args.rate,
+        rate_limit_max=args.rate * 4,
+        retry_base_delay=0.1,
+        incremental_csv=False,
+        export_csv=False,
+    )
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    try:
+        # 数据库和 data 目录写到临时目录
+        os.chdir(workdir)
+        signer.configure(args.sign_backend, args.sign_workers)
+        offload.configure(args.offload, args.offload_workers, sign_backend=args.sign_backend)
+        STAGES.reset()
+        start = time.perf_counter()
+        asyncio.run(crawler.crawl(config, LocalTransport(base, limits)))
+        elapsed = time.perf_counter() - start
+        offload.close()
+        signer.close()
+
+        stats = httpx.get(f"{base}/__stats").json()
+        with sqlite3.connect("comments_replies.db") as conn:
+            comments, = conn.execute("SELECT COUNT(*) FROM comments").fetchone()
+            replies, = conn.execute("SELECT COUNT(*) FROM replies").fetchone()
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    requests = sum(n for key, n in stats.items() if key.startswith("/aweme/") and " " not in key)
+    print(f"elapsed:   {elapsed:10.2f}s")
+    print(f"requests:  {requests:10d}  ({requests / elapsed:.1f} req/s)")
+    print(f"comments:  {comments:10d}  ({comments / elapsed:.1f} comments/s)")
+    print(f"replies:   {replies:10d}  ({replies / elapsed:.1f} replies/s)")
+    print(f"peak RSS:  {peak_rss_mb():10.1f} MB")
+    print("responses: " + ", ".join(f"{key} {n}" for key, n in sorted(stats.items()) if " " in key))
+    print("stages (summed over concurrent tasks):")
+    for stage, summary in STAGES.summary().items():
+        print(f"  {stage:>10}: {summary['count']:8d} x {summary['mean'] * 1000:9.3f} ms = {summary['sum']:8.2f}s"
+              f"  (p95 {summary['p95'] * 1000:.1f} ms)")
+
+
+def bench_export(n_rows: int):
+    from db import crdb
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="douyin-export-")
+    try:
+        db = crdb(os.path.join(workdir, "comments_replies.db"), search_index=False)
+        for i in range(0, n_rows, 50000):
+            n = min(50000, n_rows - i)
+            db.insert_rows("comments", pd.DataFrame({
+                "评论ID": [str(7400000000000000000 + i + j) for j in range(n)],
+                "评论内容": [make_text(rng) for _ in range(n)],
+                "评论时间": [datetime.fromtimestamp(1700000000 + (i + j) * 30).strftime("%Y-%m-%d %H:%M:%S")
+                         for j in range(n)],
+                "用户昵称": [f"用户{rng.randint(0, n_rows)}" for _ in range(n)],
+                "视频ID": [str(7411856833750519090 + (i + j) % 50) for j in range(n)],
+            }))
+
+        def measure(name, fn, path):
+            tracemalloc.start()
+            start = time.perf_counter()
+            fn(path)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:>22}: {n_rows / elapsed:9.0f} rows/s, peak {peak / 2 ** 20:7.1f} MB, "
+                  f"{os.path.getsize(path) / 2 ** 20:7.1f} MB on disk")
+
+        def legacy(path):
+            # 以前 data_to_csv 的做法：fetchall 后整体转成 DataFrame 再写出
+            cursor = db.conn.execute("SELECT * FROM comments")
+            rows = cursor.fetchall()
+            pd.DataFrame(rows, columns=[c[0] for c in cursor.description]).to_csv(path, index=False)
+
+        print(f"{n_rows} comments")
+        legacy_path = os.path.join(workdir, "legacy.csv")
+        measure("fetchall + pandas csv", legacy, legacy_path)
+        for suffix in ("csv", "csv.gz", "jsonl"):
+            path = os.path.join(workdir, f"comments.{suffix}")
+            measure(f"streamed {suffix}", lambda p: db.export("comments", p), path)
+        with open(legacy_path, "rb") as a, open(os.path.join(workdir, "comments.csv"), "rb") as b:
+            print(f"same csv: {a.read() == b.read()}")
+
+        # 过滤条件和增量导出
+        video = db.export("comments", os.path.join(workdir, "video.csv"), video_id=7411856833750519091)
+        window = db.export("comments", os.path.join(workdir, "window.csv"), since="2023-11-15", until="2023-11-20")
+        first = db.export("comments", os.path.join(workdir, "new1.jsonl"), new_since="bench")
+        second = db.export("comments", os.path.join(workdir, "new2.jsonl"), new_since="bench")
+        print(f"one video: {video} rows, 5 days: {window} rows, new since mark: {first} then {second} rows")
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_archive(n_rows: int, n_videos: int, n_days: int, batches: int, fmt: str):
+    from archive import Archive
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="douyin-archive-")
+    start_day = datetime(2024, 9, 1)
+    archive = Archive(os.path.join(workdir, "archive"), fmt)
+    per_batch = max(1, n_rows // (n_days * batches * n_videos))
+    try:
+        # 同样的数据分别写成 data/{日期}/{小时} 的增量 CSV 和归档的小文件
+        written = 0
+        for day in range(n_days):
+            for batch in range(batches):
+                when = start_day + pd.Timedelta(days=day, hours=batch * 24 // batches)
+                folder = os.path.join(workdir, "data", when.strftime("%Y-%m-%d"), when.strftime("%H"))
+                os.makedirs(folder, exist_ok=True)
+                for video in range(n_videos):
+                    video_id = str(7411856833750519090 + video)
+                    rows = pd.DataFrame({
+                        "评论ID": [str(7400000000000000000 + written + i) for i in range(per_batch)],
+                        "评论内容": [make_text(rng) for _ in range(per_batch)],
+                        "评论时间": [(when - pd.Timedelta(seconds=rng.randint(0, 7200))).strftime("%Y-%m-%d %H:%M:%S")
+                                 for _ in range(per_batch)],
+                        "用户昵称": [f"用户{rng.randint(0, 10000)}" for _ in range(per_batch)],
+                    })
+                    written += per_batch
+                    path = os.path.join(folder, f"{video_id}_comments.csv")
+                    rows.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+                    archive.write("comments", video_id, rows, when=when)
+        video_id = str(7411856833750519091)
+        since = (start_day + pd.Timedelta(days=n_days - 3)).strftime("%Y-%m-%d")
+        print(f"{written} comments, {n_videos} videos, {n_days} days, {batches} batches a day ({fmt})")
+
+        def legacy():
+            # 没有归档时只能遍历所有日期和小时的文件夹，读入这个视频的每个 CSV 再过滤
+            frames = []
+            for folder, _, names in os.walk(os.path.join(workdir, "data")):
+                if f"{video_id}_comments.csv" in names:
+                    frames.append(pd.read_csv(os.path.join(folder, f"{video_id}_comments.csv"), dtype=str))
+            frame = pd.concat(frames, ignore_index=True)
+            return frame[frame["评论时间"] >= since]
+
+        def measure(name, fn, files):
+            start = time.perf_counter()
+            frame = fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>26}: {elapsed * 1000:9.1f} ms, {len(frame):6d} rows, {files:6d} files")
+            return set(frame["评论ID"])
+
+        csv_files = sum(len(names) for _, _, names in os.walk(os.path.join(workdir, "data")))
+        print("one video, last 3 days:")
+        results = [measure("hourly csv", legacy, csv_files),
+                   measure("archive before compaction", lambda: archive.read("comments", video_id, since=since),
+                           archive.stats()["comments"]["files"])]
+        start = time.perf_counter()
+        compacted = archive.compact(include_today=True)
+        print(f"compaction: {compacted} in {time.perf_counter() - start:.2f} s")
+        results.append(measure("archive after compaction", lambda: archive.read("comments", video_id, since=since),
+                               archive.stats()["comments"]["files"]))
+        measure("full scan after compaction", lambda: archive.read("comments"), archive.stats()["comments"]["files"])
+        print(f"same rows: {results[0] == results[1] == results[2]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_lookup(n_comments: int, n_replies: int, n_ids: int):
+    from db import INDEXES, crdb
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="douyin-lookup-")
+    db_path = os.path.join(workdir, "comments_replies.db")
+    try:
+        db = crdb(db_path, search_index=False)
+        comment_ids = [str(7400000000000000000 + i) for i in range(n_comments)]
+        reply_ids = [str(7500000000000000000 + i) for i in range(n_replies)]
+        for i in range(0, n_comments, 50000):
+            db.insert_rows("comments", pd.DataFrame({
+                "评论ID": comment_ids[i:i + 50000], "评论内容": [make_text(rng) for _ in comment_ids[i:i + 50000]],
+                "评论时间": "2024-09-01 00:00:00", "用户昵称": "user",
+                "视频ID": [str(7411856833750519090 + rng.randint(0, 99)) for _ in comment_ids[i:i + 50000]]}))
+        for i in range(0, n_replies, 50000):
+            chunk = reply_ids[i:i + 50000]
+            db.insert_rows("replies", pd.DataFrame({
+                "评论ID": chunk, "评论内容": [make_text(rng) for _ in chunk], "评论时间": "2024-09-01 00:00:00",
+                "用户昵称": "user", "回复的评论": [rng.choice(comment_ids) for _ in chunk],
+                "视频ID": "7411856833750519090"}))
+        # 评论、回复和不存在的ID混在一起，和审核时的输入类似
+        ids = ([rng.choice(comment_ids) for _ in range(n_ids * 2 // 5)] +
+               [rng.choice(reply_ids) for _ in range(n_ids * 2 // 5)] +
+               [str(7600000000000000000 + i) for i in range(n_ids - n_ids * 4 // 5)])
+        rng.shuffle(ids)
+        print(f"{n_comments} comments, {n_replies} replies, {len(ids)} ids")
+
+        def measure(name, fn):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>28}: {len(ids) / elapsed:10.0f} lookups/s")
+            return result
+
+        single = measure("single id", lambda: {i: db.get_comment_content(i) for i in ids})
+        batch = measure("batch", lambda: db.get_comment_contents(ids))
+        db.close()
+        cached = crdb(db_path, search_index=False, lookup_cache=len(ids))
+        measure("batch, cold cache", lambda: cached.get_comment_contents(ids))
+        warm = measure("batch, warm cache", lambda: cached.get_comment_contents(ids))
+        measure("single id, warm cache", lambda: {i: cached.get_comment_content(i) for i in ids})
+        cached.close()
+        single = {i: content for i, content in single.items() if content is not None}
+        print(f"same results: {single == batch == warm}")
+
+        # 二级索引：按视频和按被回复的评论查询
+        db = crdb(db_path, search_index=False)
+        parents = rng.sample(comment_ids, 200)
+        videos = [str(7411856833750519090 + v) for v in range(20)]
+        for label in ("with indexes", "without indexes"):
+            start = time.perf_counter()
+            replies = db.get_replies(parents)
+            by_parent = time.perf_counter() - start
+            start = time.perf_counter()
+            for video in videos:
+                db.conn.execute("SELECT COUNT(*), MAX(评论时间) FROM comments WHERE 视频ID=?", (video,)).fetchone()
+            by_video = (time.perf_counter() - start) / len(videos)
+            print(f"{label:>16}: replies of {len(parents)} comments ({len(replies)} rows) in "
+                  f"{by_parent * 1000:7.1f} ms, one video's comments in {by_video * 1000:7.2f} ms")
+            for name in INDEXES:
+                db.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("sign", help="签名吞吐：python 与 node 进程池")
+    p.add_argument("-n", type=int, default=2000)
+    p = sub.add_parser("replies", help="process_replies：索引与逐条扫描对比")
+    p.add_argument("--comments", type=int, default=2000)
+    p.add_argument("--replies", type=int, default=10000)
+    p = sub.add_parser("normalize", help="process_comments：列式整理与逐条构造对比")
+    p.add_argument("--comments", type=int, default=50000)
+    p = sub.add_parser("offload", help="签名和解码：事件循环中执行与进程池对比")
+    p.add_argument("-n", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--workers", type=int, default=0, help="进程数，0 表示 CPU 核数")
+    p.add_argument("--batch", type=int, default=32)
+    p = sub.add_parser("search", help="全文搜索：FTS5 索引与 LIKE 扫描对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=100)
+    p = sub.add_parser("badwords", help="坏评论匹配：Aho-Corasick 与逐个关键词查找对比，以及增量扫描的吞吐")
+    p.add_argument("--comments", type=int, default=200000)
+    p.add_argument("--keywords", type=int, default=1000)
+    p = sub.add_parser("export", help="流式导出：分块写入与 fetchall 后整体写出对比")
+    p.add_argument("--rows", type=int, default=500000)
+    p = sub.add_parser("archive", help="列式归档：按视频和时间读取，与遍历增量 CSV 对比，以及合并前后")
+    p.add_argument("--rows", type=int, default=300000)
+    p.add_argument("--videos", type=int, default=20)
+    p.add_argument("--days", type=int, default=14)
+    p.add_argument("--batches", type=int, default=24, help="每天每个视频写入的批次数")
+    p.add_argument("--format", default="parquet", choices=("parquet", "arrow"))
+    p = sub.add_parser("lookup", help="按评论ID查询：逐个查询与批量查询、LRU 缓存，以及二级索引")
+    p.add_argument("--comments", type=int, default=200000)
+    p.add_argument("--replies", type=int, default=400000)
+    p.add_argument("--ids", type=int, default=20000)
+    p = sub.add_parser("e2e", help="本地模拟服务器上的端到端吞吐")
+    p.add_argument("--videos", type=int, default=4, help="视频数（creator 模式下为作者数，每人取一个视频）")
+    p.add_argument("--creator", action="store_true", help="按作者抓取，同时压测视频列表接口")
+    p.add_argument("--comments", type=int, default=2000, help="每个视频的评论数")
+    p.add_argument("--replies", type=float, default=5, help="每条评论平均的回复数")
+    p.add_argument("--latency", type=float, default=0.02, help="模拟服务器的平均延迟（秒）")
+    p.add_argument("--throttle", type=float, default=0.0, help="随机限流响应的比例")
+    p.add_argument("--error", type=float, default=0.0, help="随机 5xx 的比例")
+    p.add_argument("--max-rps", type=float, default=0, help="模拟服务器的限速，0 表示不限")
+    p.add_argument("--accounts", type=int, default=2)
+    p.add_argument("--rate", type=float, default=200.0, help="每个令牌桶的初始速率")
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--per-video", type=int, default=4)
+    p.add_argument("--parallel-videos", type=int, default=8)
+    p.add_argument("--connections", type=int, default=20)
+    p.add_argument("--sign-backend", default="python", choices=("pool", "python", "execjs"))
+    p.add_argument("--sign-workers", type=int, default=2)
+    p.add_argument("--offload", default="inline", choices=("inline", "process"))
+    p.add_argument("--offload-workers", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "sign":
+        bench_sign(args.n)
+    elif args.command == "replies":
+        bench_replies(args.comments, args.replies)
+    elif args.command == "normalize":
+        bench_normalize(args.comments)
+    elif args.command == "offload":
+        bench_offload(args.n, args.concurrency, args.workers, args.batch)
+    elif args.command == "search":
+        bench_search(args.rows, args.repeat, args.limit)
+    elif args.command == "badwords":
+        bench_badwords(args.comments, args.keywords)
+    elif args.command == "export":
+        bench_export(args.rows)
+    elif args.command == "archive":
+        bench_archive(args.rows, args.videos, args.days, args.batches, args.format)
+    elif args.command == "lookup":
+        bench_lookup(args.comments, args.replies, args.ids)
+    elif args.command == "e2e":
+        bench_e2e(args)
+
+
+if __name__ == "__main__":
+    main()
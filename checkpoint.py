@@ -0,0 +1,104 @@
+import sqlite3
+
+
+def create_tables(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS comment_checkpoints (
+        aweme_id TEXT PRIMARY KEY,
+        cursor INTEGER,
+        done INTEGER,
+        updated_at INTEGER DEFAULT (strftime('%s', 'now'))
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reply_checkpoints (
+        aweme_id TEXT,
+        cid TEXT,
+        cursor INTEGER,
+        done INTEGER,
+        reply_total INTEGER,
+        nickname TEXT,
+        PRIMARY KEY (aweme_id, cid)
+    )
+    ''')
+
+
+def comment_record(aweme_id, cursor: int, done: bool) -> tuple:
+    """评论翻页位置：下一页的 cursor，以及评论是否已经翻完"""
+    return ("comments", str(aweme_id), int(cursor or 0), int(bool(done)))
+
+
+def reply_record(aweme_id, cid: str, cursor: int, done: bool, reply_total: int, nickname: str) -> tuple:
+    """一条评论的回复翻页位置，reply_total 和 nickname 用于恢复时重新创建回复任务"""
+    return ("replies", str(aweme_id), str(cid), int(cursor or 0), int(bool(done)), reply_total, nickname)
+
+
+def write(conn: sqlite3.Connection, records: list[tuple]):
+    """
+    写入检查点。由写数据库的线程在对应的数据提交之后调用，
+    所以检查点永远不会比已经落盘的数据更靠前
+    """
+    comments = [record[1:] for record in records if record[0] == "comments"]
+    replies = [record[1:] for record in records if record[0] == "replies"]
+    with conn:
+        conn.executemany(
+            "INSERT INTO comment_checkpoints (aweme_id, cursor, done) VALUES (?,?,?) "
+            "ON CONFLICT(aweme_id) DO UPDATE SET cursor=excluded.cursor, done=excluded.done, "
+            "updated_at=strftime('%s', 'now')",
+            comments,
+        )
+        conn.executemany(
+            "INSERT INTO reply_checkpoints (aweme_id, cid, cursor, done, reply_total, nickname) VALUES (?,?,?,?,?,?) "
+            "ON CONFLICT(aweme_id, cid) DO UPDATE SET cursor=excluded.cursor, done=excluded.done",
+            replies,
+        )
+
+
+class VideoCheckpoint:
+    """
+    单个视频中断时的进度：评论翻到的 cursor，以及还没翻完回复的评论
+    """
+
+    def __init__(self, aweme_id, cursor: int = 0, done: bool = False, threads: dict = None):
+        self.aweme_id = str(aweme_id)
+        self.cursor = cursor
+        self.done = done
+        # cid -> (cursor, reply_total, nickname)
+        self.threads: dict[str, tuple[int, int, str]] = threads or {}
+
+
+class CheckpointStore:
+    """
+    断点续爬：评论和回复的翻页位置保存在 comments_replies.db 中，随数据一起由 DatabaseSink 写入。
+    视频抓完后清除检查点，中途退出时下次运行从检查点继续，不会重新请求已经保存的页
+    """
+
+    def __init__(self, db_path: str = "comments_replies.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path)
+        self.cursor = self.conn.cursor()
+        create_tables(self.conn)
+        self.conn.commit()
+
+    def load(self, aweme_id) -> VideoCheckpoint:
+        """没有检查点时返回 None"""
+        aweme_id = str(aweme_id)
+        self.cursor.execute("SELECT cursor, done FROM comment_checkpoints WHERE aweme_id=?", (aweme_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        self.cursor.execute(
+            "SELECT cid, cursor, reply_total, nickname FROM reply_checkpoints WHERE aweme_id=? AND done=0",
+            (aweme_id,),
+        )
+        threads = {cid: (cursor, total, nickname) for cid, cursor, total, nickname in self.cursor.fetchall()}
+        return VideoCheckpoint(aweme_id, row[0], bool(row[1]), threads)
+
+    def clear(self, aweme_id):
+        aweme_id = str(aweme_id)
+        with self.conn:
+            self.conn.execute("DELETE FROM comment_checkpoints WHERE aweme_id=?", (aweme_id,))
+            self.conn.execute("DELETE FROM reply_checkpoints WHERE aweme_id=?", (aweme_id,))
+
+    def close(self):
+        self.conn.close()
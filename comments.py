@@ -1,15 +1,20 @@
 from db import *
+import argparse
+import export
+import logging
 import os
 import sqlite3
-import pandas as pd
+import time
+from datetime import datetime
 from main import setup_logging
+from matcher import RuleSet
 from config import logs_dir
 
 
 class BadComment:
-    def __init__(self):
+    def __init__(self, db_path: str = "bad_comments.db"):
         # Database connection
-        self.db_path = "bad_comments.db"  # SQLite database file
+        self.db_path = db_path  # SQLite database file
         self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()  # Store cursor for later use
 
@@ -20,23 +25,88 @@ class BadComment:
             评论内容 TEXT
         )
         ''')
-    
+        # Columns added for automatic flagging; databases created by older versions get them on first open
+        existing = {row[1] for row in self.cursor.execute("PRAGMA table_info(comments)")}
+        for column in ("视频ID", "来源", "命中规则", "标记时间"):
+            if column not in existing:
+                self.cursor.execute(f"ALTER TABLE comments ADD COLUMN {column} TEXT")
+        # High-water mark of the scan: the last rowid of each crdb table that has been checked
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_state (
+            table_name TEXT PRIMARY KEY,
+            last_rowid INTEGER
+        )
+        ''')
+        self.conn.commit()
+
     def add_comment(self, comment_id, comment_content):
         # Insert comment into database
-        self.cursor.execute("INSERT INTO comments (评论ID, 评论内容) VALUES (?,?)", (comment_id, comment_content))
+        self.cursor.execute("INSERT INTO comments (评论ID, 评论内容, 来源, 标记时间) VALUES (?,?,?,?)",
+                            (comment_id, comment_content, "manual", datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
         self.conn.commit()
-    
-    # 导出所有数据到csv文件
-    def data_to_csv(self):
-        # Get all comments from database
-        self.cursor.execute("SELECT * FROM comments")
-        comments = self.cursor.fetchall()
 
-        # Convert comments to pandas dataframe
-        df = pd.DataFrame(comments, columns=['评论ID', '评论内容'])
+    def add_comments(self, rows: list[tuple], marks: dict[str, int] = None) -> int:
+        """
+        Insert many flagged comments (评论ID, 评论内容, 视频ID, 来源, 命中规则) in one transaction, together with the
+        new high-water marks so a crash can never lose or repeat part of a batch. Returns the number of new rows.
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT INTO comments (评论ID, 评论内容, 视频ID, 来源, 命中规则, 标记时间) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT(评论ID) DO NOTHING", [row + (now,) for row in rows])
+            added = self.conn.total_changes - before
+            self.conn.executemany(
+                "INSERT INTO scan_state (table_name, last_rowid) VALUES (?,?) "
+                "ON CONFLICT(table_name) DO UPDATE SET last_rowid=excluded.last_rowid",
+                list((marks or {}).items()))
+        return added
 
-        # Export dataframe to csv file
-        df.to_csv('bad_comments.csv', index=False)
+    def high_water_mark(self, table_name: str) -> int:
+        row = self.conn.execute("SELECT last_rowid FROM scan_state WHERE table_name=?", (table_name,)).fetchone()
+        return row[0] if row else 0
+
+    def scan(self, rules: RuleSet, source: str = "comments_replies.db", batch_size: int = 5000,
+             rescan: bool = False) -> dict:
+        """
+        Check the rows of crdb that arrived since the last scan against rules and store the matches.
+        rescan starts again from the first row. Returns counts and the throughput in comments per second.
+        """
+        reader = sqlite3.connect(source)
+        scanned = flagged = 0
+        start = time.perf_counter()
+        try:
+            for table_name in COLUMNS:
+                last_rowid = 0 if rescan else self.high_water_mark(table_name)
+                while True:
+                    rows = reader.execute(
+                        f"SELECT rowid, 评论ID, 评论内容, 视频ID FROM {table_name} "
+                        f"WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)).fetchall()
+                    if not rows:
+                        break
+                    hits = []
+                    for _, comment_id, content, video_id in rows:
+                        matched = rules.match(content)
+                        if matched:
+                            hits.append((comment_id, content, video_id, table_name, ", ".join(matched)))
+                    last_rowid = rows[-1][0]
+                    flagged += self.add_comments(hits, {table_name: last_rowid})
+                    scanned += len(rows)
+        finally:
+            reader.close()
+        elapsed = time.perf_counter() - start
+        result = {"scanned": scanned, "flagged": flagged, "elapsed_s": round(elapsed, 3),
+                  "comments_per_s": round(scanned / elapsed, 1) if elapsed else 0.0}
+        logging.info(f"Bad comment scan: {result}")
+        return result
+
+    # 导出数据到csv文件（也支持 .csv.gz、.jsonl），分块流式写入
+    def data_to_csv(self, path: str = "bad_comments.csv", video_id=None, since=None, until=None,
+                    new_since: str = None, chunksize: int = 10000) -> int:
+        """since/until filter 标记时间; new_since exports only comments flagged after the last export of that name"""
+        return export.export_table(self.conn, "comments", path, video_id=video_id, since=since, until=until,
+                                   time_column="标记时间", new_since=new_since, chunk_size=chunksize)
 
     def close(self):
         # Close database connection
@@ -44,16 +114,36 @@ class BadComment:
 
 
 if __name__ == '__main__':
-    # Test code
+    parser = argparse.ArgumentParser(description="标记坏评论：不带参数时逐条输入评论ID手动标记，scan 按规则自动扫描新评论")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("scan", help="用规则文件扫描数据库中新增的评论和回复")
+    p.add_argument("--rules", default=None, help="规则文件，默认使用 config.py 中的 bad_rules")
+    p.add_argument("--batch", type=int, default=5000)
+    p.add_argument("--rescan", action="store_true", help="从头重新扫描所有评论")
+    args = parser.parse_args()
+
     setup_logging(logs_dir)
     bc = BadComment()
-    cr = crdb()
     try:
-        while True:
-            comment_id = input("请输入评论ID：")
-            comment_content = cr.get_comment_content(comment_id)
-            bc.add_comment(comment_id, comment_content)
-        bc.close()
-        cr.close()
+        if args.command == "scan":
+            import config
+            rules_path = args.rules or getattr(config, "bad_rules", "bad_rules.txt")
+            if not os.path.exists(rules_path):
+                raise FileNotFoundError(f"Rule file {rules_path} does not exist")
+            rules = RuleSet.load(rules_path)
+            logging.info(f"Loaded {len(rules)} rules from {rules_path}.")
+            bc.scan(rules, batch_size=args.batch, rescan=args.rescan)
+        else:
+            # Test code
+            cr = crdb()
+            try:
+                while True:
+                    comment_id = input("请输入评论ID：")
+                    comment_content = cr.get_comment_content(comment_id)
+                    bc.add_comment(comment_id, comment_content)
+            finally:
+                cr.close()
     except Exception as e:
-        logging.error(e)
\ No newline at end of file
+        logging.error(e)
+    finally:
+        bc.close()
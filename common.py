@@ -1,9 +1,13 @@
 import requests
-import execjs
 import urllib.parse
 import re
 import random
 import json
+import time
+import asyncio
+import httpx
+import signer
+from metrics import STAGES
 
 HOST = 'https://www.douyin.com'
 
@@ -57,20 +61,34 @@ COMMON_HEADERS = {
     "dnt": "1",
 }
 
-DOUYIN_SIGN = execjs.compile(open('douyin.js', encoding='utf-8').read())
+WEBID_PATTERN = re.compile(r'\\"user_unique_id\\":\\"(\d+)\\"')
 
 
 def get_webid(headers: dict):
     url = 'https://www.douyin.com/?recommend=1'
     # print(f'url: {url}, request {url}, headers={headers}')
-    headers['sec-fetch-dest'] = 'document'
+    headers = dict(headers, **{'sec-fetch-dest': 'document'})
     response = requests.get(url, headers=headers)
     # print(f'url: {url}, response, code: {response.status_code}')
-    if response.status_code != 200 or response.text == '':
+    return parse_webid(response.status_code, response.text)
+
+
+async def get_webid_async(headers: dict, client: httpx.AsyncClient = None):
+    url = 'https://www.douyin.com/?recommend=1'
+    headers = dict(headers, **{'sec-fetch-dest': 'document'})
+    if client is None:
+        async with httpx.AsyncClient(timeout=60) as client:
+            response = await client.get(url, headers=headers)
+    else:
+        response = await client.get(url, headers=headers)
+    return parse_webid(response.status_code, response.text)
+
+
+def parse_webid(status_code: int, text: str):
+    if status_code != 200 or text == '':
         # print(f'failed get webid, url: {url}, header: {headers}')
         return None
-    pattern = r'\\"user_unique_id\\":\\"(\d+)\\"'
-    match = re.search(pattern, response.text)
+    match = WEBID_PATTERN.search(text)
     if match:
         return match.group(1)
     return None
@@ -87,42 +105,124 @@ def cookies_to_dict(cookie_string) -> dict:
     return cookie_dict
 
 
-def deal_params(params: dict, headers: dict) -> str:
+class DeviceProfile:
+    """
+    由 cookie 推导出的设备参数，以及从首页解析出的 webid
+    """
+
+    def __init__(self, cookie: str, webid: str = None, ttl: float = 3600):
+        cookie_dict = cookies_to_dict(cookie)
+        self.cookie = cookie
+        self.params = {
+            'screen_width': cookie_dict.get('dy_swidth', 2560),
+            'screen_height': cookie_dict.get('dy_sheight', 1440),
+            'cpu_core_num': cookie_dict.get('device_web_cpu_core', 24),
+            'device_memory': cookie_dict.get('device_web_memory_size', 8),
+            'verifyFp': cookie_dict.get('s_v_web_id', None),
+            'fp': cookie_dict.get('s_v_web_id', None),
+            'webid': webid,
+        }
+        # 没拿到 webid 时只缓存一分钟，尽快重试
+        self.expires_at = time.monotonic() + (ttl if webid else min(ttl, 60))
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def apply(self, params: dict) -> dict:
+        params['msToken'] = get_ms_token()
+        params.update(self.params)
+        return params
+
+
+class DeviceProfileCache:
+    """
+    按 cookie 缓存 DeviceProfile，所有并发的抓取任务共享；
+    同一个 cookie 同时只会有一个任务去请求首页
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._profiles: dict[str, DeviceProfile] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _headers(self, cookie: str) -> dict:
+        return dict(COMMON_HEADERS, cookie=cookie)
+
+    def get_sync(self, cookie: str) -> DeviceProfile:
+        profile = self._profiles.get(cookie)
+        if profile is None or profile.expired:
+            profile = DeviceProfile(cookie, get_webid(self._headers(cookie)), self.ttl)
+            self._profiles[cookie] = profile
+        return profile
+
+    async def get(self, cookie: str, client: httpx.AsyncClient = None) -> DeviceProfile:
+        profile = self._profiles.get(cookie)
+        if profile is not None and not profile.expired:
+            return profile
+        lock = self._locks.setdefault(cookie, asyncio.Lock())
+        async with lock:
+            profile = self._profiles.get(cookie)
+            if profile is None or profile.expired:
+                webid = await get_webid_async(self._headers(cookie), client)
+                profile = DeviceProfile(cookie, webid, self.ttl)
+                self._profiles[cookie] = profile
+        return profile
+
+    def invalidate(self, cookie: str):
+        # 服务端拒绝请求时调用，下次请求会重新获取 webid
+        self._profiles.pop(cookie, None)
+
+
+PROFILES = DeviceProfileCache()
+
+
+def deal_params(params: dict, headers: dict, profile: DeviceProfile = None) -> dict:
     cookie = headers.get('cookie') or headers.get('Cookie')
     if not cookie:
         return params
-    cookie_dict = cookies_to_dict(cookie)
-    params['msToken'] = get_ms_token()
-    params['screen_width'] = cookie_dict.get('dy_swidth', 2560)
-    params['screen_height'] = cookie_dict.get('dy_sheight', 1440)
-    params['cpu_core_num'] = cookie_dict.get('device_web_cpu_core', 24)
-    params['device_memory'] = cookie_dict.get('device_web_memory_size', 8)
-    params['verifyFp'] = cookie_dict.get('s_v_web_id', None)
-    params['fp'] = cookie_dict.get('s_v_web_id', None)
-    params['webid'] = get_webid(headers)
-    return params
+    if profile is None:
+        profile = PROFILES.get_sync(cookie)
+    return profile.apply(params)
 
 
 def get_ms_token(randomlength=120):
     """
     根据传入长度产生随机字符串
     """
-    random_str = ''
     base_str = 'ABCDEFGHIGKLMNOPQRSTUVWXYZabcdefghigklmnopqrstuvwxyz0123456789='
-    length = len(base_str) - 1
-    for _ in range(randomlength):
-        random_str += base_str[random.randint(0, length)]
-    return random_str
+    # 一次生成，不再逐个字符拼接
+    return ''.join(random.choices(base_str, k=randomlength))
 
 
-def common(uri, params: dict, headers: dict) -> tuple[dict, dict]:
+def prepare(uri, params: dict, headers: dict, profile: DeviceProfile = None) -> tuple[dict, dict, str, str]:
+    """
+    补全公共参数，返回待签名的 query 和对应的签名函数名
+    """
     params.update(COMMON_PARAMS)
     headers.update(COMMON_HEADERS)
-    params = deal_params(params, headers)
+    params = deal_params(params, headers, profile)
     query = '&'.join([f'{k}={urllib.parse.quote(str(v))}' for k, v in params.items()])
     call_name = 'sign_datail'
     if 'reply' in uri:
         call_name = 'sign_reply'
-    a_bogus = DOUYIN_SIGN.call(call_name, query, headers["User-Agent"])
+    return params, headers, call_name, query
+
+
+def common(uri, params: dict, headers: dict) -> tuple[dict, dict]:
+    with STAGES.time("sign"):
+        params, headers, call_name, query = prepare(uri, params, headers)
+        a_bogus = signer.get_signer().sign(call_name, query, headers["User-Agent"])
+    params["a_bogus"] = a_bogus
+    return params, headers
+
+
+async def common_async(uri, params: dict, headers: dict, client: httpx.AsyncClient = None) -> tuple[dict, dict]:
+    # 异步版本，设备参数从缓存中取，签名在常驻进程中完成，不阻塞事件循环
+    cookie = headers.get('cookie') or headers.get('Cookie')
+    profile = await PROFILES.get(cookie, client) if cookie else None
+    with STAGES.time("sign"):
+        params, headers, call_name, query = prepare(uri, params, headers, profile)
+        a_bogus, = await signer.get_signer().sign_many([(call_name, query, headers["User-Agent"])])
     params["a_bogus"] = a_bogus
     return params, headers
@@ -2,6 +2,10 @@
 
 # cookie
 cookie = ''
+# more accounts: when not empty, requests are spread over these cookies instead of `cookie`
+cookies = [
+    # '',
+]
 
 # directory where logs will be saved
 logs_dir = "logs"
@@ -17,6 +21,8 @@ creator_ids = [
 ]
 # number of videos to fetch for each creator
 count = 2
+# keep each creator's video list in the database; later runs only page until an already known video
+creator_cache = True
 
 # by detail: aweme_id: str
 # aweme IDs to fetch details for specific videos
@@ -24,3 +30,78 @@ aweme_ids = [
     7411856833750519090,  # Example: Aweme ID for 哈工大军训又上新了
     # ......,               # Add more aweme IDs as needed
 ]
+
+# signing backend: "pool" keeps long-lived node processes, "python" signs in-process without node,
+# "execjs" starts node for every call
+sign_backend = "pool"  # Options: "pool", "python", "execjs"
+# number of node processes in the signing pool
+sign_workers = 2
+
+# where request preparation/signing and response decoding run: "inline" (on the event loop) or
+# "process" (a pool of offload_workers processes, 0 = one per CPU core, fed in batches of up to offload_batch)
+offload = "inline"
+offload_workers = 0
+offload_batch = 32
+
+# connection pool shared by the whole crawl run
+http2 = True  # requires `pip install httpx[http2]`, falls back to HTTP/1.1 otherwise
+max_connections = 20
+max_keepalive_connections = 10
+keepalive_expiry = 60  # seconds an idle connection is kept open
+
+# concurrency: requests in flight across all videos, per video, and videos crawled at once
+max_concurrency = 10
+per_video_concurrency = 4
+max_parallel_videos = 8
+
+# adaptive rate limit (token bucket, requests per second), slows down when throttled and speeds up again on success
+rate_limit_per = "both"  # Options: "endpoint", "cookie", "both"
+rate_limit = 3.0
+rate_limit_burst = 3.0
+rate_limit_min = 0.2
+rate_limit_max = 20.0
+
+# incremental mode: only page until already-seen comments and skip reply threads whose reply count is unchanged
+incremental = False
+
+# results are written straight into comments_replies.db; new rows are also appended to data/{date}/{hour}/*.csv
+incremental_csv = True
+# also export every video's comments/replies to data/{aweme_id}_comments/replies.csv after the run
+export_csv = False
+# format of that export: csv, csv.gz (gzip) or jsonl (JSON Lines); rows are streamed, memory use stays flat
+export_format = "csv"
+# also archive new rows as Parquet or Arrow files partitioned by date and video (needs pyarrow), None to disable;
+# python archive.py compact merges each day's small files, see README
+archive_format = None  # Options: None, "parquet", "arrow"
+archive_dir = "archive"
+# save comment/reply cursors with the data so an interrupted crawl resumes where it stopped
+checkpoint = True
+
+# retries: bounded retries with jittered exponential backoff; a circuit breaker pauses an endpoint after repeated failures
+retry_max = 3
+retry_base_delay = 0.5  # seconds, doubled on every retry
+retry_max_delay = 30.0
+breaker_failures = 5    # consecutive failures before an endpoint is paused
+breaker_reset = 30.0    # seconds an endpoint stays paused before a trial request
+
+# metrics: serve Prometheus text at http://127.0.0.1:{metrics_port}/metrics (0 disables it, e.g. 9108)
+metrics_port = 0
+# append a JSON summary of every run to {logs_dir}/run_summary.jsonl
+metrics_summary = True
+
+# adaptive scheduler (schedule.py): every video is recrawled at an interval derived from its comment arrival rate
+schedule_target_new = 50         # aim for about this many new comments/replies per recrawl
+schedule_min_interval = 600      # seconds
+schedule_max_interval = 86400    # seconds, videos without new comments back off up to this interval
+schedule_creator_refresh = 21600 # seconds between re-listing the creators' videos
+
+# distributed mode (distributed.py): a coordinator queues work, any number of workers lease and run it
+queue_db = "work_queue.db"  # SQLite queue of the machine that holds the database; never on a network filesystem
+queue_lease_time = 120      # seconds before an unfinished work item is handed to another worker
+queue_max_attempts = 5      # work items that fail this many times are marked failed
+worker_concurrency = 4      # work items processed at the same time by one worker
+queue_url = None            # e.g. "http://192.168.1.10:8766": use the queue of `distributed.py serve` on another machine
+queue_token = ""            # shared secret checked by `distributed.py serve`, set the same value on every machine
+
+# bad comment rules for `python comments.py scan`: one keyword per line, "re:" prefix for a regex, "#" for comments
+bad_rules = "bad_rules.txt"
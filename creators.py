@@ -0,0 +1,58 @@
+"""
+作者视频列表的缓存：每个作者抓到过的视频（aweme_id、desc、create_time、nickname）保存在数据库中，
+之后只需要从最新的一页翻到已知的视频为止，通常每个作者每次运行只要一个请求
+"""
+import sqlite3
+import time
+
+
+class CreatorVideoStore:
+    def __init__(self, db_path: str = "comments_replies.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS creator_videos (
+            creator_id TEXT,
+            aweme_id TEXT,
+            description TEXT,
+            create_time INTEGER,
+            nickname TEXT,
+            first_seen INTEGER,
+            PRIMARY KEY (creator_id, aweme_id)
+        )
+        ''')
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_creator_videos_time ON creator_videos (creator_id, create_time)")
+        self.conn.commit()
+
+    def known_ids(self, creator_id: str) -> set[str]:
+        rows = self.conn.execute("SELECT aweme_id FROM creator_videos WHERE creator_id=?", (creator_id,))
+        return {row[0] for row in rows}
+
+    def add(self, creator_id: str, videos: list[dict]) -> int:
+        """保存视频信息（已有的更新 desc 和 nickname），返回新视频的数量"""
+        now = int(time.time())
+        with self.conn:
+            before = self.conn.execute("SELECT COUNT(*) FROM creator_videos WHERE creator_id=?",
+                                       (creator_id,)).fetchone()[0]
+            self.conn.executemany(
+                "INSERT INTO creator_videos (creator_id, aweme_id, description, create_time, nickname, first_seen) "
+                "VALUES (?,?,?,?,?,?) ON CONFLICT(creator_id, aweme_id) DO UPDATE SET "
+                "description=excluded.description, nickname=excluded.nickname",
+                [(creator_id, str(video["aweme_id"]), video.get("desc"), video.get("create_time"),
+                  video.get("nickname"), now) for video in videos],
+            )
+            after = self.conn.execute("SELECT COUNT(*) FROM creator_videos WHERE creator_id=?",
+                                      (creator_id,)).fetchone()[0]
+        return after - before
+
+    def videos(self, creator_id: str, count: int) -> list[dict]:
+        """最新的 count 个视频，格式与 get_creator_awesome_id 的返回值一致"""
+        rows = self.conn.execute(
+            "SELECT aweme_id, description, create_time, nickname FROM creator_videos WHERE creator_id=? "
+            "ORDER BY create_time DESC LIMIT ?", (creator_id, count)).fetchall()
+        return [{"aweme_id": aweme_id, "desc": desc, "create_time": create_time, "nickname": nickname}
+                for aweme_id, desc, create_time, nickname in rows]
+
+    def close(self):
+        self.conn.close()
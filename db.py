@@ -1,16 +1,67 @@
 import os
 import sqlite3
 import logging
+from collections import OrderedDict
 import pandas as pd
 from datetime import datetime
+import export
+from metrics import DB_BATCH, DB_ROWS
+
+# Columns of each table, in insert order
+COLUMNS = {
+    "comments": ["评论ID", "评论内容", "评论时间", "用户昵称", "视频ID"],
+    "replies": ["评论ID", "评论内容", "评论时间", "用户昵称", "回复的评论", "具体的回复对象", "回复给谁", "视频ID"],
+}
+
+# Columns covered by the full-text index of each table
+SEARCH_COLUMNS = ["评论内容", "用户昵称"]
+
+# Secondary indexes: rows of a video (exports, searches, scheduler) and the replies of a comment
+INDEXES = {
+    "idx_comments_video": "comments (视频ID)",
+    "idx_replies_video": "replies (视频ID)",
+    "idx_replies_parent": "replies (回复的评论)",
+}
+
+
+class LRUCache:
+    """Bounded least-recently-used mapping"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
 
 class crdb:
-    def __init__(self):
+    def __init__(self, db_path: str = "comments_replies.db", search_index: bool = True, lookup_cache: int = 0):
         # Database connection
-        self.db_path = "comments_replies.db"  # SQLite database file
+        self.db_path = db_path  # SQLite database file
         self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()  # Store cursor for later use
 
+        # WAL lets readers work while a batch is being written; NORMAL sync is safe with WAL
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute("PRAGMA temp_store=MEMORY")
+        self.cursor.execute("PRAGMA cache_size=-65536")  # 64 MB
+
         # Create tables if they don't exist
         self.cursor.execute('''
         CREATE TABLE IF NOT EXISTS comments (
@@ -35,6 +86,52 @@ class crdb:
         )
         ''')
 
+        for name, target in INDEXES.items():
+            if not self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,)).fetchone():
+                logging.info(f"Creating index {name} on {target}.")
+                self.cursor.execute(f"CREATE INDEX {name} ON {target}")
+        self.conn.commit()
+
+        self.search_index = search_index and self._create_search_index()
+        # 评论ID -> (评论内容, 视频ID)；行写入后不会再改变，缓存不会过期
+        self.lookup_cache = LRUCache(lookup_cache) if lookup_cache else None
+
+    def _create_search_index(self) -> bool:
+        """
+        FTS5 index with the trigram tokenizer (works for Chinese without word segmentation) over 评论内容 and 用户昵称.
+        It is an external-content index kept in sync by triggers, so rows inserted through any path are searchable.
+        Returns False when this SQLite build lacks FTS5/trigram (3.34+ is needed); search() then falls back to LIKE.
+        """
+        columns = ", ".join(SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+        for table_name in COLUMNS:
+            fts = f"{table_name}_fts"
+            exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name=?", (fts,)).fetchone()
+            try:
+                self.cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, "
+                    f"content='{table_name}', content_rowid='rowid', tokenize='trigram')")
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Full-text search is unavailable ({e}), searches will scan the tables.")
+                return False
+            self.cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_insert AFTER INSERT ON {table_name} BEGIN "
+                f"INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {new_values}); END")
+            self.cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_delete AFTER DELETE ON {table_name} BEGIN "
+                f"INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END")
+            self.cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table_name}_fts_update AFTER UPDATE ON {table_name} BEGIN "
+                f"INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); "
+                f"INSERT INTO {fts} (rowid, {columns}) VALUES (new.rowid, {new_values}); END")
+            if not exists:
+                # Index the rows stored before the index existed
+                logging.info(f"Building the full-text index of {table_name}.")
+                with self.conn:
+                    self.conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        return True
+
     # Function to process CSV files and handle errors
     def process_csv(self, file_path, table_name, video_id):
         try:
@@ -50,44 +147,62 @@ class crdb:
             if data[column].dtype == object:  # Only apply to text fields
                 data[column] = data[column].str.replace(r'\n|\r', ' ', regex=True)
         
-        # List to store successful entries
-        successful_entries = []
+        # Insert the whole file at once, duplicates are skipped by the database
+        new_ids = self.insert_rows(table_name, data)
+        logging.info(f"Inserted {len(new_ids)} new rows into {table_name}, skipped {len(data) - len(new_ids)} duplicates.")
 
-        # Try inserting row by row to handle duplicates
-        for index, row in data.iterrows():
-            try:
-                row.to_frame().T.to_sql(table_name, self.conn, if_exists='append', index=False)
-                successful_entries.append(row)
-            except sqlite3.IntegrityError as e:
-                # Handle duplicate entry (Primary key violation) and skip
-                logging.warning(f"Skipping duplicate 评论ID {row['评论ID']} in {table_name}: {e}")
-        
         # If there are successful entries, save them to a separate CSV
-        if successful_entries:
-            success_df = pd.DataFrame(successful_entries)
-
-            # Get current date and time (24-hour format)
-            current_date = datetime.now().strftime('%Y-%m-%d')
-            current_time = datetime.now().strftime('%H')
-
-            # Create folder path based on current date and time
-            folder_path = f"data/{current_date}/{current_time}"
-            os.makedirs(folder_path, exist_ok=True)  # Create directories if they don't exist
-
-            # Save the successful entries to the new CSV in the formatted folder structure
-            success_filename = f"{folder_path}/{video_id}_{table_name}.csv"
-            # If the file already exists, read the existing data and append new entries
-            if os.path.exists(success_filename):
-                existing_data = pd.read_csv(success_filename)
-                # Append new data and drop duplicates based on the primary key '评论ID'
-                combined_data = pd.concat([existing_data, success_df]).drop_duplicates(subset=['评论ID'])
-            else:
-                # If the file doesn't exist, just use the new data
-                combined_data = success_df
-            
-            # Save the combined data back to the same file
-            combined_data.to_csv(success_filename, index=False)
-            logging.info(f"Successful entries saved to {success_filename}")
+        if new_ids:
+            success_df = data[data['评论ID'].astype(str).isin(set(new_ids))].drop_duplicates('评论ID')
+            self.save_new_entries(table_name, video_id, success_df)
+
+    # Save newly inserted rows to data/{date}/{hour}/{video_id}_{table_name}.csv
+    def save_new_entries(self, table_name, video_id, success_df: pd.DataFrame):
+        # Get current date and time (24-hour format)
+        current_date = datetime.now().strftime('%Y-%m-%d')
+        current_time = datetime.now().strftime('%H')
+
+        # Create folder path based on current date and time
+        folder_path = f"data/{current_date}/{current_time}"
+        os.makedirs(folder_path, exist_ok=True)  # Create directories if they don't exist
+
+        # Only rows that were new to the database end up here, so appending can't create duplicates
+        success_filename = f"{folder_path}/{video_id}_{table_name}.csv"
+        success_df.to_csv(success_filename, mode='a', header=not os.path.exists(success_filename), index=False)
+        logging.info(f"Successful entries saved to {success_filename}")
+
+    def insert_rows(self, table_name, data) -> list[str]:
+        """
+        Insert many rows in one transaction and return the 评论ID of the rows that were new.
+
+        data is a DataFrame (or anything DataFrame() accepts) containing at least the table's columns.
+        Rows are bulk-loaded into a temporary staging table, then moved into the real table with
+        INSERT ... ON CONFLICT DO NOTHING RETURNING, so duplicates cost nothing and are not raised as errors.
+        """
+        columns = COLUMNS[table_name]
+        data = pd.DataFrame(data)
+        if data.empty:
+            return []
+        data = data.reindex(columns=columns).astype(object)
+        data = data.where(data.notna(), None)  # NaN -> NULL
+
+        staging = f"staging_{table_name}"
+        column_list = ", ".join(columns)
+        placeholders = ", ".join("?" * len(columns))
+        with DB_BATCH.time(table_name), self.conn:
+            self.conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS SELECT * FROM {table_name} WHERE 0")
+            self.conn.execute(f"DELETE FROM {staging}")
+            self.conn.executemany(f"INSERT INTO {staging} ({column_list}) VALUES ({placeholders})",
+                                  data.itertuples(index=False, name=None))
+            # "WHERE true" is required by SQLite to parse ON CONFLICT after a SELECT
+            new_ids = self.conn.execute(
+                f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging} WHERE true "
+                f"ON CONFLICT DO NOTHING RETURNING 评论ID"
+            ).fetchall()
+            self.conn.execute(f"DELETE FROM {staging}")
+        DB_ROWS.inc(len(data), table_name, "sent")
+        DB_ROWS.inc(len(new_ids), table_name, "new")
+        return [row[0] for row in new_ids]
 
     # Iterate over the 'data' folder and process each file
     def process_data_folder(self):
@@ -109,45 +224,147 @@ class crdb:
         # Commit changes to the database
         self.conn.commit()
     
+    # Export all rows of one video to data/{video_id}_{table_name}.{fmt}, streamed chunk by chunk
+    def export_video_csv(self, table_name, video_id, folder="data", chunksize=10000, fmt="csv"):
+        filename = f"{folder}/{video_id}_{table_name}.{fmt}"
+        columns = [c for c in COLUMNS[table_name] if c != '视频ID']
+        export.export_table(self.conn, table_name, filename, columns, video_id=video_id, chunk_size=chunksize)
+        return filename
+
+    # 流式导出整张表或其中一部分，见 export.export_table
+    def export(self, table_name, path, video_id=None, since=None, until=None, new_since=None, chunksize=10000) -> int:
+        """
+        Stream table_name to path (.csv, .csv.gz, .jsonl or .jsonl.gz) in chunks of chunksize rows.
+
+        video_id (one id or a list) and since/until on 评论时间 filter the rows; new_since names an export whose
+        position is kept in the database, so only rows added after the previous export with that name are written.
+        """
+        return export.export_table(self.conn, table_name, path, video_id=video_id, since=since, until=until,
+                                   new_since=new_since, chunk_size=chunksize)
+
+    # 全文搜索评论和回复
+    def search(self, keyword: str, video_id=None, since=None, until=None, tables=("comments", "replies"),
+               limit: int = 100) -> pd.DataFrame:
+        """
+        Search 评论内容 and 用户昵称 for keyword and return the best matches (bm25) first.
+
+        video_id limits the search to one video; since/until ('YYYY-MM-DD[ HH:MM:SS]' or datetime) limit 评论时间.
+        Keywords shorter than 3 characters can't use the trigram index and fall back to a LIKE scan (相关度 is NULL).
+        """
+        filters, filter_params = [], []
+        if video_id is not None:
+            filters.append("t.视频ID = ?")
+            filter_params.append(str(video_id))
+        for bound, op in ((since, ">="), (until, "<=")):
+            if bound is not None:
+                filters.append(f"t.评论时间 {op} ?")
+                filter_params.append(bound.strftime('%Y-%m-%d %H:%M:%S') if isinstance(bound, datetime) else str(bound))
+
+        use_index = self.search_index and len(keyword) >= 3
+        queries, params = [], []
+        for table_name in tables:
+            select = f"SELECT '{table_name}' AS 表, t.评论ID, t.评论内容, t.评论时间, t.用户昵称, t.视频ID"
+            if use_index:
+                fts = f"{table_name}_fts"
+                where = [f"{fts} MATCH ?"] + filters
+                queries.append(f"{select}, bm25({fts}) AS 相关度 FROM {fts} "
+                               f"JOIN {table_name} t ON t.rowid = {fts}.rowid WHERE {' AND '.join(where)}")
+                # Quote the keyword as a single FTS5 string so that " - * and spaces are matched literally
+                params += ['"' + keyword.replace('"', '""') + '"'] + filter_params
+            else:
+                pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                where = ["(t.评论内容 LIKE ? ESCAPE '\\' OR t.用户昵称 LIKE ? ESCAPE '\\')"] + filters
+                queries.append(f"{select}, NULL AS 相关度 FROM {table_name} t WHERE {' AND '.join(where)}")
+                params += [pattern, pattern] + filter_params
+        query = " UNION ALL ".join(queries) + " ORDER BY 相关度, 评论时间 DESC LIMIT ?"
+        return pd.read_sql_query(query, self.conn, params=params + [limit])
+
+    def _lookup_one(self, comment_id) -> tuple:
+        comment_id = str(comment_id)
+        if self.lookup_cache is not None:
+            cached = self.lookup_cache.get(comment_id)
+            if cached is not None:
+                return cached
+        # 先查询 comments 表，没有再查询 replies 表
+        for table_name in ("comments", "replies"):
+            self.cursor.execute(f"SELECT 评论内容, 视频ID FROM {table_name} WHERE 评论ID=?", (comment_id,))
+            result = self.cursor.fetchone()
+            if result:
+                if self.lookup_cache is not None:
+                    self.lookup_cache.put(comment_id, result)
+                return result
+        return None, None
+
     # 通过评论ID查询评论内容
     def get_comment_content(self, comment_id):
-        # 先查询 comments 表
-        self.cursor.execute("SELECT 评论内容 FROM comments WHERE 评论ID=?", (comment_id,))
-        result = self.cursor.fetchone()
-
-        # 如果 comments 表中存在该评论ID，直接返回结果
-        if result:
-            return result[0]
-
-        # 如果 comments 表中没有该评论ID，则查询 replies 表
-        self.cursor.execute("SELECT 评论内容 FROM replies WHERE 评论ID=?", (comment_id,))
-        result = self.cursor.fetchone()
-
-        # 如果 replies 表中存在该评论ID，返回结果，否则返回 None
-        if result:
-            return result[0]
-        else:
-            return None
-    
+        return self._lookup_one(comment_id)[0]
+
     # 通过评论ID查询视频ID
     def get_video_id(self, comment_id):
-        # 先查询 comments 表
-        self.cursor.execute("SELECT 视频ID FROM comments WHERE 评论ID=?", (comment_id,))
-        result = self.cursor.fetchone()
-
-        # 如果 comments 表中存在该评论ID，直接返回结果
-        if result:
-            return result[0]
-
-        # 如果 comments 表中没有该评论ID，则查询 replies 表
-        self.cursor.execute("SELECT 视频ID FROM replies WHERE 评论ID=?", (comment_id,))
-        result = self.cursor.fetchone()
-
-        # 如果 replies 表中存在该评论ID，返回结果，否则返回 None
-        if result:
-            return result[0]
-        else:
-            return None
+        return self._lookup_one(comment_id)[1]
+
+    def _with_ids(self, ids: list[str], *queries: str) -> list[list[tuple]]:
+        # The ids are loaded once into a temporary table that each query joins against (as lookup_ids),
+        # so a query costs one statement however many ids there are. Queries use CROSS JOIN to keep lookup_ids as
+        # the outer loop; without statistics SQLite may otherwise scan the whole table in index order
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_ids (评论ID TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM lookup_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO lookup_ids VALUES (?)", ((i,) for i in ids))
+            results = [self.conn.execute(query).fetchall() for query in queries]
+            self.conn.execute("DELETE FROM lookup_ids")
+        return results
+
+    def lookup(self, comment_ids) -> dict[str, tuple]:
+        """
+        Resolve many 评论ID at once: returns {评论ID: (评论内容, 视频ID)} for the ids that exist, comments taking
+        precedence over replies as in get_comment_content. Ids missing from the cache are looked up with one query
+        per table.
+        """
+        ids = list(dict.fromkeys(str(i) for i in comment_ids))
+        found = {}
+        if self.lookup_cache is not None:
+            for comment_id in ids:
+                cached = self.lookup_cache.get(comment_id)
+                if cached is not None:
+                    found[comment_id] = cached
+            ids = [i for i in ids if i not in found]
+        if ids:
+            fetched = {}
+            # replies first so that comments overwrite them
+            for rows in self._with_ids(ids, *(f"SELECT t.评论ID, t.评论内容, t.视频ID FROM lookup_ids l "
+                                              f"CROSS JOIN {table_name} t ON t.评论ID = l.评论ID"
+                                              for table_name in ("replies", "comments"))):
+                fetched.update((comment_id, (content, video_id)) for comment_id, content, video_id in rows)
+            if self.lookup_cache is not None:
+                for comment_id, value in fetched.items():
+                    self.lookup_cache.put(comment_id, value)
+            found.update(fetched)
+        return found
+
+    def get_comment_contents(self, comment_ids) -> dict[str, str]:
+        return {comment_id: content for comment_id, (content, _) in self.lookup(comment_ids).items()}
+
+    def get_video_ids(self, comment_ids) -> dict[str, str]:
+        return {comment_id: video_id for comment_id, (_, video_id) in self.lookup(comment_ids).items()}
+
+    # 评论ID -> 用户昵称，评论和回复都查
+    def get_nicknames(self, comment_ids) -> dict[str, str]:
+        ids = list(dict.fromkeys(str(i) for i in comment_ids))
+        nicknames = {}
+        for rows in self._with_ids(ids, *(f"SELECT t.评论ID, t.用户昵称 FROM lookup_ids l "
+                                          f"CROSS JOIN {table_name} t ON t.评论ID = l.评论ID"
+                                          for table_name in ("comments", "replies"))):
+            nicknames.update(rows)
+        return nicknames
+
+    # 查询若干条评论的所有回复
+    def get_replies(self, comment_ids) -> pd.DataFrame:
+        ids = list(dict.fromkeys(str(i) for i in comment_ids))
+        columns = COLUMNS["replies"]
+        rows, = self._with_ids(ids, f"SELECT {', '.join('t.' + c for c in columns)} FROM lookup_ids l "
+                                    f"CROSS JOIN replies t ON t.回复的评论 = l.评论ID ORDER BY t.回复的评论, t.评论时间")
+        return pd.DataFrame(rows, columns=columns)
 
     def close(self):
         # Close the connection separately, to be called when finished
@@ -0,0 +1,248 @@
+"""
+分布式模式：coordinator 把 config 中的视频展开成任务放进共享队列（workqueue.py），
+任意数量的 worker 进程租用任务执行，结果写入同一个 comments_replies.db。
+
+队列和数据库都是 WAL 模式的 SQLite，需要同一台机器上的共享内存，不能放在网络文件系统（NFS、SMB 等）上。
+只在一台机器上运行时 worker 直接打开它们；要让多台机器（各自的出口 IP）一起抓取，在存放数据库的机器上运行 serve，
+其它机器在 config 中设置 queue_url 指向它，通过 HTTP 租用任务、提交结果（见 workserver.py）
+
+    python distributed.py serve [--host 0.0.0.0] [--port 8766]
+    python distributed.py coordinator [--wait]
+    python distributed.py worker [--concurrency 4] [--name NAME] [--forever]
+    python distributed.py status
+
+任务分三种：video（展开为第一页评论）、comments（一页评论，产生下一页和每条评论的回复串）、
+replies（回复串中的一页，产生下一页）
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import archive
+import offload
+import signer
+from creators import CreatorVideoStore
+from main import (check_and_initialize_config, get_comments_async, get_creators_videos, get_replies_async,
+                  process_comments, process_replies, setup_logging)
+from session import CrawlSession
+from workqueue import WorkItem
+from workserver import LocalBackend, WorkBackend, backend_from_config, serve
+
+
+def comment_page_item(aweme_id, cursor: int) -> tuple:
+    return ("comments", f"comments:{aweme_id}:{cursor}", aweme_id, {"cursor": cursor})
+
+
+def reply_page_item(aweme_id, cid: str, nickname: str, total: int, cursor: int) -> tuple:
+    return ("replies", f"replies:{cid}:{cursor}", aweme_id,
+            {"cid": cid, "nickname": nickname, "total": total, "cursor": cursor})
+
+
+async def coordinate(config, wait: bool = False, transport=None) -> str:
+    """把本次要抓的视频加入队列，返回本次运行的 run id；wait 为 True 时等待所有任务结束"""
+    # 同一秒启动的两个 coordinator 也不会得到相同的 run id
+    run = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    if config.query_type == "detail":
+        aweme_ids = [str(aweme_id) for aweme_id in config.aweme_ids]
+    else:
+        # 作者的视频列表由 coordinator 自己获取
+        store = CreatorVideoStore() if getattr(config, "creator_cache", True) else None
+        try:
+            async with CrawlSession.from_config(config, transport) as session:
+                videos = await get_creators_videos(session, config.creator_ids, config.count, store)
+        finally:
+            if store is not None:
+                store.close()
+        aweme_ids = [str(video["aweme_id"]) for video in videos]
+
+    queue = backend_from_config(config)
+    try:
+        added = queue.enqueue(run, [("video", f"video:{aweme_id}", aweme_id, {}) for aweme_id in aweme_ids])
+        logging.info(f"Run {run}: queued {added} videos.")
+        while wait and queue.unfinished(run):
+            await asyncio.sleep(5)
+            logging.info(f"Run {run}: {queue.stats(run)}")
+        if wait:
+            logging.info(f"Run {run} finished: {queue.stats(run)}")
+    finally:
+        queue.close()
+    return run
+
+
+class Worker:
+    """
+    一个 worker 进程：concurrency 个协程共享一个连接池、令牌桶和账号池；
+    队列和数据库操作（WorkBackend）都放在同一个线程里执行（sqlite 连接只能在创建它的线程里使用）
+    """
+
+    def __init__(self, config, name: str = None, concurrency: int = 4, poll_interval: float = 2.0,
+                 incremental_csv: bool = True, archive=None):
+        self.config = config
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.incremental_csv = incremental_csv
+        self.archive = archive
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker-db")
+        self.backend: WorkBackend = None
+        # 正在处理的任务，定期续约，处理时间超过 lease_time 也不会被别的 worker 接手
+        self.in_flight: dict[int, WorkItem] = {}
+        # metrics
+        self.done = 0
+        self.failed = 0
+
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _open(self):
+        self.backend = backend_from_config(self.config, self.incremental_csv, self.archive)
+
+    def _close(self):
+        self.backend.close()
+
+    def _replies_frame(self, replies: list, cid: str, nickname: str) -> pd.DataFrame:
+        # 楼中楼回复的对象可能在这个回复串前面的页里。下一页的任务在上一页写入数据库之后才加入队列，
+        # 所以那些回复的昵称可以从数据库中补全
+        seen = {cid} | {str(r.get("cid")) for r in replies}
+        earlier = {str(r.get("reply_to_reply_id")) for r in replies} - seen - {"0", "None", ""}
+        nicknames = self.backend.nicknames(earlier) if earlier else {}
+        nicknames[cid] = nickname
+        return process_replies(replies, nicknames)
+
+    async def handle(self, session: CrawlSession, item: WorkItem):
+        aweme_id = item.aweme_id
+        slot = session.video_slot(aweme_id)
+        if item.kind == "video":
+            await self._db(self.backend.finish, item, self.name, None, None, [comment_page_item(aweme_id, 0)])
+        elif item.kind == "comments":
+            data = await get_comments_async(session, aweme_id, cursor=str(item.payload["cursor"]), semaphore=slot)
+            comments = data.get("comments") or []
+            follow_ups = []
+            if data.get("has_more"):
+                follow_ups.append(comment_page_item(aweme_id, data.get("cursor", 0)))
+            for c in comments:
+                # 接口可能返回 "reply_comment_total": null
+                total = c.get("reply_comment_total") or 0
+                if total > 0:
+                    nickname = (c.get("user") or {}).get("nickname")
+                    follow_ups.append(reply_page_item(aweme_id, c["cid"], nickname, total, 0))
+            await self._db(self.backend.finish, item, self.name, "comments", process_comments(comments), follow_ups)
+        elif item.kind == "replies":
+            payload = item.payload
+            data = await get_replies_async(session, slot, payload["cid"], cursor=str(payload["cursor"]))
+            replies = data.get("comments") or []
+            follow_ups = []
+            if data.get("has_more"):
+                follow_ups.append(reply_page_item(aweme_id, payload["cid"], payload["nickname"], payload["total"],
+                                                  data.get("cursor", 0)))
+            rows = await self._db(self._replies_frame, replies, payload["cid"], payload["nickname"])
+            await self._db(self.backend.finish, item, self.name, "replies", rows, follow_ups)
+        else:
+            raise ValueError(f"Unknown work item kind: {item.kind}")
+
+    async def _loop(self, session: CrawlSession, forever: bool):
+        while True:
+            items = await self._db(self.backend.lease, self.name, 1)
+            if not items:
+                # 其它 worker 手里的任务可能还会产生新任务，全部结束后才退出
+                if not forever and not await self._db(self.backend.unfinished):
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+            item = items[0]
+            self.in_flight[item.id] = item
+            try:
+                await self.handle(session, item)
+                self.done += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"{self.name} failed {item}: {e!r}")
+                await self._db(self.backend.fail, item, self.name, repr(e))
+            finally:
+                self.in_flight.pop(item.id, None)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.backend.lease_time / 3)
+            if self.in_flight:
+                await self._db(self.backend.renew, list(self.in_flight.values()), self.name)
+
+    async def run(self, forever: bool = False, transport=None):
+        """forever 为 False 时队列清空后退出"""
+        await self._db(self._open)
+        try:
+            async with CrawlSession.from_config(self.config, transport) as session:
+                heartbeat = asyncio.create_task(self._heartbeat())
+                try:
+                    await asyncio.gather(*(self._loop(session, forever) for _ in range(self.concurrency)))
+                finally:
+                    heartbeat.cancel()
+                logging.info(f"Worker {self.name}: {self.done} items done, {self.failed} failed.")
+                logging.info(f"Rate limiter: {session.limiter.metrics()}")
+                logging.info(f"Retries: {session.retry.metrics()}")
+        finally:
+            await self._db(self._close)
+            self.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("coordinator", help="把 config 中的视频加入队列")
+    p.add_argument("--wait", action="store_true", help="等待所有任务完成")
+    p = sub.add_parser("worker", help="从队列中租用任务执行")
+    p.add_argument("--concurrency", type=int, default=None)
+    p.add_argument("--name", default=None)
+    p.add_argument("--forever", action="store_true", help="队列为空时继续等待新任务")
+    sub.add_parser("status", help="查看队列中各类任务的状态")
+    p = sub.add_parser("serve", help="通过 HTTP 提供队列和数据库，供其它机器上的 coordinator 和 worker 使用")
+    p.add_argument("--host", default="127.0.0.1", help="其它机器访问时使用 0.0.0.0")
+    p.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    check_and_initialize_config()
+    import config
+
+    setup_logging(config.logs_dir)
+    if args.command == "status":
+        queue = backend_from_config(config)
+        print(queue.stats())
+        queue.close()
+        return
+    if args.command == "serve":
+        backend = LocalBackend(config, getattr(config, "incremental_csv", True), archive.from_config(config))
+        server = serve(backend, args.host, args.port, getattr(config, "queue_token", ""))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            backend.close()
+        return
+
+    signer.configure(getattr(config, "sign_backend", "pool"), getattr(config, "sign_workers", 2))
+    offload.configure_from_config(config)
+    try:
+        if args.command == "coordinator":
+            asyncio.run(coordinate(config, wait=args.wait))
+        else:
+            concurrency = args.concurrency or getattr(config, "worker_concurrency", 4)
+            worker = Worker(config, args.name, concurrency,
+                            incremental_csv=getattr(config, "incremental_csv", True),
+                            archive=archive.from_config(config))
+            asyncio.run(worker.run(forever=args.forever))
+    finally:
+        offload.close()
+        signer.close()
+
+
+if __name__ == "__main__":
+    main()
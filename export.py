@@ -0,0 +1,158 @@
+"""
+流式导出：用 fetchmany 按固定大小分块读取，逐行写入 CSV、gzip 压缩的 CSV 或 JSON Lines，
+内存占用和表的大小无关。格式由文件名决定：.csv、.csv.gz、.jsonl、.jsonl.gz
+
+    python export.py comments out/comments.csv.gz [--video 7411856833750519090] [--since 2024-09-01 --until 2024-10-01]
+    python export.py replies out/replies.jsonl --new-since daily   # 只导出上次用同一个名字导出之后新增的行
+    python export.py bad bad_comments.csv                          # bad_comments.db 中标记的坏评论
+"""
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+
+def detect_format(path: str) -> tuple[str, bool]:
+    """返回 (csv 或 jsonl, 是否 gzip 压缩)"""
+    compressed = path.endswith(".gz")
+    name = path[:-3] if compressed else path
+    return ("jsonl" if name.endswith((".jsonl", ".json")) else "csv"), compressed
+
+
+def _time_bound(value) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else str(value)
+
+
+class ExportMarks:
+    """每个导出名字、每张表已经导出到的 rowid，保存在被导出的数据库中"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS export_marks (
+            name TEXT,
+            table_name TEXT,
+            last_rowid INTEGER,
+            updated_at TEXT,
+            PRIMARY KEY (name, table_name)
+        )
+        ''')
+        self.conn.commit()
+
+    def get(self, name: str, table_name: str) -> int:
+        row = self.conn.execute("SELECT last_rowid FROM export_marks WHERE name=? AND table_name=?",
+                                (name, table_name)).fetchone()
+        return row[0] if row else 0
+
+    def set(self, name: str, table_name: str, last_rowid: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO export_marks (name, table_name, last_rowid, updated_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(name, table_name) DO UPDATE SET last_rowid=excluded.last_rowid, "
+                "updated_at=excluded.updated_at",
+                (name, table_name, last_rowid, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def write_rows(cursor: sqlite3.Cursor, path: str, fmt: str = None, chunk_size: int = 10000) -> tuple[int, int]:
+    """
+    把查询结果写入 path，查询的第一列必须是 rowid（不写入文件）。先写临时文件，完成后再替换，
+    中途出错不会留下半个文件。返回 (行数, 最后一行的 rowid)
+    """
+    detected, compressed = detect_format(path)
+    fmt = fmt or detected
+    columns = [column[0] for column in cursor.description][1:]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = path + ".part"
+    opener = gzip.open if compressed else open
+    count, last_rowid = 0, 0
+    try:
+        with opener(partial, "wt", encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                # 和 pandas.to_csv 的输出一致
+                writer = csv.writer(f, lineterminator=os.linesep)
+                writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    writer.writerows(row[1:] for row in rows)
+                else:
+                    f.writelines(json.dumps(dict(zip(columns, row[1:])), ensure_ascii=False) + "\n" for row in rows)
+                count += len(rows)
+                last_rowid = rows[-1][0]
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return count, last_rowid
+
+
+def export_table(conn: sqlite3.Connection, table_name: str, path: str, columns: list[str] = None,
+                 video_id=None, since=None, until=None, time_column: str = "评论时间", new_since: str = None,
+                 fmt: str = None, chunk_size: int = 10000) -> int:
+    """
+    流式导出一张表，返回导出的行数。
+    video_id: 一个或多个视频ID；since/until: time_column 的范围（字符串或 datetime）；
+    new_since: 导出名字，只导出上次用这个名字导出之后新增的行，成功后推进该名字的位置
+    """
+    filters, params = [], []
+    if video_id is not None:
+        video_ids = [video_id] if isinstance(video_id, (str, int)) else list(video_id)
+        filters.append(f"视频ID IN ({', '.join('?' * len(video_ids))})")
+        params += [str(v) for v in video_ids]
+    if since is not None:
+        filters.append(f"{time_column} >= ?")
+        params.append(_time_bound(since))
+    if until is not None:
+        filters.append(f"{time_column} <= ?")
+        params.append(_time_bound(until))
+    marks = ExportMarks(conn) if new_since else None
+    if marks is not None:
+        filters.append("rowid > ?")
+        params.append(marks.get(new_since, table_name))
+
+    query = f"SELECT rowid, {', '.join(columns) if columns else '*'} FROM {table_name}"
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += " ORDER BY rowid"
+    count, last_rowid = write_rows(conn.execute(query, params), path, fmt, chunk_size)
+    if marks is not None and count:
+        marks.set(new_since, table_name, last_rowid)
+    logging.info(f"Exported {count} rows of {table_name} to {path}.")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=("comments", "replies", "bad"))
+    parser.add_argument("path", help="输出文件：.csv、.csv.gz、.jsonl 或 .jsonl.gz")
+    parser.add_argument("--video", action="append", help="视频ID，可以重复")
+    parser.add_argument("--since", help="评论时间（坏评论为标记时间）下限，如 2024-09-01")
+    parser.add_argument("--until", help="评论时间（坏评论为标记时间）上限，如 2024-10-01 23:59:59")
+    parser.add_argument("--new-since", help="导出名字：只导出上次用这个名字导出之后新增的行")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.table == "bad":
+        db_path, table_name, time_column = "bad_comments.db", "comments", "标记时间"
+    else:
+        db_path, table_name, time_column = "comments_replies.db", args.table, "评论时间"
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database {db_path} does not exist")
+    conn = sqlite3.connect(db_path)
+    try:
+        export_table(conn, table_name, args.path, video_id=args.video, since=args.since, until=args.until,
+                     time_column=time_column, new_since=args.new_since, chunk_size=args.chunk_size)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,30 @@
 import httpx
 import asyncio
 import os
+import time
 import logging
 from datetime import datetime
 from logging.handlers import TimedRotatingFileHandler
 import pandas as pd
 from tqdm.asyncio import tqdm_asyncio
 from tqdm import tqdm
-from common import common
+from common import PROFILES
+import signer
+import offload
+import archive
 from db import crdb
-from typing import Any
+from session import CrawlSession
+from watermark import WatermarkStore, VideoWatermark
+from sink import DatabaseSink
+from checkpoint import CheckpointStore
+from creators import CreatorVideoStore
+import checkpoint
+import normalize
+from retry import Throttled
+from ratelimit import is_throttled
+import metrics
+from metrics import STAGES, QUEUE_DEPTH, PAGES_PER_VIDEO
+from typing import Any, Callable
 
 
 url = "https://www.douyin.com/aweme/v1/web/comment/list/"
@@ -19,6 +34,10 @@ def setup_logging(logs_dir: str):
     # Configure logging
     os.makedirs(logs_dir, exist_ok=True)
     log_filename = f"{logs_dir}/app.log"  # or path to the log file
+    # main() may be called repeatedly in one process (schedule.py), attach the handler only once
+    for existing in logging.getLogger().handlers:
+        if isinstance(existing, TimedRotatingFileHandler) and existing.baseFilename == os.path.abspath(log_filename):
+            return
     handler = TimedRotatingFileHandler(
         log_filename,
         when="midnight",     # Rotate at midnight
@@ -45,6 +64,10 @@ def create_config_file():
 
 # cookie
 cookie = ''
+# more accounts: when not empty, requests are spread over these cookies instead of `cookie`
+cookies = [
+    # '',
+]
 
 # directory where logs will be saved
 logs_dir = "logs"
@@ -60,6 +83,8 @@ creator_ids = [
 ]
 # number of videos to fetch for each creator
 count = 2
+# keep each creator's video list in the database; later runs only page until an already known video
+creator_cache = True
 
 # by detail: aweme_id: str
 # aweme IDs to fetch details for specific videos
@@ -67,6 +92,81 @@ aweme_ids = [
     7411856833750519090,  # Example: Aweme ID for 哈工大军训又上新了
     # ......,               # Add more aweme IDs as needed
 ]
+
+# signing backend: "pool" keeps long-lived node processes, "python" signs in-process without node,
+# "execjs" starts node for every call
+sign_backend = "pool"  # Options: "pool", "python", "execjs"
+# number of node processes in the signing pool
+sign_workers = 2
+
+# where request preparation/signing and response decoding run: "inline" (on the event loop) or
+# "process" (a pool of offload_workers processes, 0 = one per CPU core, fed in batches of up to offload_batch)
+offload = "inline"
+offload_workers = 0
+offload_batch = 32
+
+# connection pool shared by the whole crawl run
+http2 = True  # requires `pip install httpx[http2]`, falls back to HTTP/1.1 otherwise
+max_connections = 20
+max_keepalive_connections = 10
+keepalive_expiry = 60  # seconds an idle connection is kept open
+
+# concurrency: requests in flight across all videos, per video, and videos crawled at once
+max_concurrency = 10
+per_video_concurrency = 4
+max_parallel_videos = 8
+
+# adaptive rate limit (token bucket, requests per second), slows down when throttled and speeds up again on success
+rate_limit_per = "both"  # Options: "endpoint", "cookie", "both"
+rate_limit = 3.0
+rate_limit_burst = 3.0
+rate_limit_min = 0.2
+rate_limit_max = 20.0
+
+# incremental mode: only page until already-seen comments and skip reply threads whose reply count is unchanged
+incremental = False
+
+# results are written straight into comments_replies.db; new rows are also appended to data/{date}/{hour}/*.csv
+incremental_csv = True
+# also export every video's comments/replies to data/{aweme_id}_comments/replies.csv after the run
+export_csv = False
+# format of that export: csv, csv.gz (gzip) or jsonl (JSON Lines); rows are streamed, memory use stays flat
+export_format = "csv"
+# also archive new rows as Parquet or Arrow files partitioned by date and video (needs pyarrow), None to disable;
+# python archive.py compact merges each day's small files, see README
+archive_format = None  # Options: None, "parquet", "arrow"
+archive_dir = "archive"
+# save comment/reply cursors with the data so an interrupted crawl resumes where it stopped
+checkpoint = True
+
+# retries: bounded retries with jittered exponential backoff; a circuit breaker pauses an endpoint after repeated failures
+retry_max = 3
+retry_base_delay = 0.5  # seconds, doubled on every retry
+retry_max_delay = 30.0
+breaker_failures = 5    # consecutive failures before an endpoint is paused
+breaker_reset = 30.0    # seconds an endpoint stays paused before a trial request
+
+# metrics: serve Prometheus text at http://127.0.0.1:{metrics_port}/metrics (0 disables it, e.g. 9108)
+metrics_port = 0
+# append a JSON summary of every run to {logs_dir}/run_summary.jsonl
+metrics_summary = True
+
+# adaptive scheduler (schedule.py): every video is recrawled at an interval derived from its comment arrival rate
+schedule_target_new = 50         # aim for about this many new comments/replies per recrawl
+schedule_min_interval = 600      # seconds
+schedule_max_interval = 86400    # seconds, videos without new comments back off up to this interval
+schedule_creator_refresh = 21600 # seconds between re-listing the creators' videos
+
+# distributed mode (distributed.py): a coordinator queues work, any number of workers lease and run it
+queue_db = "work_queue.db"  # SQLite queue of the machine that holds the database; never on a network filesystem
+queue_lease_time = 120      # seconds before an unfinished work item is handed to another worker
+queue_max_attempts = 5      # work items that fail this many times are marked failed
+worker_concurrency = 4      # work items processed at the same time by one worker
+queue_url = None            # e.g. "http://192.168.1.10:8766": use the queue of `distributed.py serve` on another machine
+queue_token = ""            # shared secret checked by `distributed.py serve`, set the same value on every machine
+
+# bad comment rules for `python comments.py scan`: one keyword per line, "re:" prefix for a regex, "#" for comments
+bad_rules = "bad_rules.txt"
 '''
 
     # Write the default configuration to config.py
@@ -83,198 +183,449 @@ def check_and_initialize_config():
     else:
         logging.info("config.py found.")
 
-# get aweme_ids by creator_id
-async def get_creator_awesome_id(creator_id: str, count: int, cookie: str) -> list[dict]:
-    async with httpx.AsyncClient(timeout=600) as client:
-        all_video_list = []
-        max_cursor = ""
-        has_more = True
-        while has_more and len(all_video_list) < count:
-            uri = "https://www.douyin.com/aweme/v1/web/aweme/post/"
-            params = {
-                "sec_user_id": creator_id,
-                "count": count,
-                "max_cursor": max_cursor,
-                "locate_query": "false",
-                "publish_video_strategy_type": 2,                                    # 暂时还不知道是什么
-                'verifyFp': 'verify_m0tzzv90_eA8z0jDr_6N9p_4OBV_BdPt_lCYFfQxJlKKf',  # 确保替换为有效的值
-                'fp': 'verify_m0tzzv90_eA8z0jDr_6N9p_4OBV_BdPt_lCYFfQxJlKKf'         # 确保替换为有效的值
-            }
-            headers = {"cookie": cookie}
-            params, headers = common(uri, params, headers)
-            response = await client.get(uri, params=params, headers=headers)
-            response_data = response.json()
-            
-            aweme_list = response_data.get("aweme_list", [])
-            all_video_list.extend(aweme_list)
-            
-            has_more = response_data.get("has_more", 0)
-            max_cursor = response_data.get("max_cursor", "")
-        
-        # 由于可能获取到多的视频，这里进行处理
-        video_infos = [
-            {
-                "aweme_id": video_item.get("aweme_id"),
-                "desc": video_item.get("desc"),
-                "create_time": video_item.get("create_time"),
-                "nickname": video_item.get("author", {}).get("nickname", "")
-            }
-            for video_item in all_video_list[:count]
-        ]
+def check_rejected(response: httpx.Response, cookie: str, error: Exception):
+    # 200 却返回空内容、验证码页面或 status_code 不为 0（解码时抛出 Throttled），通常是设备参数失效，
+    # 清掉缓存让下次请求重新获取 webid。429/5xx 只是限流或服务端错误，交给令牌桶和重试处理
+    if response.status_code == 200 and isinstance(error, Throttled):
+        logging.warning(f"Request rejected ({error}), refreshing device profile.")
+        PROFILES.invalidate(cookie)
+
+
+async def request_json(session: CrawlSession, uri: str, params: dict, semaphore=None,
+                       key: str = "comments") -> dict[str, Any]:
+    """
+    选择账号、签名、请求并解析 JSON，失败时由 session.retry 重试（每次重试重新选账号、重新签名）。
+    key: 返回数据中列表的字段名，还有更多却返回空列表（或翻页位置没有前进）视为被限流
+    """
+    async def attempt():
+        account = session.accounts.pick(uri)
+        headers = {"cookie": account.cookie}
+        # 签名和解析在 offload = "process" 时交给进程池，否则在事件循环中直接执行
+        offloader = offload.get_offloader()
+        signed, headers = await offloader.sign(uri, dict(params), headers, session.client)
+        response = await session.get(uri, signed, headers, semaphore)  # 速度由 session 的令牌桶控制
+        try:
+            data = await offloader.decode(response, key)
+        except Throttled as e:
+            check_rejected(response, account.cookie, e)
+            # 状态码层面的限流 session.get 已经降过速，这里只处理正文中的（status_code 不为 0）
+            if not is_throttled(response):
+                session.report(uri, account.cookie, throttled=True)
+            raise
+        cursor = params.get("max_cursor" if key == "aweme_list" else "cursor")
+        empty = session.accounts.report(account, data, key, cursor)
+        session.report(uri, account.cookie, throttled=empty)
+        if empty:
+            raise Throttled(f"empty {key} or cursor stuck at {cursor} with has_more")
+        return data
+
+    return await session.retry.call(uri, attempt)
 
+
+# get aweme_ids by creator_id
+async def get_creator_awesome_id(session: CrawlSession, creator_id: str, count: int,
+                                 store: CreatorVideoStore = None) -> list[dict]:
+    """
+    store: 传入时只翻到第一个已知的视频为止（置顶视频不算），新视频存入缓存，返回缓存中最新的 count 个视频
+    """
+    known = store.known_ids(creator_id) if store is not None else set()
+    all_video_list = []
+    max_cursor = ""
+    has_more = True
+    reached_known = False
+    while has_more and len(all_video_list) < count and not reached_known:
+        uri = "https://www.douyin.com/aweme/v1/web/aweme/post/"
+        params = {
+            "sec_user_id": creator_id,
+            "count": count,
+            "max_cursor": max_cursor,
+            "locate_query": "false",
+            "publish_video_strategy_type": 2,                                    # 暂时还不知道是什么
+            'verifyFp': 'verify_m0tzzv90_eA8z0jDr_6N9p_4OBV_BdPt_lCYFfQxJlKKf',  # 确保替换为有效的值
+            'fp': 'verify_m0tzzv90_eA8z0jDr_6N9p_4OBV_BdPt_lCYFfQxJlKKf'         # 确保替换为有效的值
+        }
+        response_data = await request_json(session, uri, params, key="aweme_list")
+
+        aweme_list = response_data.get("aweme_list") or []
+        all_video_list.extend(aweme_list)
+        # 列表按发布时间从新到旧，置顶的旧视频排在最前面，不能据此判断
+        reached_known = any(str(video_item.get("aweme_id")) in known
+                            for video_item in aweme_list if not video_item.get("is_top"))
+
+        has_more = response_data.get("has_more", 0)
+        max_cursor = response_data.get("max_cursor", "")
+    
+    # 由于可能获取到多的视频，这里进行处理
+    video_infos = [
+        {
+            "aweme_id": video_item.get("aweme_id"),
+            "desc": video_item.get("desc"),
+            "create_time": video_item.get("create_time"),
+            "nickname": video_item.get("author", {}).get("nickname", "")
+        }
+        for video_item in all_video_list[:count]
+    ]
+    if store is None:
         return video_infos
+    new = store.add(creator_id, video_infos)
+    logging.info(f"Creator {creator_id}: {new} new videos, {len(all_video_list)} listed.")
+    return store.videos(creator_id, count)
+
+
+async def get_creators_videos(session: CrawlSession, creator_ids: list[str], count: int,
+                              store: CreatorVideoStore = None) -> list[dict]:
+    """
+    同时获取多个作者的视频列表（并发和速度由 session 控制）。某个作者失败时使用缓存中的列表，其它作者不受影响
+    """
+    results = await asyncio.gather(*(get_creator_awesome_id(session, creator_id, count, store)
+                                     for creator_id in creator_ids), return_exceptions=True)
+    videos = []
+    for creator_id, result in zip(creator_ids, results):
+        if isinstance(result, BaseException):
+            logging.error(f"Failed to list videos of creator {creator_id}: {result!r}")
+            if store is not None:
+                videos.extend(store.videos(creator_id, count))
+        else:
+            videos.extend(result)
+    return videos
 
 # test
 def get_creator_video_list_detail(creator_ids: list[str], count: int, cookie: str):
     # 测试获取用户的视频列表
-    res = []
-    for creator_id in creator_ids:
-        res.extend(asyncio.run(get_creator_awesome_id(creator_id, count, cookie)))
+    async def run():
+        res = []
+        async with CrawlSession(cookies=[cookie]) as session:
+            for creator_id in creator_ids:
+                res.extend(await get_creator_awesome_id(session, creator_id, count))
+        return res
+
+    res = asyncio.run(run())
     
     for i in res:
         print(f"{i['aweme_id']}: {i['desc']}; {i['create_time']}; {i['nickname']}")
 
 
-async def get_comments_async(client: httpx.AsyncClient, aweme_id: str, cursor: str = "0", count: str = "50", cookie: str = '') -> dict[
-    str, Any]:
+async def get_comments_async(session: CrawlSession, aweme_id: str, cursor: str = "0", count: str = "50",
+                             semaphore=None) -> dict[str, Any]:
     params = {"aweme_id": aweme_id, "cursor": cursor, "count": count, "item_type": 0}
-    headers = {"cookie": cookie}
-    params, headers = common(url, params, headers)
-    response = await client.get(url, params=params, headers=headers)
-    await asyncio.sleep(0.8)
-    return response.json()
-
-
-async def fetch_all_comments_async(aweme_id: str, cookie: str) -> list[dict[str, Any]]:
-    async with httpx.AsyncClient(timeout=600) as client:
-        cookie = cookie
-        cursor = 0
-        all_comments = []
-        has_more = 1
-        with tqdm(desc="Fetching comments", unit="comment") as pbar:
-            while has_more:
-                response = await get_comments_async(client, aweme_id, cursor=str(cursor), cookie=cookie)
-                comments = response.get("comments", [])
-                if isinstance(comments, list):
+    return await request_json(session, url, params, semaphore)
+
+
+async def fetch_all_comments_async(session: CrawlSession, aweme_id: str,
+                                   on_page: Callable[[list, int, bool], None] = None,
+                                   watermark: VideoWatermark = None, collect: bool = True,
+                                   cursor: int = 0) -> list[dict[str, Any]]:
+    """
+    on_page: 每拿到一页评论就调用一次 on_page(comments, 下一页的 cursor, 是否已经翻完)，
+             用于在评论翻页的同时开始抓取这一页的回复
+    watermark: 增量模式，评论按时间从新到旧返回时，翻到整页都是水位以下的已知评论就停止
+    collect: 为 False 时不在内存中保留评论，只通过 on_page 交出，返回空列表
+    cursor: 从这个位置开始翻页，用于断点续爬
+    """
+    slot = session.video_slot(aweme_id)
+    all_comments = []
+    has_more = 1
+    with tqdm(desc=f"Fetching comments {aweme_id}", unit="comment") as pbar:
+        while has_more:
+            response = await get_comments_async(session, aweme_id, cursor=str(cursor), semaphore=slot)
+            comments = response.get("comments", [])
+            has_more = response.get("has_more", 0)
+            if has_more:
+                cursor = response.get("cursor", 0)
+            if isinstance(comments, list):
+                # 先判断再交给 on_page，on_page 可能会推进水位
+                known = watermark is not None and watermark.page_is_known(comments)
+                if collect:
                     all_comments.extend(comments)
-                    pbar.update(len(comments))
-                has_more = response.get("has_more", 0)
-                if has_more:
-                    cursor = response.get("cursor", 0)
-                await asyncio.sleep(0.5)
-        return all_comments
+                pbar.update(len(comments))
+                if on_page is not None:
+                    on_page(comments, cursor, known or not has_more)
+                if known:
+                    break
+    return all_comments
 
 
-async def get_replies_async(client: httpx.AsyncClient, semaphore, comment_id: str, cursor: str = "0",
-                            count: str = "50", cookie: str = '') -> dict:
+async def get_replies_async(session: CrawlSession, semaphore, comment_id: str, cursor: str = "0",
+                            count: str = "50") -> dict:
     params = {"cursor": cursor, "count": count, "item_type": 0, "item_id": comment_id, "comment_id": comment_id}
-    headers = {"cookie": cookie}
-    params, headers = common(reply_url, params, headers)
-    async with semaphore:
-        response = await client.get(reply_url, params=params, headers=headers)
-        await asyncio.sleep(0.5)  # 限制速度，避免请求过快
-        return response.json()
+    return await request_json(session, reply_url, params, semaphore)
 
 
-async def fetch_replies_for_comment(client: httpx.AsyncClient, semaphore, comment: dict, pbar: tqdm, cookie: str) -> list:
+async def fetch_replies_for_comment(session: CrawlSession, semaphore, comment: dict, pbar: tqdm,
+                                    watermark: VideoWatermark = None,
+                                    on_page: Callable[[list, int, bool], None] = None, cursor: int = 0) -> list:
+    """
+    on_page: 每拿到一页回复就调用一次 on_page(replies, 下一页的 cursor, 是否已经翻完)，传入时不在内存中收集，返回空列表
+    cursor: 从这个位置开始翻页，用于断点续爬
+    """
     comment_id = comment["cid"]
+    if watermark is not None and not watermark.replies_changed(comment):
+        # 增量模式：回复总数没有变化，跳过这条评论
+        pbar.update(1)
+        return []
     has_more = 1
-    cursor = 0
     all_replies = []
     while has_more and comment["reply_comment_total"] > 0:
-        response = await get_replies_async(client, semaphore, comment_id, cursor=str(cursor), cookie=cookie)
+        response = await get_replies_async(session, semaphore, comment_id, cursor=str(cursor))
         replies = response.get("comments", [])
-        if isinstance(replies, list):
-            all_replies.extend(replies)
         has_more = response.get("has_more", 0)
         if has_more:
             cursor = response.get("cursor", 0)
-        await asyncio.sleep(0.5)
+        if isinstance(replies, list):
+            if on_page is not None:
+                on_page(replies, cursor, not has_more)
+            else:
+                all_replies.extend(replies)
     pbar.update(1)
     return all_replies
 
 
-async def fetch_all_replies_async(comments: list, cookie: str) -> list:
+async def fetch_all_replies_async(session: CrawlSession, aweme_id, comments: list) -> list:
     all_replies = []
-    async with httpx.AsyncClient(timeout=600) as client:
-        semaphore = asyncio.Semaphore(10)  # 在这里创建信号量
-        with tqdm(total=len(comments), desc="Fetching replies", unit="comment") as pbar:
-            tasks = [fetch_replies_for_comment(client, semaphore, comment, pbar, cookie) for comment in comments]
-            results = await asyncio.gather(*tasks)
-            for result in results:
+    semaphore = session.video_slot(aweme_id)  # 视频级别并发数 + 全局并发数
+    with tqdm(total=len(comments), desc="Fetching replies", unit="comment") as pbar:
+        tasks = [fetch_replies_for_comment(session, semaphore, comment, pbar) for comment in comments]
+        # 单条评论的回复重试后仍然失败，不影响其它评论已经抓到的回复
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for comment, result in zip(comments, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Failed to fetch replies for comment {comment['cid']}: {result!r}")
+            else:
                 all_replies.extend(result)
     return all_replies
 
 
 def process_comments(comments: list[dict[str, Any]]) -> pd.DataFrame:
-    data = [{
-        "评论ID": c['cid'],
-        "评论内容": c['text'].replace("\n", "").replace("\r", ""),  # 去除换行符
-        # "点赞数": c['digg_count'],
-        "评论时间": datetime.fromtimestamp(c['create_time']).strftime('%Y-%m-%d %H:%M:%S'),
-        "用户昵称": c['user']['nickname'],
-        # "用户主页链接": f"https://www.douyin.com/user/{c['user']['sec_uid']}",
-        # "用户抖音号": c['user']['unique_id'],
-        # "用户签名": c['user']['signature'],
-        # "回复总数": c['reply_comment_total'],
-    } for c in comments]
-    return pd.DataFrame(data)
-
-
-def process_replies(replies: list[dict[str, Any]], comments: pd.DataFrame) -> pd.DataFrame:
-    data = []
-    for c in replies:
-        try:
-            # Find the matching row for the reply ID in comments
-            matching_comments = comments.loc[comments['评论ID'] == c["reply_id"], '用户昵称']
-            
-            # Check if any matching comment exists
-            if not matching_comments.empty:
-                reply_to_user = matching_comments.iloc[0]  # Get the first matching user nickname
-            else:
-                reply_to_user = c["reply_to_username"]  # Default to reply_to_username if no match
-            
-            data.append({
-                "评论ID": c["cid"],
-                "评论内容": c["text"].replace("\n", "").replace("\r", ""),  # 去除换行符
-                "评论时间": datetime.fromtimestamp(c["create_time"]).strftime("%Y-%m-%d %H:%M:%S"),
-                "用户昵称": c["user"]["nickname"],
-                "回复的评论": c["reply_id"],
-                "具体的回复对象": c["reply_to_reply_id"] if c["reply_to_reply_id"] != "0" else c["reply_id"],
-                "回复给谁": reply_to_user
-            })
-        
-        except Exception as e:
-            # Log or print the error if any issue occurs during processing
-            logging.error(f"Error processing reply with 评论ID {c['cid']}: {e}")
-    
-    return pd.DataFrame(data)
+    frame = getattr(comments, "frame", None)
+    if frame is not None:  # 已经在子进程中整理好
+        return frame
+    with STAGES.time("normalize"):
+        return normalize.comments_frame(normalize.extract_comments(comments))
+
+
+def process_replies(replies: list[dict[str, Any]], comments) -> pd.DataFrame:
+    """
+    comments: 评论的 DataFrame，或者 评论ID -> 用户昵称 的映射，用于查找每条回复具体回复的是谁
+    """
+    with STAGES.time("normalize"):
+        frame = getattr(replies, "frame", None)
+        if frame is None:
+            frame = normalize.replies_base_frame(normalize.extract_replies(replies))
+        # 先建好索引（包含回复本身，楼中楼也能找到），每条回复只做一次查找
+        return normalize.resolve_reply_targets(frame, normalize.nickname_index(comments, frame))
 
 
 def save(data: pd.DataFrame, filename: str):
     data.to_csv(filename, index=False)
 
 
-async def process_aweme_id(aweme_id, cookie):
+async def process_aweme_id(session: CrawlSession, aweme_id, fetch_replies: bool = True,
+                           watermarks: WatermarkStore = None, sink: DatabaseSink = None,
+                           checkpoints: CheckpointStore = None):
+    """
+    watermarks: 传入时为增量模式，只抓上次之后新增的评论和回复数有变化的评论
+    sink: 传入时每一页整理好后直接写入数据库；不传时和以前一样在内存中收集，最后保存为 data 下的 CSV
+    checkpoints: 传入时每一页的翻页位置随数据一起写入数据库（需要 sink），上次中断的视频从断点继续
+    """
+    if checkpoints is not None and sink is None:
+        raise ValueError("checkpoints require a sink")
     # 确保 'data' 文件夹存在
     if not os.path.exists("data"):
         os.makedirs("data")
-    # 评论部分
-    all_comments = await fetch_all_comments_async(aweme_id, cookie)
-    logging.info(f"Found {len(all_comments)} comments for aweme_id {aweme_id}.")
-
-    all_comments_ = process_comments(all_comments)
-    comments_filename = f"data/{aweme_id}_comments.csv"
-    save(all_comments_, comments_filename)
-
-    # 回复部分 如果不需要直接注释掉
-    all_replies = await fetch_all_replies_async(all_comments, cookie)
-    logging.info(f"Found {len(all_replies)} replies for aweme_id {aweme_id}.")
-    logging.info(f"Found {len(all_replies) + len(all_comments)} total for aweme_id {aweme_id}.")
-    
-    all_replies = process_replies(all_replies, all_comments_)
-    replies_filename = f"data/{aweme_id}_replies.csv"
-    save(all_replies, replies_filename)
+    watermark = watermarks.load(aweme_id) if watermarks is not None else None
+    resume = checkpoints.load(aweme_id) if checkpoints is not None else None
+    if resume is not None:
+        logging.info(f"Resuming aweme_id {aweme_id} from cursor {resume.cursor}, "
+                     f"{len(resume.threads)} reply threads unfinished.")
+    slot = session.video_slot(aweme_id)
+    collected = {"comments": [], "replies": []}
+    counts = {"comments": 0, "replies": 0}
+    pages = {"comments": 0, "replies": 0}
+    # 待抓的回复串排队，由固定数量的协程处理（视频的并发名额本来也只允许这么多请求同时进行），
+    # 评论很多的视频不会一次创建成千上万个任务
+    pending_threads: asyncio.Queue = asyncio.Queue()
+    failed = []
+
+    def emit(table_name: str, rows: pd.DataFrame, records: list[tuple]):
+        counts[table_name] += len(rows)
+        pages[table_name] += 1
+        if sink is not None:
+            sink.put(table_name, aweme_id, rows, records if checkpoints is not None else None)
+        else:
+            collected[table_name].append(rows)
+
+    # 回复部分：每拿到一页评论就开始抓这一页的回复，不需要回复时 fetch_replies=False
+    with tqdm(desc=f"Fetching replies {aweme_id}", unit="comment") as reply_pbar:
+        async def fetch_thread(thread: dict, nickname: str, cursor: int = 0):
+            # 一个回复串里的回复都指向同一条评论，知道评论作者就能找到被回复的人；
+            # 楼中楼回复的对象可能在前面的页里，所以昵称在整个回复串内累积
+            nicknames = {thread["cid"]: nickname}
+
+            def on_reply_page(replies: list, next_cursor: int, done: bool):
+                rows = process_replies(replies, nicknames)
+                nicknames.update(zip(rows["评论ID"].astype(str), rows["用户昵称"]))
+                emit("replies", rows, [checkpoint.reply_record(aweme_id, thread["cid"], next_cursor, done,
+                                                               thread["reply_comment_total"], nickname)])
+
+            await fetch_replies_for_comment(session, slot, thread, reply_pbar, on_page=on_reply_page, cursor=cursor)
+
+        def enqueue_thread(thread: dict, nickname: str, cursor: int = 0):
+            QUEUE_DEPTH.inc(1, "reply_threads")
+            pending_threads.put_nowait((thread, nickname, cursor))
+
+        async def reply_worker():
+            while True:
+                item = await pending_threads.get()
+                if item is None:
+                    return
+                try:
+                    await fetch_thread(*item)
+                except Exception as e:
+                    # 单个回复串重试后仍然失败时，其它回复串继续，已经抓到的数据照常保存
+                    failed.append(e)
+                finally:
+                    QUEUE_DEPTH.dec(1, "reply_threads")
+
+        def on_page(comments: list, next_cursor: int, done: bool):
+            records = [checkpoint.comment_record(aweme_id, next_cursor, done)]
+            threads = []
+            if fetch_replies:
+                for c in comments:
+                    if watermark is None or watermark.replies_changed(c):
+                        # 回复任务只保留需要的字段，不持有整条原始评论
+                        thread = {"cid": c["cid"], "reply_comment_total": c.get("reply_comment_total") or 0}
+                        nickname = (c.get("user") or {}).get("nickname")
+                        threads.append((thread, nickname))
+                        if thread["reply_comment_total"] > 0:
+                            records.append(checkpoint.reply_record(aweme_id, c["cid"], 0, False,
+                                                                   thread["reply_comment_total"], nickname))
+                    else:
+                        reply_pbar.update(1)
+            # 先放入这一页（和待抓的回复串），再启动回复任务，保证检查点按顺序写入
+            emit("comments", process_comments(comments), records)
+            for thread, nickname in threads:
+                enqueue_thread(thread, nickname)
+            if watermark is not None:
+                watermark.update(comments)
+
+        workers = [asyncio.create_task(reply_worker()) for _ in range(session.per_video_concurrency)]
+        try:
+            if resume is not None:
+                # 上次没翻完的回复串从各自的 cursor 继续
+                for cid, (cursor, total, nickname) in resume.threads.items():
+                    enqueue_thread({"cid": cid, "reply_comment_total": total}, nickname, cursor)
+            # 评论部分
+            if resume is None or not resume.done:
+                await fetch_all_comments_async(session, aweme_id, on_page=on_page, watermark=watermark,
+                                               collect=False, cursor=resume.cursor if resume is not None else 0)
+            logging.info(f"Found {counts['comments']} comments for aweme_id {aweme_id}.")
+            for _ in workers:
+                pending_threads.put_nowait(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+    logging.info(f"Found {counts['replies']} replies for aweme_id {aweme_id}.")
+    logging.info(f"Found {counts['replies'] + counts['comments']} total for aweme_id {aweme_id}.")
+    for kind, n in pages.items():
+        PAGES_PER_VIDEO.observe(n, kind)
+
+    if sink is not None:
+        await asyncio.to_thread(sink.flush)
+    else:
+        for table_name, frames in collected.items():
+            save(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(), f"data/{aweme_id}_{table_name}.csv")
+
+    if failed:
+        # 不推进水位、保留检查点，下次运行时继续抓失败的回复串
+        raise RuntimeError(f"{len(failed)} reply threads of aweme_id {aweme_id} failed, "
+                           f"first error: {failed[0]!r}") from failed[0]
+
+    if watermark is not None:
+        # 数据保存之后再推进水位
+        watermarks.save(watermark)
+    if checkpoints is not None:
+        # 整个视频已经完成，下次从头开始
+        checkpoints.clear(aweme_id)
+
+
+async def process_many(session: CrawlSession, aweme_ids: list, watermarks: WatermarkStore = None,
+                       sink: DatabaseSink = None, checkpoints: CheckpointStore = None):
+    """
+    同时抓取多个视频，请求总数受 session 的全局并发数限制；单个视频出错不影响其它视频
+    """
+    async def run(aweme_id):
+        async with session.videos:
+            await process_aweme_id(session, aweme_id, watermarks=watermarks, sink=sink, checkpoints=checkpoints)
+
+    results = await asyncio.gather(*(run(aweme_id) for aweme_id in aweme_ids), return_exceptions=True)
+    for aweme_id, result in zip(aweme_ids, results):
+        if isinstance(result, BaseException):
+            logging.error(f"Failed to process aweme_id {aweme_id}: {result}", exc_info=result)
+
+
+def export_csv(aweme_ids: list, fmt: str = "csv"):
+    # 可选的导出步骤：把数据库中每个视频的评论和回复导出到 data/{视频ID}_comments/replies.{fmt}
+    db = crdb()
+    try:
+        for aweme_id in aweme_ids:
+            for table_name in ("comments", "replies"):
+                db.export_video_csv(table_name, aweme_id, fmt=fmt)
+    finally:
+        db.close()
+
+
+async def crawl(config, transport: httpx.AsyncBaseTransport = None):
+    # 整个任务只用一个事件循环和一个连接池；transport 用于把请求转发到本地模拟服务器（见 benchmark.py e2e）
+    # JSON 汇总只统计本次运行
+    metrics.REGISTRY.reset_peaks()
+    snapshot = metrics.REGISTRY.snapshot()
+    started_at = time.time()
+    async with CrawlSession.from_config(config, transport) as session:
+        if config.query_type == "detail":
+            aweme_ids_main = config.aweme_ids
+        elif config.query_type == "creator":
+            store = CreatorVideoStore() if getattr(config, "creator_cache", True) else None
+            try:
+                videos = await get_creators_videos(session, config.creator_ids, config.count, store)
+            finally:
+                if store is not None:
+                    store.close()
+            aweme_ids_main = [video_info['aweme_id'] for video_info in videos]
+        watermarks = WatermarkStore() if getattr(config, "incremental", False) else None
+        checkpoints = CheckpointStore() if getattr(config, "checkpoint", True) else None
+        sink = DatabaseSink(incremental_csv=getattr(config, "incremental_csv", True),
+                            archive=archive.from_config(config))
+        QUEUE_DEPTH.set_function(lambda: getattr(signer.get_signer(), "pending", 0), "sign")
+        try:
+            await process_many(session, aweme_ids_main, watermarks, sink, checkpoints)
+        finally:
+            QUEUE_DEPTH.set_function(None, "sign")
+            if watermarks is not None:
+                watermarks.close()
+            if checkpoints is not None:
+                checkpoints.close()
+            sink.close()
+        logging.info("Data has been successfully stored in the database.")
+        if getattr(config, "export_csv", False):
+            export_csv(aweme_ids_main, getattr(config, "export_format", "csv"))
+        logging.info(f"Rate limiter: {session.limiter.metrics()}")
+        logging.info(f"Accounts: {session.accounts.metrics()}")
+        logging.info(f"Retries: {session.retry.metrics()}")
+        logging.info(f"Stages: {STAGES.summary()}")
+        if getattr(config, "metrics_summary", True):
+            metrics.write_summary(os.path.join(getattr(config, "logs_dir", "logs"), "run_summary.jsonl"), {
+                "started_at": datetime.fromtimestamp(started_at).strftime('%Y-%m-%d %H:%M:%S'),
+                "elapsed_s": round(time.time() - started_at, 3),
+                "query_type": config.query_type,
+                "videos": len(aweme_ids_main),
+                "sink": sink.metrics(),
+                "rate_limiter": session.limiter.metrics(),
+                "accounts": session.accounts.metrics(),
+                "retries": session.retry.metrics(),
+                "metrics": metrics.REGISTRY.summary(since=snapshot),
+            })
 
 
 def main():
@@ -285,28 +636,21 @@ def main():
 
     setup_logging(config.logs_dir)
     logging.info("Logging has been set up.")
+    signer.configure(getattr(config, "sign_backend", "pool"), getattr(config, "sign_workers", 2))
+    offload.configure_from_config(config)
+    if getattr(config, "metrics_port", 0):
+        metrics.serve(config.metrics_port)
 
     try:
-        if config.query_type == "detail":
-            aweme_ids_main = config.aweme_ids
-            for aweme_id in aweme_ids_main:
-                asyncio.run(process_aweme_id(aweme_id, config.cookie))
-        elif config.query_type == "creator":
-            aweme_ids_main = []
-            for creator_id in config.creator_ids:
-                aweme_ids_main.extend(asyncio.run(get_creator_awesome_id(creator_id, config.count, config.cookie)))
-            for video_info in aweme_ids_main:
-                asyncio.run(process_aweme_id(video_info['aweme_id'], config.cookie))
-                # print(video_info)
-        else:
+        if config.query_type not in ("detail", "creator"):
             logging.error(f"Invalid query_type: {config.query_type}")
             return
-        db = crdb()
-        db.process_data_folder()
-        db.close()
-        logging.info("Data has been successfully stored in the database.")
+        asyncio.run(crawl(config))
     except Exception as e:
         logging.error(f"An error occurred: {e}", exc_info=True)  # Log the error and stack trace
+    finally:
+        offload.close()
+        signer.close()
 
 
 # 运行 main 函数
@@ -0,0 +1,114 @@
+"""
+坏评论的匹配规则：关键词编译成一个 Aho-Corasick 自动机，一遍扫描同时匹配所有关键词；
+能安全合并的正则合并成一个表达式先过滤，其余的逐个匹配。
+
+规则文件每行一条，# 开头为注释：
+    关键词              普通关键词，不区分大小写
+    re:正则表达式        正则规则
+"""
+import re
+from collections import deque
+
+# 合并后会改变含义的正则：反向引用（编号会错位）和全局内联标志（如 (?x) 会作用到整个表达式）
+UNCOMBINABLE = re.compile(r"\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)")
+
+
+class AhoCorasick:
+    """多关键词匹配自动机，匹配时间只和文本长度（以及命中次数）有关，和关键词数量无关"""
+
+    def __init__(self, keywords: list[str]):
+        self.keywords = list(dict.fromkeys(k.casefold() for k in keywords if k))
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[tuple[int, ...]] = [()]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (index,)
+        # 按层构造失败指针，并把失败状态的输出合并进来
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def find(self, text: str) -> set[int]:
+        """返回文本中出现的关键词的下标"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text.casefold():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class RuleSet:
+    def __init__(self, keywords: list[str] = (), patterns: list[str] = ()):
+        self.automaton = AhoCorasick(keywords)
+        # 自动机中的关键词是 casefold 之后的，命中后换回规则原文；只有大小写不同的关键词保留第一条
+        originals = {}
+        for keyword in keywords:
+            if keyword:
+                originals.setdefault(keyword.casefold(), keyword)
+        self.keywords = [originals[k] for k in self.automaton.keywords]
+        self.patterns = [self._compile(p) for p in patterns]
+        # 可以合并的正则合并成一个，大多数评论一次 search 就能排除；命名分组合并后可能重名，也单独匹配
+        combinable = [p for p in self.patterns if not p.groupindex and not UNCOMBINABLE.search(p.pattern)]
+        self.separate = [p for p in self.patterns if p not in combinable]
+        self.combined = re.compile("|".join(f"(?:{p.pattern})" for p in combinable), re.IGNORECASE) \
+            if combinable else None
+
+    @staticmethod
+    def _compile(pattern: str) -> re.Pattern:
+        try:
+            return re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid rule re:{pattern}: {e}") from e
+
+    @classmethod
+    def load(cls, path: str) -> "RuleSet":
+        keywords, patterns = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("re:"):
+                    patterns.append(line[3:])
+                else:
+                    keywords.append(line)
+        return cls(keywords, patterns)
+
+    def __len__(self) -> int:
+        return len(self.automaton) + len(self.patterns)
+
+    def match(self, text: str) -> list[str]:
+        """返回命中的规则（关键词原文或 re:正则），没有命中时为空列表"""
+        if not text:
+            return []
+        hits = [self.keywords[i] for i in sorted(self.automaton.find(text))]
+        # 合并的表达式没有命中时只需要检查单独匹配的正则；结果按规则顺序排列
+        candidates = self.patterns if self.combined is not None and self.combined.search(text) else self.separate
+        hits += [f"re:{p.pattern}" for p in candidates if p.search(text)]
+        return hits
@@ -0,0 +1,326 @@
+"""
+抓取过程的指标：直方图、计数器和仪表，可以通过本地 HTTP 的 /metrics（Prometheus 文本格式）查看，
+每次运行结束后再写一份 JSON 汇总
+"""
+import bisect
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+# 秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def _escape(value) -> str:
+    # Prometheus 文本格式中标签值需要转义反斜杠、双引号和换行
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames: tuple, labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _label_key(labels: tuple) -> str:
+    # JSON 汇总中的键
+    return ",".join(str(value) for value in labels) or "all"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels):
+        labels = self._labels(labels)
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return self.header() + [f"{self.name}{_label_text(self.labelnames, labels)} {value}"
+                                    for labels, value in self.values.items()]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.values)
+
+    def summary(self, since: dict = None) -> dict:
+        since = since or {}
+        with self._lock:
+            return {_label_key(labels): value - since.get(labels, 0) for labels, value in self.values.items()}
+
+
+class Gauge(Metric):
+    """当前值；set_function 注册的值在读取时计算。peak 记录 reset_peaks 之后的最大值"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+        self.functions: dict[tuple, Callable[[], float]] = {}
+        self.peaks: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        labels = self._labels(labels)
+        with self._lock:
+            self.values[labels] = value
+            self.peaks[labels] = max(self.peaks.get(labels, value), value)
+
+    def inc(self, amount: float = 1, *labels):
+        labels = self._labels(labels)
+        with self._lock:
+            value = self.values.get(labels, 0) + amount
+            self.values[labels] = value
+            self.peaks[labels] = max(self.peaks.get(labels, value), value)
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+    def set_function(self, function: Callable[[], float], *labels):
+        labels = self._labels(labels)
+        with self._lock:
+            if function is None:
+                self.functions.pop(labels, None)
+            else:
+                self.functions[labels] = function
+
+    def sample(self):
+        """读取 set_function 注册的值，同时更新 peak"""
+        with self._lock:
+            functions = list(self.functions.items())
+        for labels, function in functions:
+            try:
+                self.set(function(), *labels)
+            except Exception as e:
+                logging.debug(f"Failed to sample {self.name}{labels}: {e}")
+
+    def render(self) -> list[str]:
+        self.sample()
+        with self._lock:
+            return self.header() + [f"{self.name}{_label_text(self.labelnames, labels)} {value}"
+                                    for labels, value in self.values.items()]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.peaks)
+
+    def reset_peaks(self):
+        """新的一次运行重新统计最大值，从当前值开始"""
+        with self._lock:
+            self.peaks = dict(self.values)
+
+    def summary(self, since: dict = None) -> dict:
+        self.sample()
+        with self._lock:
+            return {_label_key(labels): {"value": value, "peak": self.peaks.get(labels, value)}
+                    for labels, value in self.values.items()}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [每个桶的计数（最后一个是 +Inf）, 总和, 次数]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        labels = self._labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    label_text = _label_text(self.labelnames, labels, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {labels: [list(counts), total, count] for labels, (counts, total, count) in self.values.items()}
+
+    def quantile(self, q: float, counts: list) -> float:
+        """按桶线性插值估计分位数"""
+        count = sum(counts)
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            if n and cumulative + n >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = bound
+        return lower
+
+    def summary(self, since: dict = None) -> dict:
+        since = since or {}
+        result = {}
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.values.items()]
+        for labels, counts, total, count in items:
+            if labels in since:
+                before = since[labels]
+                counts = [a - b for a, b in zip(counts, before[0])]
+                total -= before[1]
+                count -= before[2]
+            if not count:
+                continue
+            result[_label_key(labels)] = {
+                "count": count,
+                "sum": round(total, 6),
+                "mean": round(total / count, 6),
+                "p50": round(self.quantile(0.5, counts), 6),
+                "p95": round(self.quantile(0.95, counts), 6),
+                "p99": round(self.quantile(0.99, counts), 6),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """记录当前的值，之后 summary(since=snapshot) 只统计这之后的部分"""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def summary(self, since: dict = None) -> dict:
+        since = since or {}
+        return {name: metric.summary(since.get(name)) for name, metric in self.metrics.items()}
+
+    def reset_peaks(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, Gauge):
+                metric.reset_peaks()
+
+
+REGISTRY = Registry()
+
+# 各阶段耗时：sign 签名、fetch 请求、parse 解析、normalize 整理、db 写库
+STAGES = REGISTRY.register(Histogram("douyin_stage_seconds", "Time spent in each pipeline stage", ("stage",)))
+HTTP_LATENCY = REGISTRY.register(Histogram("douyin_http_request_seconds", "HTTP request latency", ("endpoint",)))
+HTTP_RESPONSES = REGISTRY.register(Counter("douyin_http_responses_total", "HTTP responses by status",
+                                           ("endpoint", "status")))
+SEMAPHORE_WAIT = REGISTRY.register(Histogram("douyin_semaphore_wait_seconds",
+                                             "Time spent waiting for a concurrency slot", ("endpoint",)))
+QUEUE_DEPTH = REGISTRY.register(Gauge("douyin_queue_depth", "Items waiting in each queue", ("queue",)))
+PAGES_PER_VIDEO = REGISTRY.register(Histogram("douyin_pages_per_video", "Pages fetched per video", ("kind",),
+                                              buckets=COUNT_BUCKETS))
+DB_BATCH = REGISTRY.register(Histogram("douyin_db_batch_seconds", "Latency of one bulk insert", ("table",)))
+DB_ROWS = REGISTRY.register(Counter("douyin_db_rows_total", "Rows sent to the database", ("table", "result")))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = REGISTRY.render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/summary":
+            body = json.dumps(REGISTRY.summary(), ensure_ascii=False).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: ThreadingHTTPServer = None
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在后台线程中提供 /metrics 和 /summary。main.py 和常驻的 schedule.py 启动时各调用一次，
+    同一个进程中重复调用（例如在脚本里多次调用 main.main）时返回已经启动的服务
+    """
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"Metrics available at http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def write_summary(path: str, summary: dict):
+    """每次运行追加一行 JSON，便于比较不同运行之间的变化"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(summary, ensure_ascii=False, default=str) + "\n")
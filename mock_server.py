@@ -0,0 +1,241 @@
+"""
+本地模拟的抖音接口，用于在不访问线上的情况下压测整个抓取流程
+
+    python mock_server.py [--port 8765 --comments 2000 --replies 5 --latency 0.02 --throttle 0.01 --max-rps 0]
+
+提供的接口：
+    /?recommend=1                       首页，包含 webid
+    /aweme/v1/web/comment/list/         评论
+    /aweme/v1/web/comment/list/reply/   回复
+    /aweme/v1/web/aweme/post/           作者的视频列表
+    /__stats                            按接口统计的请求数
+
+数据按视频 ID 和评论 ID 确定性生成，同样的参数每次返回同样的内容
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+COMMENT_PATH = "/aweme/v1/web/comment/list/"
+REPLY_PATH = "/aweme/v1/web/comment/list/reply/"
+POST_PATH = "/aweme/v1/web/aweme/post/"
+BASE_TIME = 1726000000
+
+
+class MockDouyin:
+    """
+    comments: 每个视频的评论数；replies: 每条评论平均的回复数（指数分布，少数评论有很多回复）；
+    videos: 每个作者的视频数；latency: 每个请求的平均延迟（秒）；
+    throttle: 随机返回限流响应（429、空响应、验证码页面、空列表）的比例；error: 随机返回 5xx 的比例；
+    max_rps: 超过这个速率时返回 429，0 表示不限
+    """
+
+    def __init__(self, comments: int = 2000, replies: float = 5, videos: int = 10, latency: float = 0.02,
+                 throttle: float = 0.0, error: float = 0.0, max_rps: float = 0, seed: int = 0):
+        self.comments = comments
+        self.replies = replies
+        self.videos = videos
+        self.latency = latency
+        self.throttle = throttle
+        self.error = error
+        self.max_rps = max_rps
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.tokens = max_rps
+        self.updated_at = time.monotonic()
+
+    # --- 数据生成 ---
+
+    def reply_total(self, cid: str) -> int:
+        if self.replies <= 0:
+            return 0
+        return int(random.Random(f"{self.seed}:{cid}").expovariate(1 / self.replies))
+
+    def comment(self, aweme_id: str, index: int) -> dict:
+        cid = f"{aweme_id}{index:07d}"
+        return {
+            "cid": cid,
+            "text": f"评论 {index}\n第二行" if index % 10 == 0 else f"评论 {index}",
+            "create_time": BASE_TIME - index * 37,
+            "digg_count": index % 97,
+            "reply_comment_total": self.reply_total(cid),
+            "user": {"nickname": f"用户{index % 5000}", "sec_uid": f"sec{index % 5000}"},
+        }
+
+    def reply(self, cid: str, index: int) -> dict:
+        # 每隔几条回复一条楼中楼
+        target = f"{cid}{index - 1:05d}" if index % 4 == 3 else "0"
+        return {
+            "cid": f"{cid}{index:05d}",
+            "text": f"回复 {index}",
+            "create_time": BASE_TIME + index * 13,
+            "reply_id": cid,
+            "reply_to_reply_id": target,
+            "reply_to_username": f"回复者{(index - 1) % 300}" if target != "0" else "",
+            "user": {"nickname": f"回复者{index % 300}"},
+        }
+
+    def comment_page(self, query: dict) -> dict:
+        aweme_id = query.get("aweme_id", "0")
+        cursor, count = int(query.get("cursor", 0)), int(query.get("count", 20))
+        end = min(self.comments, cursor + count)
+        return {
+            "status_code": 0,
+            "comments": [self.comment(aweme_id, i) for i in range(cursor, end)],
+            "cursor": end,
+            "has_more": int(end < self.comments),
+            "total": self.comments,
+        }
+
+    def reply_page(self, query: dict) -> dict:
+        cid = query.get("comment_id", "0")
+        cursor, count = int(query.get("cursor", 0)), int(query.get("count", 20))
+        total = self.reply_total(cid)
+        end = min(total, cursor + count)
+        return {
+            "status_code": 0,
+            "comments": [self.reply(cid, i) for i in range(cursor, end)] or None,
+            "cursor": end,
+            "has_more": int(end < total),
+            "total": total,
+        }
+
+    def post_page(self, query: dict) -> dict:
+        creator = query.get("sec_user_id", "")
+        cursor, count = int(query.get("max_cursor") or 0), int(query.get("count", 18))
+        base = 7400000000000000000 + (sum(map(ord, creator)) % 1000) * 100000
+        end = min(self.videos, cursor + count)
+        return {
+            "status_code": 0,
+            "aweme_list": [{
+                "aweme_id": str(base + i),
+                "desc": f"视频 {i}",
+                "create_time": BASE_TIME - i * 86400,
+                "author": {"nickname": f"作者{creator[-4:]}"},
+            } for i in range(cursor, end)],
+            "max_cursor": end,
+            "has_more": int(end < self.videos),
+        }
+
+    # --- 限流和故障 ---
+
+    def over_limit(self) -> bool:
+        if not self.max_rps:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.max_rps, self.tokens + (now - self.updated_at) * self.max_rps)
+            self.updated_at = now
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+    def fault(self, key: str):
+        """随机故障，返回 (status, content_type, body) 或 None"""
+        with self.lock:
+            r = self.random.random()
+        if r < self.error:
+            return 502, "text/plain", b"bad gateway"
+        if r < self.error + self.throttle:
+            kind = int(r * 1e6) % 4
+            if kind == 0:
+                return 429, "text/plain", b"too many requests"
+            if kind == 1:
+                return 200, "application/json", b""
+            if kind == 2:
+                return 200, "text/html", b"<html><body>verify captcha</body></html>"
+            return 200, "application/json", json.dumps({"status_code": 0, key: [], "has_more": 1}).encode()
+        return None
+
+    def handle(self, path: str, query: dict):
+        routes = {
+            COMMENT_PATH: ("comments", self.comment_page),
+            REPLY_PATH: ("comments", self.reply_page),
+            POST_PATH: ("aweme_list", self.post_page),
+        }
+        if path == "/":
+            body = '<script>self.__pace_f.push([1,"{\\"user_unique_id\\":\\"7400000000000000001\\"}"])</script>'
+            return 200, "text/html", body.encode()
+        if path == "/__stats":
+            with self.lock:
+                return 200, "application/json", json.dumps(dict(self.stats)).encode()
+        if path not in routes:
+            return 404, "text/plain", b"not found"
+        key, page = routes[path]
+        if self.latency:
+            with self.lock:
+                delay = self.random.uniform(0.5, 1.5) * self.latency
+            time.sleep(delay)
+        if self.over_limit():
+            result = (429, "text/plain", b"too many requests")
+        else:
+            result = self.fault(key) or (200, "application/json",
+                                         json.dumps(page(query), ensure_ascii=False).encode())
+        with self.lock:
+            self.stats[path] += 1
+            self.stats[f"{path} {result[0]}"] += 1
+        return result
+
+
+def make_handler(mock: MockDouyin):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            status, content_type, body = mock.handle(parts.path, query)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(mock: MockDouyin, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--comments", type=int, default=2000, help="每个视频的评论数")
+    parser.add_argument("--replies", type=float, default=5, help="每条评论平均的回复数")
+    parser.add_argument("--videos", type=int, default=10, help="每个作者的视频数")
+    parser.add_argument("--latency", type=float, default=0.02, help="平均延迟（秒）")
+    parser.add_argument("--throttle", type=float, default=0.0, help="随机限流响应的比例")
+    parser.add_argument("--error", type=float, default=0.0, help="随机 5xx 的比例")
+    parser.add_argument("--max-rps", type=float, default=0, help="超过该速率返回 429，0 表示不限")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockDouyin(args.comments, args.replies, args.videos, args.latency, args.throttle, args.error,
+                      args.max_rps, args.seed)
+    server = serve(mock, args.host, args.port)
+    print(f"listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
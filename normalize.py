@@ -0,0 +1,142 @@
+"""
+评论/回复的整理：从接口返回的原始 JSON 中只取需要的字段放进列式缓冲区，
+再整列转换时间、清理换行，得到写入数据库的 DataFrame
+"""
+import logging
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+COMMENT_FIELDS = ("cid", "text", "create_time", "nickname")
+REPLY_FIELDS = COMMENT_FIELDS + ("reply_id", "reply_to_reply_id", "reply_to_username")
+
+
+class ColumnBuffer:
+    """按列保存记录，只保留需要的字段，不持有原始 JSON 对象"""
+
+    __slots__ = ("fields", "columns")
+
+    def __init__(self, fields: tuple[str, ...]):
+        self.fields = fields
+        self.columns: dict[str, list] = {field: [] for field in fields}
+
+    def __len__(self) -> int:
+        return len(self.columns[self.fields[0]])
+
+    def append(self, values: tuple):
+        for field, value in zip(self.fields, values):
+            self.columns[field].append(value)
+
+    def extend(self, other: "ColumnBuffer"):
+        for field in self.fields:
+            self.columns[field].extend(other.columns[field])
+
+
+class Page(list):
+    """接口返回的一页评论/回复，frame 是在子进程中提前整理好的结果（见 offload.py）"""
+
+    def __init__(self, items=(), frame: pd.DataFrame = None):
+        super().__init__(items)
+        self.frame = frame
+
+
+def extract_comments(comments: list[dict[str, Any]]) -> ColumnBuffer:
+    buffer = ColumnBuffer(COMMENT_FIELDS)
+    for c in comments:
+        try:
+            buffer.append((c["cid"], c["text"], c["create_time"], c["user"]["nickname"]))
+        except (KeyError, TypeError) as e:
+            logging.error(f"Error processing comment with 评论ID {c.get('cid')}: {e}")
+    return buffer
+
+
+def extract_replies(replies: list[dict[str, Any]]) -> ColumnBuffer:
+    buffer = ColumnBuffer(REPLY_FIELDS)
+    for c in replies:
+        try:
+            buffer.append((c["cid"], c["text"], c["create_time"], c["user"]["nickname"],
+                           c["reply_id"], c["reply_to_reply_id"], c["reply_to_username"]))
+        except (KeyError, TypeError) as e:
+            logging.error(f"Error processing reply with 评论ID {c.get('cid')}: {e}")
+    return buffer
+
+
+def _utc_offset(ts: int) -> int:
+    return int(datetime.fromtimestamp(ts).replace(tzinfo=timezone.utc).timestamp()) - ts
+
+
+def format_timestamps(values) -> np.ndarray:
+    """
+    与 datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S') 结果一致（本地时区），但整列计算。
+    时区偏移只会在整刻钟变化，所以只对去重后的刻钟计算一次偏移
+    """
+    ts = np.asarray(values, dtype=np.int64)
+    if ts.size == 0:
+        return np.array([], dtype=object)
+    quarters, inverse = np.unique(ts // 900, return_inverse=True)
+    offsets = np.array([_utc_offset(int(q) * 900) for q in quarters], dtype=np.int64)
+    local = (ts + offsets[inverse]).astype("datetime64[s]")
+    return np.char.replace(np.datetime_as_string(local, unit="s"), "T", " ").astype(object)
+
+
+def clean_text(values) -> pd.Series:
+    # 去除换行符
+    return pd.Series(values).astype(object).str.replace(r"[\r\n]", "", regex=True)
+
+
+def comments_frame(buffer: ColumnBuffer) -> pd.DataFrame:
+    columns = buffer.columns
+    return pd.DataFrame({
+        "评论ID": columns["cid"],
+        "评论内容": clean_text(columns["text"]),
+        "评论时间": format_timestamps(columns["create_time"]),
+        "用户昵称": columns["nickname"],
+    })
+
+
+def nickname_index(comments, replies=None) -> dict[str, str]:
+    """
+    评论ID -> 用户昵称，comments 可以是 comments_frame 的结果或者现成的映射；
+    回复本身（ColumnBuffer 或 replies_base_frame 的结果）也会加入索引
+    """
+    index = {}
+    if isinstance(comments, Mapping):
+        index.update((str(k), v) for k, v in comments.items())
+    elif comments is not None and not comments.empty:
+        index.update(zip(comments["评论ID"].astype(str), comments["用户昵称"]))
+    if isinstance(replies, ColumnBuffer):
+        index.update(zip(map(str, replies.columns["cid"]), replies.columns["nickname"]))
+    elif replies is not None:
+        index.update(zip(replies["评论ID"].astype(str), replies["用户昵称"]))
+    return index
+
+
+def replies_base_frame(buffer: ColumnBuffer) -> pd.DataFrame:
+    """与昵称索引无关的部分，"回复给谁" 暂时是接口给出的 reply_to_username，由 resolve_reply_targets 补全"""
+    columns = buffer.columns
+    reply_id = pd.Series(columns["reply_id"], dtype=object)
+    reply_to_reply_id = pd.Series(columns["reply_to_reply_id"], dtype=object)
+    # 回复的是某条回复时找那条回复的作者，否则找评论的作者
+    target = reply_to_reply_id.where(reply_to_reply_id.astype(str) != "0", reply_id)
+    return pd.DataFrame({
+        "评论ID": columns["cid"],
+        "评论内容": clean_text(columns["text"]),
+        "评论时间": format_timestamps(columns["create_time"]),
+        "用户昵称": columns["nickname"],
+        "回复的评论": reply_id,
+        "具体的回复对象": target,
+        "回复给谁": pd.Series(columns["reply_to_username"], dtype=object),
+    })
+
+
+def resolve_reply_targets(frame: pd.DataFrame, index: Mapping) -> pd.DataFrame:
+    reply_to_user = frame["具体的回复对象"].astype(str).map(index)
+    frame["回复给谁"] = reply_to_user.where(reply_to_user.notna() & (reply_to_user != ""), frame["回复给谁"])
+    return frame
+
+
+def replies_frame(buffer: ColumnBuffer, index: Mapping) -> pd.DataFrame:
+    return resolve_reply_targets(replies_base_frame(buffer), index)
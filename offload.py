@@ -0,0 +1,303 @@
+"""
+把请求准备（补全参数、拼接 query、签名）和响应解码（JSON 解析、限流判断、只保留需要的字段）放到进程池中执行，
+事件循环只负责收发网络请求。同一时刻的多个请求攒成一批提交，减少进程间通信的次数。
+offload = "inline" 时与原来一样在事件循环中直接执行
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import httpx
+
+import normalize
+import signer
+from common import PROFILES, DeviceProfile, common_async, prepare
+from metrics import QUEUE_DEPTH, STAGES
+from retry import RequestFailed, Throttled, parse_response
+
+# 各个列表中的元素只保留这些字段，其余（头像、表情、标签等）在子进程中丢弃，不再传回主进程
+KEEP_FIELDS = {
+    "comments": ("cid", "text", "create_time", "digg_count", "reply_comment_total",
+                 "reply_id", "reply_to_reply_id", "reply_to_username", "stick_position"),
+    "aweme_list": ("aweme_id", "desc", "create_time", "is_top"),
+}
+KEEP_NESTED = {
+    "comments": ("user", ("nickname",)),
+    "aweme_list": ("author", ("nickname",)),
+}
+
+
+# --- 在子进程中执行 ---
+
+_sign_in_worker = False
+
+
+def _init_worker(sign_backend: str):
+    # 纯 Python 签名可以直接在子进程中完成；node 进程池和 execjs 仍由主进程的签名器负责
+    global _sign_in_worker
+    _sign_in_worker = sign_backend == "python"
+
+
+def slim(data: dict, key: str) -> dict:
+    """只保留整理和翻页需要的字段"""
+    result = {k: v for k, v in data.items() if not isinstance(v, (dict, list))}
+    items = data.get(key)
+    if not isinstance(items, list):
+        result[key] = items
+        return result
+    fields = KEEP_FIELDS.get(key)
+    if fields is None:
+        result[key] = items
+        return result
+    nested, nested_fields = KEEP_NESTED[key]
+    slimmed = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        entry = {field: item[field] for field in fields if field in item}
+        child = item.get(nested)
+        if isinstance(child, dict):
+            entry[nested] = {field: child.get(field) for field in nested_fields}
+        slimmed.append(entry)
+    result[key] = slimmed
+    return result
+
+
+def prepare_batch(items: list[tuple]) -> list[tuple]:
+    """
+    items: (uri, params, headers, profile)；返回 (params, headers, call_name, query, a_bogus)，
+    a_bogus 为 None 时由主进程签名
+    """
+    results = [prepare(uri, params, headers, profile) + (None,) for uri, params, headers, profile in items]
+    if _sign_in_worker:
+        from abogus import sign_batch
+        signs = sign_batch([(call_name, query, headers["User-Agent"])
+                            for params, headers, call_name, query, _ in results])
+        results = [result[:4] + (a_bogus,) for result, a_bogus in zip(results, signs)]
+    return results
+
+
+def normalize_page(data: dict, page: str) -> dict:
+    """把评论/回复列表换成带有整理结果的 normalize.Page，主进程的 process_comments/process_replies 直接使用"""
+    items = data.get("comments")
+    if not isinstance(items, list) or not items:
+        return data
+    if page == "comments":
+        frame = normalize.comments_frame(normalize.extract_comments(items))
+    else:
+        frame = normalize.replies_base_frame(normalize.extract_replies(items))
+    data["comments"] = normalize.Page(items, frame)
+    return data
+
+
+def decode_batch(items: list[tuple]) -> list[tuple]:
+    """
+    items: (status_code, content_type, content, key, page)，page 为 comments/replies 时顺便整理这一页；
+    返回 ("ok", data) 或 ("error", 异常类名, 信息, 是否可重试)（异常对象跨进程会丢掉 retryable）
+    """
+    results = []
+    for status, content_type, content, key, page in items:
+        response = httpx.Response(status, headers={"content-type": content_type}, content=content)
+        try:
+            data = slim(parse_response(response), key)
+            results.append(("ok", normalize_page(data, page) if page else data))
+        except RequestFailed as e:
+            results.append(("error", type(e).__name__, str(e), e.retryable))
+    return results
+
+
+# --- 在主进程中执行 ---
+
+class _Batcher:
+    """
+    把同一时刻提交的调用攒成一批，达到 batch_size 或等待 window 秒后一起交给进程池。
+    进程池不可用（子进程崩溃、已经关闭）时这一批在主进程中直接执行，并由 owner 重建进程池
+    """
+
+    def __init__(self, name: str, owner: "Offloader", fn, batch_size: int, window: float):
+        self.name = name
+        self.owner = owner
+        self.fn = fn
+        self.batch_size = batch_size
+        self.window = window
+        self.pending: list[tuple[tuple, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle = None
+        self.in_flight = 0
+
+    async def submit(self, item: tuple):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        pool = self.owner.pool
+        try:
+            if pool is None:
+                raise RuntimeError("offload pool is closed")
+            task = asyncio.wrap_future(pool.submit(self.fn, [item for item, _ in batch]))
+        except (BrokenProcessPool, RuntimeError) as e:
+            self.owner.restart(pool, e)
+            self._run_inline(batch)
+            return
+        self.in_flight += len(batch)
+        task.add_done_callback(lambda done: self._deliver(batch, done, pool))
+
+    def _run_inline(self, batch: list):
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _deliver(self, batch: list, done: asyncio.Future, pool: ProcessPoolExecutor):
+        self.in_flight -= len(batch)
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            # 子进程崩溃，这一批改在主进程中执行
+            self.owner.restart(pool, done.exception())
+            self._run_inline(batch)
+            return
+        if done.cancelled() or done.exception() is not None:
+            error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, done.result()):
+            if not future.done():
+                future.set_result(result)
+
+
+class Offloader:
+    """
+    mode: inline（在事件循环中执行）或 process（进程池）；workers: 进程数，0 表示 CPU 核数；
+    batch_size / batch_window: 攒批的条数和最长等待时间（秒）；
+    min_decode_bytes: 小于这个大小的响应直接在主进程解析，进程间传输的开销比解析本身还大
+    """
+
+    def __init__(self, mode: str = "inline", workers: int = 0, batch_size: int = 32, batch_window: float = 0.002,
+                 min_decode_bytes: int = 16384, sign_backend: str = "pool"):
+        if mode not in ("inline", "process"):
+            raise ValueError(f"Invalid offload mode: {mode}")
+        self.mode = mode
+        self.min_decode_bytes = min_decode_bytes
+        self.pool: ProcessPoolExecutor = None
+        self.workers = workers or os.cpu_count() or 1
+        self.sign_backend = sign_backend
+        self.restarts = 0
+        if mode == "process":
+            workers = self.workers
+            self.pool = self._new_pool()
+            self.preparer = _Batcher("prepare", self, prepare_batch, batch_size, batch_window)
+            self.decoder = _Batcher("decode", self, decode_batch, batch_size, batch_window)
+            QUEUE_DEPTH.set_function(lambda: self.preparer.in_flight + self.decoder.in_flight, "offload")
+            logging.info(f"Offloading request preparation and decoding to {workers} processes.")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn：主进程中已经有写库线程和签名进程的读线程，fork 不安全（Windows 上也只有 spawn）
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.sign_backend,))
+
+    def restart(self, pool: ProcessPoolExecutor, error: Exception):
+        """pool 不可用时换一个新的进程池；已经关闭、或者已经被另一个批次换掉时什么都不做"""
+        if self.pool is None or self.pool is not pool:
+            return
+        logging.warning(f"Offload pool failed ({type(error).__name__}: {error}), restarting it.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self._new_pool()
+        self.restarts += 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.pool is not None
+
+    async def sign(self, uri: str, params: dict, headers: dict,
+                   client: httpx.AsyncClient = None) -> tuple[dict, dict]:
+        """与 common.common_async 相同，返回签好名的 params 和 headers"""
+        if not self.enabled:
+            return await common_async(uri, params, headers, client)
+        cookie = headers.get('cookie') or headers.get('Cookie')
+        profile: DeviceProfile = await PROFILES.get(cookie, client) if cookie else None
+        with STAGES.time("sign"):
+            params, headers, call_name, query, a_bogus = await self.preparer.submit((uri, params, headers, profile))
+            if a_bogus is None:
+                a_bogus, = await signer.get_signer().sign_many([(call_name, query, headers["User-Agent"])])
+        params["a_bogus"] = a_bogus
+        return params, headers
+
+    async def decode(self, response: httpx.Response, key: str = "comments") -> dict:
+        """
+        与 retry.parse_response 相同；进程池模式下只返回 slim 之后的数据，评论和回复（按请求的地址区分）
+        同时在子进程中整理好
+        """
+        if not self.enabled or len(response.content) < self.min_decode_bytes:
+            with STAGES.time("parse"):
+                return parse_response(response)
+        page = None
+        if key == "comments":
+            page = "replies" if "reply" in response.request.url.path else "comments"
+        with STAGES.time("parse"):
+            result = await self.decoder.submit((response.status_code, response.headers.get("content-type", ""),
+                                                response.content, key, page))
+        if result[0] == "ok":
+            return result[1]
+        _, kind, message, retryable = result
+        if kind == Throttled.__name__:
+            raise Throttled(message, retryable)
+        raise RequestFailed(message, retryable)
+
+    def close(self):
+        if self.pool is not None:
+            QUEUE_DEPTH.set_function(None, "offload")
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+
+_offloader: Offloader = None
+_settings: dict = {"mode": "inline"}
+
+
+def configure(mode: str = "inline", workers: int = 0, batch_size: int = 32, sign_backend: str = "pool"):
+    """与 signer.configure 类似，进程池在第一次使用时创建"""
+    global _settings
+    settings = {"mode": mode, "workers": workers, "batch_size": batch_size, "sign_backend": sign_backend}
+    if _offloader is not None and settings != _settings:
+        close()
+    _settings = settings
+
+
+def get_offloader() -> Offloader:
+    global _offloader
+    if _offloader is None:
+        _offloader = Offloader(**_settings)
+    return _offloader
+
+
+def close():
+    global _offloader
+    if _offloader is not None:
+        _offloader.close()
+        _offloader = None
+
+
+def configure_from_config(config):
+    configure(getattr(config, "offload", "inline"), getattr(config, "offload_workers", 0),
+              getattr(config, "offload_batch", 32), getattr(config, "sign_backend", "pool"))
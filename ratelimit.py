@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+# 这些状态码视为被限流，需要降速
+THROTTLE_STATUS = {403, 429, 500, 502, 503, 504}
+
+
+def is_throttled(response: httpx.Response) -> bool:
+    """
+    只根据状态码和响应头判断是否被限流：状态码异常、返回空内容，或者返回的是验证码页面。
+    不解析正文，JSON 中的 status_code 由解码（retry.parse_response，可能在子进程中）判断
+    """
+    if response.status_code in THROTTLE_STATUS or response.status_code >= 500:
+        return True
+    if not response.content:
+        return True
+    return "html" in response.headers.get("content-type", "")
+
+
+class TokenBucket:
+    """
+    令牌桶，速率按 AIMD 自适应：每次成功加性增加，被限流时乘性减少
+    """
+
+    def __init__(self, rate: float = 3.0, burst: float = 3.0, min_rate: float = 0.2, max_rate: float = 20.0,
+                 increase: float = 0.05, decrease: float = 0.5, cooldown: float = 2.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        # 并发请求可能同时被限流，冷却时间内只降速一次
+        self.cooldown = cooldown
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.last_backoff = 0.0
+        self._lock = asyncio.Lock()
+        # metrics
+        self.successes = 0
+        self.throttled = 0
+        self.backoffs = 0
+        self.wait_time = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self) -> float:
+        """当前可用的令牌数，用于在多个账号之间选择剩余额度最多的一个"""
+        self._refill(time.monotonic())
+        return self.tokens
+
+    async def acquire(self):
+        # 加锁保证等待者按先后顺序拿到令牌
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.wait_time += wait
+                await asyncio.sleep(wait)
+
+    def on_success(self):
+        self.successes += 1
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self.last_backoff < self.cooldown:
+            return
+        self.last_backoff = now
+        self.backoffs += 1
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0)
+        logging.warning(f"Throttled, backing off to {self.rate:.2f} req/s.")
+
+    def metrics(self) -> dict:
+        return {
+            "rate": round(self.rate, 3),
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "backoffs": self.backoffs,
+            "wait_s": round(self.wait_time, 3),
+        }
+
+
+class RateLimiter:
+    """
+    按接口（per="endpoint"）、按 cookie（per="cookie"）或两者组合（per="both"）分别限速
+    """
+
+    def __init__(self, per: str = "both", **bucket_kwargs):
+        if per not in ("endpoint", "cookie", "both"):
+            raise ValueError(f"Invalid rate_limit_per: {per}")
+        self.per = per
+        self.bucket_kwargs = bucket_kwargs
+        self.buckets: dict[str, TokenBucket] = {}
+
+    @classmethod
+    def from_config(cls, config) -> "RateLimiter":
+        return cls(
+            per=getattr(config, "rate_limit_per", "both"),
+            rate=getattr(config, "rate_limit", 3.0),
+            burst=getattr(config, "rate_limit_burst", 3.0),
+            min_rate=getattr(config, "rate_limit_min", 0.2),
+            max_rate=getattr(config, "rate_limit_max", 20.0),
+        )
+
+    def key(self, url: str, cookie: str = "") -> str:
+        endpoint = urlsplit(url).path
+        if self.per == "endpoint":
+            return endpoint
+        # 不直接用 cookie 作为 key，避免在日志和指标里泄露；用固定的摘要而不是 hash()（每个进程的随机种子不同）
+        account = f"cookie-{hashlib.sha256(cookie.encode()).hexdigest()[:8]}"
+        if self.per == "cookie":
+            return account
+        return f"{endpoint}@{account}"
+
+    def bucket(self, url: str, cookie: str = "") -> TokenBucket:
+        key = self.key(url, cookie)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(**self.bucket_kwargs)
+        return self.buckets[key]
+
+    def metrics(self) -> dict:
+        return {key: bucket.metrics() for key, bucket in self.buckets.items()}
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+T = TypeVar("T")
+
+
+class RequestFailed(Exception):
+    """请求失败（5xx、无法解析的响应、网络错误等），retryable 为 False 时不再重试"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Throttled(RequestFailed):
+    """被限流：429/403、空响应、验证码页面、status_code 不为 0、还有更多却返回空列表"""
+
+
+def parse_response(response: httpx.Response) -> dict:
+    """
+    检查响应并解析 JSON，被限流时抛出 Throttled，其它失败抛出 RequestFailed
+    """
+    status = response.status_code
+    if status in (403, 429):
+        raise Throttled(f"HTTP {status}")
+    if status >= 500:
+        raise RequestFailed(f"HTTP {status}")
+    if status >= 400:
+        raise RequestFailed(f"HTTP {status}", retryable=False)
+    if not response.content:
+        raise Throttled("empty body")
+    try:
+        data = response.json()
+    except ValueError:
+        # 触发风控时返回的是验证码页面而不是 JSON
+        if "html" in response.headers.get("content-type", "") or response.content.lstrip()[:1] == b"<":
+            raise Throttled("captcha page")
+        raise RequestFailed("invalid JSON")
+    if not isinstance(data, dict):
+        raise RequestFailed(f"unexpected response type {type(data).__name__}")
+    if data.get("status_code", 0) not in (0, None):
+        raise Throttled(f"status_code {data.get('status_code')}: {data.get('status_msg', '')}")
+    return data
+
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器：连续 failure_threshold 次失败后打开，暂停该接口的所有请求 reset_timeout 秒；
+    之后只放行一个试探请求，成功则恢复，失败则再次打开
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        # metrics
+        self.opens = 0
+
+    async def wait(self) -> float:
+        """等到允许发请求为止，返回等待的时间"""
+        waited = 0.0
+        while True:
+            if self.state == "closed":
+                return waited
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                    waited += remaining
+                    continue
+                self.state = "half_open"
+                self._probing = False
+            if not self._probing:
+                self._probing = True
+                return waited
+            # 试探请求还没有结果，其它请求继续等待
+            delay = min(1.0, self.reset_timeout)
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        if self.state != "closed":
+            logging.info(f"Circuit for {self.name} closed.")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+            self.opens += 1
+            logging.warning(f"Circuit for {self.name} opened after {self.failures} failures, "
+                            f"pausing for {self.reset_timeout}s.")
+
+    def release(self):
+        # 试探请求被取消时，让下一个请求继续试探
+        if self.state == "half_open":
+            self._probing = False
+
+
+class RetryPolicy:
+    """
+    有限次数的重试，指数退避加随机抖动；每个接口一个熔断器。
+    lost_s 是因重试多花的时间（各请求累加）：成功前失败的尝试、退避和熔断等待；重试用尽的请求整个计入
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: dict[str, CircuitBreaker] = {}
+        # metrics
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.gave_up = 0
+        self.lost_time = 0.0
+        self.backoff_time = 0.0
+        self.breaker_wait = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> "RetryPolicy":
+        return cls(
+            max_retries=getattr(config, "retry_max", 3),
+            base_delay=getattr(config, "retry_base_delay", 0.5),
+            max_delay=getattr(config, "retry_max_delay", 30.0),
+            failure_threshold=getattr(config, "breaker_failures", 5),
+            reset_timeout=getattr(config, "breaker_reset", 30.0),
+        )
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        endpoint = urlsplit(url).path
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter：在 [0, base * 2^attempt] 中随机，避免并发请求同时重试
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, url: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行 attempt()，失败时按策略重试，重试用尽后抛出最后一次的异常
+        """
+        breaker = self.breaker(url)
+        self.calls += 1
+        started = time.monotonic()
+        for n in range(self.max_retries + 1):
+            self.breaker_wait += await breaker.wait()
+            attempt_started = time.monotonic()
+            try:
+                result = await attempt()
+            except Throttled as e:
+                # 限流由令牌桶降速处理，说明接口本身是通的，不计入熔断
+                error = e
+                self.throttled += 1
+                breaker.on_success()
+            except (RequestFailed, httpx.TransportError) as e:
+                error = e
+                self.failures += 1
+                breaker.on_failure()
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.on_success()
+                if n:
+                    # 只有最后一次成功的尝试是必要的，之前的时间都是重试造成的
+                    self.lost_time += attempt_started - started
+                return result
+
+            if n == self.max_retries or not getattr(error, "retryable", True):
+                self.gave_up += 1
+                self.lost_time += time.monotonic() - started
+                raise error
+            delay = self.backoff(n)
+            logging.warning(f"Request to {breaker.name} failed ({error!r}), "
+                            f"retry {n + 1}/{self.max_retries} in {delay:.2f}s.")
+            self.retries += 1
+            self.backoff_time += delay
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "gave_up": self.gave_up,
+            "lost_s": round(self.lost_time, 3),
+            "backoff_s": round(self.backoff_time, 3),
+            "breaker_wait_s": round(self.breaker_wait, 3),
+            "breaker_opens": {name: breaker.opens for name, breaker in self.breakers.items() if breaker.opens},
+        }
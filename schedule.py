@@ -1,34 +1,32 @@
-from apscheduler.schedulers.blocking import BlockingScheduler
-from datetime import datetime
-from main import *
+"""
+自适应定时抓取：每个视频按自己的评论新增速度决定多久重新抓一次（见 scheduler.py），
+取代原来每天固定 4 个时间点抓取全部视频的方式
 
-# 定义任务
-def scheduled_task():
-    try:
-        main()
-        logging.info('Task all done!')
-    except Exception as e:
-        logging.error(f"An error occurred during the task: {e}", exc_info=True)
-    logging.info(f"任务执行时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    python schedule.py
+"""
+import logging
+
+import metrics
+import scheduler
+from main import check_and_initialize_config, setup_logging
 
-# 创建调度器
-scheduler = BlockingScheduler()
 
-# 每天早上7:30执行任务，并设置容错时间为1小时
-scheduler.add_job(scheduled_task, 'cron', hour=7, minute=30, misfire_grace_time=3600)
+def main():
+    check_and_initialize_config()
+    import config  # 需要先确保 config.py 存在
 
-# 每天中午11:30执行任务
-scheduler.add_job(scheduled_task, 'cron', hour=11, minute=30, misfire_grace_time=3600)
+    setup_logging(config.logs_dir)
+    if getattr(config, "metrics_port", 0):
+        metrics.serve(config.metrics_port)
 
-# 每天下午5:30执行任务
-scheduler.add_job(scheduled_task, 'cron', hour=17, minute=30, misfire_grace_time=3600)
+    # 启动调度器
+    try:
+        logging.info("调度器开始运行...")
+        scheduler.run(config)
+    except (KeyboardInterrupt, SystemExit):
+        pass
 
-# 每天晚上7:30执行任务
-scheduler.add_job(scheduled_task, 'cron', hour=19, minute=30, misfire_grace_time=3600)
 
-# 启动调度器
-try:
-    logging.info("调度器开始运行...")
-    scheduler.start()
-except (KeyboardInterrupt, SystemExit):
-    pass
+# offload = "process" 时子进程（spawn）会重新导入 __main__，不能在导入时启动调度器
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+自适应调度：根据每个视频评论（和回复）的新增速度决定多久重新抓一次。
+热门视频很快就会重新抓取，没有新评论的视频间隔逐渐拉长到 max_interval。
+整个进程只用一个事件循环、一个连接池和一个写库线程
+"""
+import asyncio
+import heapq
+import logging
+import sqlite3
+import time
+
+import archive
+import offload
+import signer
+from checkpoint import CheckpointStore
+from creators import CreatorVideoStore
+from main import get_creators_videos, process_aweme_id
+from metrics import QUEUE_DEPTH
+from session import CrawlSession
+from sink import DatabaseSink
+from watermark import WatermarkStore
+
+# 新增速度的指数平滑系数，越大越偏向最近一次的结果
+RATE_SMOOTHING = 0.5
+
+
+class VideoState:
+    """
+    rate: 平滑后的新增速度（条/小时）；interval: 当前的重抓间隔（秒）
+    """
+
+    def __init__(self, aweme_id, rate: float = None, interval: float = 0, last_run: float = None,
+                 next_run: float = 0, failures: int = 0):
+        self.aweme_id = str(aweme_id)
+        self.rate = rate
+        self.interval = interval
+        self.last_run = last_run
+        self.next_run = next_run
+        self.failures = failures
+
+    def backlog(self, now: float) -> float:
+        """预计积压的新评论数，用作优先级；第一次抓取的视频优先"""
+        if self.last_run is None or self.rate is None:
+            return float("inf")
+        return self.rate * (now - self.last_run) / 3600
+
+    def __lt__(self, other: "VideoState") -> bool:
+        return self.next_run < other.next_run
+
+
+class ScheduleStore:
+    def __init__(self, db_path: str = "comments_replies.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS video_schedule (
+            aweme_id TEXT PRIMARY KEY,
+            rate REAL,
+            interval REAL,
+            last_run REAL,
+            next_run REAL,
+            failures INTEGER
+        )
+        ''')
+        self.conn.commit()
+
+    def load_all(self) -> dict[str, VideoState]:
+        rows = self.conn.execute(
+            "SELECT aweme_id, rate, interval, last_run, next_run, failures FROM video_schedule").fetchall()
+        return {row[0]: VideoState(*row) for row in rows}
+
+    def save(self, state: VideoState):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO video_schedule (aweme_id, rate, interval, last_run, next_run, failures) "
+                "VALUES (?,?,?,?,?,?) ON CONFLICT(aweme_id) DO UPDATE SET rate=excluded.rate, "
+                "interval=excluded.interval, last_run=excluded.last_run, next_run=excluded.next_run, "
+                "failures=excluded.failures",
+                (state.aweme_id, state.rate, state.interval, state.last_run, state.next_run, state.failures),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class AdaptiveScheduler:
+    """
+    target_new: 希望每次重抓时大约有这么多条新评论/回复，间隔 = target_new / 新增速度；
+    没有新增时间隔翻倍，限制在 [min_interval, max_interval] 之间；
+    creator_refresh: creator 模式下多久重新获取一次作者的视频列表（秒）
+    """
+
+    def __init__(self, config, target_new: float = 50, min_interval: float = 600, max_interval: float = 86400,
+                 creator_refresh: float = 21600):
+        self.config = config
+        self.target_new = target_new
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.creator_refresh = creator_refresh
+        self.max_parallel = getattr(config, "max_parallel_videos", 8)
+        self.store = ScheduleStore()
+        self.creator_store = CreatorVideoStore() if getattr(config, "creator_cache", True) else None
+        self.states = self.store.load_all()
+        self.heap: list[VideoState] = []
+        # 在队列中或正在抓取的视频
+        self.active: set[str] = set()
+        self.next_creator_refresh = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> "AdaptiveScheduler":
+        return cls(
+            config,
+            target_new=getattr(config, "schedule_target_new", 50),
+            min_interval=getattr(config, "schedule_min_interval", 600),
+            max_interval=getattr(config, "schedule_max_interval", 86400),
+            creator_refresh=getattr(config, "schedule_creator_refresh", 21600),
+        )
+
+    def add(self, aweme_id):
+        aweme_id = str(aweme_id)
+        if aweme_id in self.active:
+            return
+        self.active.add(aweme_id)
+        state = self.states.setdefault(aweme_id, VideoState(aweme_id, next_run=time.time()))
+        heapq.heappush(self.heap, state)
+
+    def update(self, state: VideoState, new_rows: int, now: float):
+        """根据本次新增的行数更新新增速度和下次抓取的时间"""
+        if state.last_run is not None:
+            observed = new_rows / max(now - state.last_run, 1) * 3600
+            state.rate = observed if state.rate is None else \
+                RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * state.rate
+        if state.rate:
+            interval = self.target_new / state.rate * 3600
+        elif state.last_run is None:
+            # 第一次抓取还没有速度，尽快再抓一次
+            interval = self.min_interval
+        else:
+            interval = (state.interval or self.min_interval) * 2
+        state.interval = min(self.max_interval, max(self.min_interval, interval))
+        state.last_run = now
+        state.next_run = now + state.interval
+        state.failures = 0
+
+    def fail(self, state: VideoState, now: float):
+        state.failures += 1
+        state.next_run = now + min(self.max_interval, self.min_interval * 2 ** (state.failures - 1))
+
+    async def refresh_videos(self, session: CrawlSession):
+        config = self.config
+        if config.query_type == "detail":
+            for aweme_id in config.aweme_ids:
+                self.add(aweme_id)
+            self.next_creator_refresh = float("inf")
+            return
+        # 只翻到已知的视频为止，失败的作者使用缓存中的列表
+        for video in await get_creators_videos(session, config.creator_ids, config.count, self.creator_store):
+            self.add(video["aweme_id"])
+        self.next_creator_refresh = time.time() + self.creator_refresh
+
+    async def crawl_one(self, session: CrawlSession, state: VideoState, sink: DatabaseSink,
+                        watermarks: WatermarkStore, checkpoints: CheckpointStore):
+        try:
+            await process_aweme_id(session, state.aweme_id, watermarks=watermarks, sink=sink,
+                                   checkpoints=checkpoints)
+        except Exception as e:
+            logging.error(f"Failed to process aweme_id {state.aweme_id}: {e}", exc_info=True)
+            self.fail(state, time.time())
+        else:
+            self.update(state, sink.take_new_rows(state.aweme_id), time.time())
+            logging.info(f"aweme_id {state.aweme_id}: {state.rate or 0:.1f} new/h, "
+                         f"next crawl in {state.interval / 60:.0f} min.")
+        self.store.save(state)
+        heapq.heappush(self.heap, state)
+
+    async def run(self, transport=None):
+        """一直运行直到被取消；transport 同 main.crawl"""
+        config = self.config
+        # 调度器总是增量抓取，否则每次都要重新翻完所有评论
+        async with CrawlSession.from_config(config, transport) as session:
+            watermarks = WatermarkStore()
+            checkpoints = CheckpointStore() if getattr(config, "checkpoint", True) else None
+            sink = DatabaseSink(incremental_csv=getattr(config, "incremental_csv", True),
+                                archive=archive.from_config(config))
+            running: set[asyncio.Task] = set()
+            try:
+                while True:
+                    now = time.time()
+                    if now >= self.next_creator_refresh:
+                        await self.refresh_videos(session)
+                    # 到期的视频按预计积压的新评论数排序，积压多的先抓
+                    due = []
+                    while self.heap and self.heap[0].next_run <= now:
+                        due.append(heapq.heappop(self.heap))
+                    due.sort(key=lambda state: state.backlog(now), reverse=True)
+                    while due and len(running) < self.max_parallel:
+                        state = due.pop(0)
+                        running.add(asyncio.create_task(self.crawl_one(session, state, sink, watermarks,
+                                                                       checkpoints)))
+                    for state in due:
+                        heapq.heappush(self.heap, state)
+                    QUEUE_DEPTH.set(len(due), "due_videos")
+
+                    wake = min(self.heap[0].next_run if self.heap else float("inf"), self.next_creator_refresh)
+                    timeout = min(3600.0, max(1.0, wake - time.time()))
+                    if running:
+                        if len(running) >= self.max_parallel:
+                            timeout = None
+                        done, running = await asyncio.wait(running, timeout=timeout,
+                                                           return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        await asyncio.sleep(timeout)
+            finally:
+                for task in running:
+                    task.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                watermarks.close()
+                if checkpoints is not None:
+                    checkpoints.close()
+                sink.close()
+                self.store.close()
+                if self.creator_store is not None:
+                    self.creator_store.close()
+                logging.info(f"Rate limiter: {session.limiter.metrics()}")
+                logging.info(f"Retries: {session.retry.metrics()}")
+
+
+def run(config):
+    signer.configure(getattr(config, "sign_backend", "pool"), getattr(config, "sign_workers", 2))
+    offload.configure_from_config(config)
+    try:
+        asyncio.run(AdaptiveScheduler.from_config(config).run())
+    finally:
+        offload.close()
+        signer.close()
@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import logging
+import time
+import httpx
+from ratelimit import RateLimiter, is_throttled
+from accounts import AccountPool
+from retry import RetryPolicy
+from urllib.parse import urlsplit
+from metrics import STAGES, HTTP_LATENCY, HTTP_RESPONSES, SEMAPHORE_WAIT
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class VideoSlot:
+    """
+    单个视频的请求配额：先占用视频自己的并发数，再占用全局并发数。
+    每个视频最多占用 per_video 个全局名额，评论很多的视频不会把其他视频饿死
+    """
+
+    def __init__(self, local: asyncio.Semaphore, budget: asyncio.Semaphore):
+        self.local = local
+        self.budget = budget
+
+    async def __aenter__(self):
+        await self.local.acquire()
+        try:
+            await self.budget.acquire()
+        except BaseException:
+            self.local.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.budget.release()
+        self.local.release()
+
+
+class CrawlSession:
+    """
+    一次爬取任务共享的连接池，整个任务在同一个事件循环里复用 TLS 连接
+    """
+
+    def __init__(self, http2: bool = True, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 60, timeout: float = 600, max_concurrency: int = 10,
+                 per_video_concurrency: int = 4, max_parallel_videos: int = 8, limiter: RateLimiter = None,
+                 cookies: list[str] = None, retry: RetryPolicy = None,
+                 transport: httpx.AsyncBaseTransport = None):
+        if http2 and not HTTP2_AVAILABLE:
+            logging.warning("h2 is not installed, falling back to HTTP/1.1. Run `pip install httpx[http2]` to enable it.")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 30))
+        # 自定义 transport（例如 benchmark 中转发到本地模拟服务器），此时 http2 和连接数限制由 transport 决定
+        self.transport = transport
+        self.client: httpx.AsyncClient = None
+        # 全局同时在途的请求数
+        self.budget = asyncio.Semaphore(max_concurrency)
+        self.per_video_concurrency = per_video_concurrency
+        # 同时处理的视频数
+        self.videos = asyncio.Semaphore(max_parallel_videos)
+        self._slots: dict[str, VideoSlot] = {}
+        self.limiter = limiter or RateLimiter()
+        # 账号池，每次请求从中选择一个 cookie
+        self.accounts = AccountPool(cookies or [''], self.limiter)
+        # 重试、退避和每个接口的熔断器
+        self.retry = retry or RetryPolicy()
+
+    @classmethod
+    def from_config(cls, config, transport: httpx.AsyncBaseTransport = None) -> "CrawlSession":
+        return cls(
+            http2=getattr(config, "http2", True),
+            max_connections=getattr(config, "max_connections", 20),
+            max_keepalive_connections=getattr(config, "max_keepalive_connections", 10),
+            keepalive_expiry=getattr(config, "keepalive_expiry", 60),
+            max_concurrency=getattr(config, "max_concurrency", 10),
+            per_video_concurrency=getattr(config, "per_video_concurrency", 4),
+            max_parallel_videos=getattr(config, "max_parallel_videos", 8),
+            limiter=RateLimiter.from_config(config),
+            cookies=getattr(config, "cookies", None) or [config.cookie],
+            retry=RetryPolicy.from_config(config),
+            transport=transport,
+        )
+
+    def video_slot(self, aweme_id) -> VideoSlot:
+        aweme_id = str(aweme_id)
+        if aweme_id not in self._slots:
+            self._slots[aweme_id] = VideoSlot(asyncio.Semaphore(self.per_video_concurrency), self.budget)
+        return self._slots[aweme_id]
+
+    async def get(self, url: str, params: dict, headers: dict, slot: VideoSlot = None) -> httpx.Response:
+        """
+        所有接口请求的统一入口：先占用视频的并发名额，再从令牌桶取令牌。
+        状态码和响应头表明被限流时在这里降速；正文是否正常由调用方解码后通过 report 告知
+        令牌按先来后到发放，先占名额保证每个视频排队等令牌的请求最多 per_video 个，
+        请求很多的视频不会让其它视频排在它所有请求的后面
+        """
+        endpoint = urlsplit(url).path
+        bucket = self.limiter.bucket(url, headers.get("cookie", ""))
+        waiting = time.perf_counter()
+        async with slot or contextlib.nullcontext():
+            SEMAPHORE_WAIT.observe(time.perf_counter() - waiting, endpoint)
+            await bucket.acquire()
+            start = time.perf_counter()
+            response = await self.client.get(url, params=params, headers=headers)
+            elapsed = time.perf_counter() - start
+        STAGES.observe(elapsed, "fetch")
+        HTTP_LATENCY.observe(elapsed, endpoint)
+        HTTP_RESPONSES.inc(1, endpoint, response.status_code)
+        if is_throttled(response):
+            bucket.on_throttle()
+        return response
+
+    def report(self, url: str, cookie: str, throttled: bool):
+        """解码之后调整令牌桶的速率：正常的数据加速，正文中的限流信号（status_code、空列表）降速"""
+        bucket = self.limiter.bucket(url, cookie)
+        if throttled:
+            bucket.on_throttle()
+        else:
+            bucket.on_success()
+
+    async def open(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout,
+                                            transport=self.transport)
+        return self
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,78 @@
+// 常驻签名进程：加载一次 douyin.js，然后按行从 stdin 读取 JSON 请求，向 stdout 写回结果
+// 请求: {"id": 1, "fn": "sign_datail", "args": [query, userAgent]}
+// 批量: {"id": 2, "fn": "batch", "args": [["sign_reply", query, userAgent], ...]}
+// 固定随机数: {"id": 3, "fn": "seeded", "args": [fn, query, userAgent, [r1, r2, r3], now]}，用于与 abogus.py 做一致性校验
+// 响应: {"id": 1, "result": "..."} 或 {"id": 1, "error": "..."}
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const readline = require('readline');
+
+const context = vm.createContext({console: console});
+vm.runInContext(fs.readFileSync(path.join(__dirname, 'douyin.js'), 'utf-8'), context);
+
+const jsMath = vm.runInContext('Math', context);
+const jsDate = vm.runInContext('Date', context);
+
+const ALLOWED = new Set(['sign_datail', 'sign_reply']);
+
+function call(fn, args) {
+    if (!ALLOWED.has(fn)) {
+        throw new Error('unknown function: ' + fn);
+    }
+    return context[fn].apply(null, args);
+}
+
+function seeded(fn, query, userAgent, randoms, now) {
+    const random = jsMath.random;
+    const dateNow = jsDate.now;
+    let index = 0;
+    jsMath.random = function () {
+        return randoms[index++];
+    };
+    jsDate.now = function () {
+        return now;
+    };
+    try {
+        return call(fn, [query, userAgent]);
+    } finally {
+        jsMath.random = random;
+        jsDate.now = dateNow;
+    }
+}
+
+function handle(request) {
+    if (request.fn === 'seeded') {
+        return seeded.apply(null, request.args);
+    }
+    if (request.fn === 'batch') {
+        return request.args.map(function (item) {
+            return call(item[0], item.slice(1));
+        });
+    }
+    return call(request.fn, request.args);
+}
+
+const rl = readline.createInterface({input: process.stdin, terminal: false});
+rl.on('line', function (line) {
+    if (!line) {
+        return;
+    }
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (e) {
+        process.stdout.write(JSON.stringify({id: null, error: 'bad request: ' + e.message}) + '\n');
+        return;
+    }
+    let response;
+    try {
+        response = {id: request.id, result: handle(request)};
+    } catch (e) {
+        response = {id: request.id, error: String(e && e.message || e)};
+    }
+    process.stdout.write(JSON.stringify(response) + '\n');
+});
+rl.on('close', function () {
+    process.exit(0);
+});
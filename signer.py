@@ -0,0 +1,214 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+SIGN_WORKER_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sign_worker.js')
+DOUYIN_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'douyin.js')
+
+
+class SignStats:
+    """签名耗时统计（线程安全），单位为秒"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float, n: int = 1):
+        # 批量签名按条数平摊耗时
+        with self._lock:
+            self.count += n
+            self.total += elapsed
+            self.max = max(self.max, elapsed / n)
+
+    def summary(self) -> dict:
+        with self._lock:
+            mean = self.total / self.count if self.count else 0.0
+            return {"count": self.count, "mean_ms": mean * 1000, "max_ms": self.max * 1000}
+
+
+class SignWorker:
+    """一个常驻的 node 签名进程，通过管道按请求ID收发 JSON 行"""
+
+    def __init__(self, node: str = 'node'):
+        self.proc = subprocess.Popen(
+            [node, SIGN_WORKER_JS],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+        )
+        self._ids = itertools.count()
+        self._pending: dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, fn: str, args: list) -> Future:
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self.proc.stdin.write(json.dumps({"id": request_id, "fn": fn, "args": args}) + '\n')
+                self.proc.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(RuntimeError(f"sign worker is gone: {e}"))
+        return future
+
+    def _read_loop(self):
+        for line in self.proc.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                logging.warning(f"Unexpected output from sign worker: {line.strip()}")
+                continue
+            with self._lock:
+                future = self._pending.pop(response.get("id"), None)
+            if future is None:
+                continue
+            if "error" in response:
+                future.set_exception(RuntimeError(response["error"]))
+            else:
+                future.set_result(response["result"])
+        # 进程退出，未完成的请求全部失败
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError("sign worker exited"))
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+class SignerPool:
+    """
+    常驻 node 进程池，替代每次签名都重新启动 node 并重新编译 douyin.js 的 execjs 调用
+    """
+
+    def __init__(self, size: int = 2, node: str = 'node', timeout: float = 30):
+        self.size = max(1, size)
+        self.node = node
+        self.timeout = timeout
+        self.stats = SignStats()
+        self._lock = threading.Lock()
+        self._workers = [SignWorker(node) for _ in range(self.size)]
+
+    @property
+    def pending(self) -> int:
+        return sum(worker.pending for worker in self._workers)
+
+    def _pick(self) -> SignWorker:
+        # 选择待处理请求最少的进程，死掉的进程就地重启
+        with self._lock:
+            for i, worker in enumerate(self._workers):
+                if not worker.alive:
+                    logging.warning("Sign worker died, restarting it.")
+                    self._workers[i] = SignWorker(self.node)
+            return min(self._workers, key=lambda w: w.pending)
+
+    def sign(self, call_name: str, query: str, user_agent: str) -> str:
+        start = time.perf_counter()
+        result = self._pick().submit(call_name, [query, user_agent]).result(self.timeout)
+        self.stats.record(time.perf_counter() - start)
+        return result
+
+    async def sign_many(self, items: list[tuple[str, str, str]]) -> list[str]:
+        """
+        批量签名，items 为 (call_name, query, user_agent) 列表，按进程数切分后并行发送
+        """
+        if not items:
+            return []
+        start = time.perf_counter()
+        chunk = -(-len(items) // self.size)
+        futures = [
+            asyncio.wrap_future(self._pick().submit("batch", [list(item) for item in items[i:i + chunk]]))
+            for i in range(0, len(items), chunk)
+        ]
+        results = await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        self.stats.record(time.perf_counter() - start, len(items))
+        return [sign for part in results for sign in part]
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+
+class ExecjsSigner:
+    """原有的 execjs 实现，保留作为没有常驻 node 时的后备"""
+
+    def __init__(self):
+        import execjs
+        self.ctx = execjs.compile(open(DOUYIN_JS, encoding='utf-8').read())
+        self.stats = SignStats()
+
+    def sign(self, call_name: str, query: str, user_agent: str) -> str:
+        start = time.perf_counter()
+        result = self.ctx.call(call_name, query, user_agent)
+        self.stats.record(time.perf_counter() - start)
+        return result
+
+    async def sign_many(self, items: list[tuple[str, str, str]]) -> list[str]:
+        return await asyncio.to_thread(lambda: [self.sign(*item) for item in items])
+
+    def close(self):
+        pass
+
+
+_signer = None
+_backend = "pool"
+_workers = 2
+
+
+def configure(backend: str = "pool", workers: int = 2):
+    """选择签名后端：pool（常驻 node 进程池）、python（abogus.py 纯 Python 实现）或 execjs"""
+    global _backend, _workers
+    if _signer is not None and (backend, workers) != (_backend, _workers):
+        close()
+    _backend, _workers = backend, workers
+
+
+def get_signer():
+    global _signer
+    if _signer is None:
+        if _backend == "pool":
+            _signer = SignerPool(_workers)
+        elif _backend == "python":
+            from abogus import PythonSigner
+            _signer = PythonSigner()
+        elif _backend == "execjs":
+            _signer = ExecjsSigner()
+        else:
+            raise ValueError(f"Invalid sign_backend: {_backend}")
+    return _signer
+
+
+def close():
+    global _signer
+    if _signer is not None:
+        logging.info(f"Sign latency: {_signer.stats.summary()}")
+        _signer.close()
+        _signer = None
@@ -0,0 +1,150 @@
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+import checkpoint
+from db import crdb
+from metrics import STAGES, QUEUE_DEPTH
+
+
+class DatabaseSink:
+    """
+    抓取结果直接写入 SQLite：抓取协程把整理好的每一页放进队列，
+    由单独的写线程攒成批次后一次性提交，新增的行同时追加到 data/{日期}/{小时} 的增量 CSV。
+    和数据一起放入的检查点在数据提交之后才写入
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, db_path: str = "comments_replies.db", batch_size: int = 2000, flush_interval: float = 2.0,
+                 incremental_csv: bool = True, archive=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.incremental_csv = incremental_csv
+        self.archive = archive  # archive.Archive，新增的行同时写入列式归档
+        self.queue: queue.Queue = queue.Queue()
+        self.error: BaseException = None
+        # metrics
+        self.rows = 0
+        self.new_rows = 0
+        self.batches = 0
+        # 视频ID -> 新增的行数（评论和回复），由调度器读取后清零
+        self.new_by_video: dict[str, int] = {}
+        self._counts_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, table_name: str, video_id, rows: pd.DataFrame, checkpoints: list[tuple] = None):
+        """checkpoints: checkpoint.comment_record / reply_record，记录这一页之后的翻页位置"""
+        self._raise_error()
+        if rows is not None and not len(rows):
+            rows = None
+        if rows is not None or checkpoints:
+            self.queue.put((table_name, str(video_id), rows, checkpoints))
+            QUEUE_DEPTH.set(self.queue.qsize(), "sink")
+
+    def flush(self):
+        """阻塞直到此前放入的所有数据都已提交"""
+        done = threading.Event()
+        self.queue.put((self._FLUSH, done))
+        while not done.wait(0.5):
+            if not self._thread.is_alive():
+                break
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put((self._STOP, None))
+            self._thread.join()
+        logging.info(f"Database sink: {self.metrics()}")
+        self._raise_error()
+
+    def take_new_rows(self, video_id) -> int:
+        """取出并清零某个视频自上次调用以来新增的行数，需要先 flush"""
+        with self._counts_lock:
+            return self.new_by_video.pop(str(video_id), 0)
+
+    def metrics(self) -> dict:
+        return {"rows": self.rows, "new_rows": self.new_rows, "batches": self.batches, "queue": self.queue.qsize()}
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError("database writer failed") from self.error
+
+    def _run(self):
+        # sqlite 连接只能在创建它的线程里使用，所以在写线程里打开
+        db = crdb(self.db_path)
+        checkpoint.create_tables(db.conn)
+        pending: list[tuple[str, str, pd.DataFrame, list]] = []
+        pending_rows = 0
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    QUEUE_DEPTH.set(self.queue.qsize(), "sink")
+                except queue.Empty:
+                    item = None
+
+                if item is not None and item[0] is not self._FLUSH and item[0] is not self._STOP:
+                    pending.append(item)
+                    pending_rows += len(item[2]) if item[2] is not None else 0
+                    if pending_rows < self.batch_size:
+                        continue
+
+                if pending:
+                    with STAGES.time("db"):
+                        self._write(db, pending)
+                    pending, pending_rows = [], 0
+                deadline = time.monotonic() + self.flush_interval
+
+                if item is not None and item[0] is self._FLUSH:
+                    item[1].set()
+                elif item is not None and item[0] is self._STOP:
+                    return
+        except BaseException as e:
+            logging.error(f"Database writer failed: {e}", exc_info=True)
+            self.error = e
+            # 唤醒所有等待 flush 的调用方
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] is self._FLUSH:
+                    item[1].set()
+        finally:
+            db.close()
+
+    def _write(self, db: crdb, pending: list[tuple[str, str, pd.DataFrame, list]]):
+        for table_name in ("comments", "replies"):
+            frames = []
+            for table, video_id, rows, _ in pending:
+                if table == table_name and rows is not None:
+                    frames.append(rows.assign(视频ID=video_id))
+            if not frames:
+                continue
+            data = pd.concat(frames, ignore_index=True)
+            new_ids = db.insert_rows(table_name, data)
+            self.rows += len(data)
+            self.new_rows += len(new_ids)
+            if new_ids:
+                # 同一批里可能有重复的评论（重试或重叠的页），表中只插入了第一条，导出的也只保留第一条
+                new_data = data[data['评论ID'].astype(str).isin(set(new_ids))].drop_duplicates('评论ID')
+                for video_id, rows in new_data.groupby('视频ID'):
+                    with self._counts_lock:
+                        self.new_by_video[video_id] = self.new_by_video.get(video_id, 0) + len(rows)
+                    if self.incremental_csv:
+                        db.save_new_entries(table_name, video_id, rows.drop(columns='视频ID'))
+                    if self.archive is not None:
+                        self.archive.write(table_name, video_id, rows.drop(columns='视频ID'))
+        # 检查点在数据提交之后写：进程恰好在两次提交之间被杀掉时只会重复请求这一批，不会漏数据
+        records = [record for *_, checkpoints in pending if checkpoints for record in checkpoints]
+        if records:
+            checkpoint.write(db.conn, records)
+        self.batches += 1
@@ -0,0 +1,56 @@
+"""
+增量模式的提前停止，评论经过 offload.slim（进程池解码时只保留部分字段）之后也要能识别置顶评论
+
+    python -m pytest test_watermark.py
+"""
+import offload
+from watermark import VideoWatermark
+
+WATERMARK_TIME = 1_700_000_000
+
+
+def raw_comment(cid: str, create_time: int, pinned: bool = False) -> dict:
+    # 接近接口返回的结构，包含 slim 会丢掉的字段
+    comment = {"cid": cid, "text": f"评论 {cid}", "create_time": create_time, "digg_count": 0,
+               "reply_comment_total": 0, "user": {"nickname": "n", "avatar_thumb": {"url_list": []}},
+               "label_list": None, "ip_label": "广东"}
+    if pinned:
+        comment["stick_position"] = 1
+    return comment
+
+
+def slimmed(comments: list) -> list:
+    return offload.slim({"status_code": 0, "has_more": 1, "cursor": 20, "comments": comments}, "comments")["comments"]
+
+
+def known_watermark(*cids) -> VideoWatermark:
+    return VideoWatermark("7400000000000000000", cids[0], WATERMARK_TIME, {cid: 0 for cid in cids})
+
+
+def test_slim_keeps_stick_position():
+    page = slimmed([raw_comment("old", WATERMARK_TIME - 10 ** 6, pinned=True), raw_comment("new", WATERMARK_TIME)])
+    assert page[0]["stick_position"] == 1
+    assert "stick_position" not in page[1]
+
+
+def test_pinned_comment_does_not_disable_early_stop_after_slim():
+    watermark = known_watermark("a", "b", "c", "pinned")
+    # 第一页：置顶的旧评论排在最前面，后面是比水位新的评论和水位本身
+    first = slimmed([raw_comment("pinned", WATERMARK_TIME - 10 ** 6, pinned=True),
+                     raw_comment("x", WATERMARK_TIME + 100), raw_comment("a", WATERMARK_TIME)])
+    second = slimmed([raw_comment("b", WATERMARK_TIME - 10), raw_comment("c", WATERMARK_TIME - 20)])
+    assert not watermark.page_is_known(first)
+    assert watermark.page_is_known(second)
+    assert watermark.newest_first
+
+
+def test_unordered_pages_disable_early_stop_after_slim():
+    watermark = known_watermark("a", "b", "c")
+    # 按热度排序：旧评论在前，之后出现更新的评论
+    first = slimmed([raw_comment("x", WATERMARK_TIME + 100), raw_comment("b", WATERMARK_TIME - 10)])
+    second = slimmed([raw_comment("y", WATERMARK_TIME + 50), raw_comment("a", WATERMARK_TIME)])
+    third = slimmed([raw_comment("c", WATERMARK_TIME - 20)])
+    assert not watermark.page_is_known(first)
+    assert not watermark.page_is_known(second)
+    assert not watermark.page_is_known(third)
+    assert not watermark.newest_first
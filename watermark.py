@@ -0,0 +1,111 @@
+import logging
+import sqlite3
+import time
+
+
+class VideoWatermark:
+    """
+    单个视频上次爬取到的位置：最新一条评论，以及每条评论当时的回复总数
+    """
+
+    def __init__(self, aweme_id, newest_cid: str = None, newest_create_time: int = 0, reply_totals: dict = None):
+        self.aweme_id = str(aweme_id)
+        self.newest_cid = newest_cid
+        self.newest_create_time = newest_create_time or 0
+        self.reply_totals: dict[str, int] = reply_totals or {}
+        self._changed: dict[str, int] = {}
+        # 本次翻页是否一直是按时间从新到旧、目前见到的最早的 create_time，以及是否已经翻过了水位
+        self.newest_first = True
+        self._oldest_seen = None
+        self._crossed = False
+
+    def is_known(self, comment: dict) -> bool:
+        return comment["cid"] in self.reply_totals and comment["create_time"] <= self.newest_create_time
+
+    def page_is_known(self, comments: list) -> bool:
+        """
+        整页都是已经见过、且 create_time 不高于水位的评论，说明已经翻到了旧数据。
+        只有评论按时间从新到旧返回时才能提前停止：按热度排序时旧评论也可能排在前面。
+        所以要先见到不早于水位的评论（翻过了水位）才会停止，一旦发现翻页过程中 create_time 变大，
+        本次就不再提前停止，翻完整个列表。置顶评论不参与判断
+        """
+        for c in comments:
+            if c.get("stick_position"):
+                continue
+            if self._oldest_seen is not None and c["create_time"] > self._oldest_seen:
+                if self.newest_first:
+                    logging.info(f"Comments of {self.aweme_id} are not newest-first, incremental early stop disabled.")
+                self.newest_first = False
+            if c["create_time"] >= self.newest_create_time:
+                self._crossed = True
+            self._oldest_seen = c["create_time"] if self._oldest_seen is None else min(self._oldest_seen, c["create_time"])
+        if not self.newest_first or not self._crossed:
+            return False
+        return bool(comments) and all(self.is_known(c) for c in comments)
+
+    def replies_changed(self, comment: dict) -> bool:
+        return self.reply_totals.get(comment["cid"]) != (comment.get("reply_comment_total") or 0)
+
+    def update(self, comments: list):
+        """用本次抓到的评论推进水位，只有在数据保存成功后才应该持久化"""
+        for c in comments:
+            total = c.get("reply_comment_total") or 0
+            if self.reply_totals.get(c["cid"]) != total:
+                self.reply_totals[c["cid"]] = total
+                self._changed[c["cid"]] = total
+            if c["create_time"] > self.newest_create_time:
+                self.newest_create_time = c["create_time"]
+                self.newest_cid = c["cid"]
+
+
+class WatermarkStore:
+    def __init__(self, db_path: str = "comments_replies.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path)
+        self.cursor = self.conn.cursor()
+
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS video_watermarks (
+            aweme_id TEXT PRIMARY KEY,
+            newest_cid TEXT,
+            newest_create_time INTEGER,
+            updated_at INTEGER
+        )
+        ''')
+
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reply_totals (
+            aweme_id TEXT,
+            cid TEXT,
+            reply_total INTEGER,
+            PRIMARY KEY (aweme_id, cid)
+        )
+        ''')
+        self.conn.commit()
+
+    def load(self, aweme_id) -> VideoWatermark:
+        aweme_id = str(aweme_id)
+        self.cursor.execute("SELECT newest_cid, newest_create_time FROM video_watermarks WHERE aweme_id=?", (aweme_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return VideoWatermark(aweme_id)
+        self.cursor.execute("SELECT cid, reply_total FROM reply_totals WHERE aweme_id=?", (aweme_id,))
+        return VideoWatermark(aweme_id, row[0], row[1], dict(self.cursor.fetchall()))
+
+    def save(self, watermark: VideoWatermark):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO video_watermarks (aweme_id, newest_cid, newest_create_time, updated_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(aweme_id) DO UPDATE SET newest_cid=excluded.newest_cid, "
+                "newest_create_time=excluded.newest_create_time, updated_at=excluded.updated_at",
+                (watermark.aweme_id, watermark.newest_cid, watermark.newest_create_time, int(time.time())),
+            )
+            self.conn.executemany(
+                "INSERT INTO reply_totals (aweme_id, cid, reply_total) VALUES (?,?,?) "
+                "ON CONFLICT(aweme_id, cid) DO UPDATE SET reply_total=excluded.reply_total",
+                [(watermark.aweme_id, cid, total) for cid, total in watermark._changed.items()],
+            )
+        watermark._changed = {}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,155 @@
+"""
+基于 SQLite 的共享任务队列，供分布式模式（distributed.py）使用。
+同一台机器上的多个进程同时从队列中租用任务，租约到期未完成的任务会被重新分配。
+WAL 模式依赖同一台机器上的共享内存，队列文件不能放在网络文件系统上供多台机器共用
+"""
+import json
+import logging
+import sqlite3
+import time
+
+
+class WorkItem:
+    def __init__(self, id: int, run: str, kind: str, key: str, aweme_id: str, payload: str, attempts: int):
+        self.id = id
+        self.run = run
+        self.kind = kind
+        self.key = key
+        self.aweme_id = aweme_id
+        self.payload: dict = json.loads(payload) if payload else {}
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"WorkItem({self.kind} {self.key}, attempt {self.attempts})"
+
+
+class WorkQueue:
+    """
+    任务状态：pending -> leased -> done / failed。
+    同一次运行（run）中 key 相同的任务只会加入一次，已经完成的任务不会重复执行
+    """
+
+    def __init__(self, db_path: str = "work_queue.db", lease_time: float = 120, max_attempts: int = 5):
+        self.db_path = db_path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        # 多个进程同时写，等待锁的时间长一些
+        self.conn = sqlite3.connect(self.db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS work_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run TEXT,
+            kind TEXT,
+            key TEXT,
+            aweme_id TEXT,
+            payload TEXT,
+            state TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            error TEXT,
+            updated_at REAL,
+            UNIQUE (run, key)
+        )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items (state, lease_expires)")
+        self.conn.commit()
+
+    def enqueue(self, run: str, items: list[tuple[str, str, str, dict]]) -> int:
+        """items: (kind, key, aweme_id, payload)，返回实际新增的任务数"""
+        now = time.time()
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT INTO work_items (run, kind, key, aweme_id, payload, updated_at) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT(run, key) DO NOTHING",
+                [(run, kind, key, str(aweme_id), json.dumps(payload, ensure_ascii=False), now)
+                 for kind, key, aweme_id, payload in items],
+            )
+            return self.conn.total_changes - before
+
+    def lease(self, worker: str, n: int = 1) -> list[WorkItem]:
+        """租用最多 n 个待处理或租约已过期的任务"""
+        now = time.time()
+        with self.conn:
+            # 多次租约过期仍未完成的任务不再重试
+            self.conn.execute(
+                "UPDATE work_items SET state='failed', error='lease expired', updated_at=? "
+                "WHERE state='leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = self.conn.execute(
+                "UPDATE work_items SET state='leased', lease_owner=?, lease_expires=?, attempts=attempts+1, "
+                "updated_at=? WHERE id IN (SELECT id FROM work_items "
+                "WHERE state='pending' OR (state='leased' AND lease_expires < ?) ORDER BY id LIMIT ?) "
+                "RETURNING id, run, kind, key, aweme_id, payload, attempts",
+                (worker, now + self.lease_time, now, now, n),
+            ).fetchall()
+        return [WorkItem(*row) for row in rows]
+
+    def renew(self, items: list[WorkItem], worker: str) -> int:
+        """延长仍在处理中的任务的租约，返回成功续约的数量（租约已被别人接手的不会续约）"""
+        expires = time.time() + self.lease_time
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "UPDATE work_items SET lease_expires=? WHERE id=? AND state='leased' AND lease_owner=?",
+                [(expires, item.id, worker) for item in items],
+            )
+            return self.conn.total_changes - before
+
+    def complete(self, item: WorkItem, worker: str, follow_ups: list[tuple[str, str, str, dict]] = ()) -> bool:
+        """
+        标记完成并在同一事务中加入后续任务。租约已被别人接手时仍然记为完成（结果写库是幂等的），返回 False
+        """
+        now = time.time()
+        with self.conn:
+            owner = self.conn.execute("SELECT lease_owner FROM work_items WHERE id=?", (item.id,)).fetchone()
+            self.conn.execute(
+                "UPDATE work_items SET state='done', lease_expires=NULL, error=NULL, updated_at=? WHERE id=?",
+                (now, item.id),
+            )
+            self.conn.executemany(
+                "INSERT INTO work_items (run, kind, key, aweme_id, payload, updated_at) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT(run, key) DO NOTHING",
+                [(item.run, kind, key, str(aweme_id), json.dumps(payload, ensure_ascii=False), now)
+                 for kind, key, aweme_id, payload in follow_ups],
+            )
+        if owner is None or owner[0] != worker:
+            logging.warning(f"{item} was completed by {worker} after its lease moved to {owner and owner[0]}.")
+            return False
+        return True
+
+    def fail(self, item: WorkItem, worker: str, error: str):
+        """放回队列等待重试，超过最大次数后标记为 failed"""
+        state = "failed" if item.attempts >= self.max_attempts else "pending"
+        with self.conn:
+            self.conn.execute(
+                "UPDATE work_items SET state=?, error=?, lease_expires=NULL, updated_at=? "
+                "WHERE id=? AND lease_owner=?",
+                (state, error[:1000], time.time(), item.id, worker),
+            )
+
+    def stats(self, run: str = None) -> dict:
+        query = "SELECT kind, state, COUNT(*) FROM work_items"
+        params = ()
+        if run is not None:
+            query += " WHERE run=?"
+            params = (run,)
+        result: dict[str, dict[str, int]] = {}
+        for kind, state, count in self.conn.execute(query + " GROUP BY kind, state", params):
+            result.setdefault(kind, {})[state] = count
+        return result
+
+    def unfinished(self, run: str = None) -> int:
+        query = "SELECT COUNT(*) FROM work_items WHERE state IN ('pending', 'leased')"
+        params = ()
+        if run is not None:
+            query += " AND run=?"
+            params = (run,)
+        return self.conn.execute(query, params).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
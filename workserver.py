@@ -0,0 +1,265 @@
+"""
+分布式模式的任务后端：worker 通过 WorkBackend 的接口租用任务、提交结果。
+
+LocalBackend 直接打开本机的队列（workqueue.py）和 comments_replies.db，只能在一台机器上使用。
+多台机器时在其中一台上运行 `python distributed.py serve`，用 QueueServer 把 LocalBackend 通过 HTTP 提供出来，
+其它机器上的 coordinator 和 worker 设置 config 中的 queue_url，通过 RemoteBackend 访问。
+队列和结果数据库只在服务器所在的机器上读写，不需要共享文件系统；各台机器用自己的出口 IP 请求接口
+"""
+import hmac
+import json
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pandas as pd
+
+from db import crdb
+from workqueue import WorkItem, WorkQueue
+
+
+def queue_from_config(config) -> WorkQueue:
+    return WorkQueue(
+        getattr(config, "queue_db", "work_queue.db"),
+        lease_time=getattr(config, "queue_lease_time", 120),
+        max_attempts=getattr(config, "queue_max_attempts", 5),
+    )
+
+
+def _item_to_json(item: WorkItem) -> dict:
+    return {"id": item.id, "run": item.run, "kind": item.kind, "key": item.key, "aweme_id": item.aweme_id,
+            "payload": item.payload, "attempts": item.attempts}
+
+
+def _item_from_json(data: dict) -> WorkItem:
+    return WorkItem(data["id"], data["run"], data["kind"], data["key"], data["aweme_id"],
+                    json.dumps(data["payload"], ensure_ascii=False), data["attempts"])
+
+
+def _rows_to_json(rows: pd.DataFrame):
+    if rows is None:
+        return None
+    rows = rows.astype(object)
+    return rows.where(rows.notna(), None).to_dict(orient="split", index=False)
+
+
+def _rows_from_json(data) -> pd.DataFrame:
+    return None if data is None else pd.DataFrame(data["data"], columns=data["columns"])
+
+
+class WorkBackend:
+    """
+    worker 和 coordinator 使用的接口。同一个实例只能在创建它的线程里使用
+    （distributed.Worker 把所有调用放在同一个线程里执行）
+    """
+
+    lease_time: float
+
+    def enqueue(self, run: str, items: list[tuple[str, str, str, dict]]) -> int:
+        """items: (kind, key, aweme_id, payload)，返回实际新增的任务数"""
+        raise NotImplementedError
+
+    def lease(self, worker: str, n: int = 1) -> list[WorkItem]:
+        raise NotImplementedError
+
+    def renew(self, items: list[WorkItem], worker: str) -> int:
+        raise NotImplementedError
+
+    def finish(self, item: WorkItem, worker: str, table_name: str = None, rows: pd.DataFrame = None,
+               follow_ups: list = ()) -> bool:
+        """写入这个任务的结果，标记完成并加入后续任务"""
+        raise NotImplementedError
+
+    def fail(self, item: WorkItem, worker: str, error: str):
+        raise NotImplementedError
+
+    def nicknames(self, comment_ids) -> dict[str, str]:
+        """已经入库的评论和回复的用户昵称，用于补全楼中楼回复的对象"""
+        raise NotImplementedError
+
+    def stats(self, run: str = None) -> dict:
+        raise NotImplementedError
+
+    def unfinished(self, run: str = None) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBackend(WorkBackend):
+    """本机的 SQLite 队列和数据库"""
+
+    def __init__(self, config, incremental_csv: bool = True, archive=None):
+        self.queue = queue_from_config(config)
+        self.db = crdb()
+        self.lease_time = self.queue.lease_time
+        self.incremental_csv = incremental_csv
+        self.archive = archive
+
+    def enqueue(self, run, items):
+        return self.queue.enqueue(run, items)
+
+    def lease(self, worker, n=1):
+        return self.queue.lease(worker, n)
+
+    def renew(self, items, worker):
+        return self.queue.renew(items, worker)
+
+    def finish(self, item, worker, table_name=None, rows=None, follow_ups=()):
+        # 先写结果再标记完成：中途退出时任务会被重新执行，重复的行由 ON CONFLICT 去掉
+        if rows is not None and len(rows):
+            data = rows.assign(视频ID=item.aweme_id)
+            new_ids = self.db.insert_rows(table_name, data)
+            if new_ids and (self.incremental_csv or self.archive is not None):
+                new_rows = data[data['评论ID'].astype(str).isin(set(new_ids))].drop_duplicates('评论ID')
+                new_rows = new_rows.drop(columns='视频ID')
+                if self.incremental_csv:
+                    self.db.save_new_entries(table_name, item.aweme_id, new_rows)
+                if self.archive is not None:
+                    self.archive.write(table_name, item.aweme_id, new_rows)
+        return self.queue.complete(item, worker, follow_ups)
+
+    def fail(self, item, worker, error):
+        self.queue.fail(item, worker, error)
+
+    def nicknames(self, comment_ids):
+        return self.db.get_nicknames(comment_ids)
+
+    def stats(self, run=None):
+        return self.queue.stats(run)
+
+    def unfinished(self, run=None):
+        return self.queue.unfinished(run)
+
+    def close(self):
+        self.queue.close()
+        self.db.close()
+
+
+class RemoteBackend(WorkBackend):
+    """通过 HTTP 访问另一台机器上 `distributed.py serve` 提供的队列；服务器暂时连不上时重试几次"""
+
+    def __init__(self, url: str, token: str = "", timeout: float = 60, retries: int = 5):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.client = httpx.Client(base_url=url.rstrip("/"), headers=headers, timeout=timeout)
+        self.retries = retries
+        self.lease_time = self._call("info")["lease_time"]
+
+    def _call(self, method: str, **kwargs):
+        for attempt in range(self.retries):
+            try:
+                response = self.client.post(f"/{method}", json=kwargs)
+                break
+            except httpx.TransportError as e:
+                if attempt == self.retries - 1:
+                    raise
+                logging.warning(f"Queue server unreachable ({e!r}), retrying in {2 ** attempt}s.")
+                time.sleep(2 ** attempt)
+        if response.status_code != 200:
+            raise RuntimeError(f"Queue server {method} failed with {response.status_code}: {response.text[:500]}")
+        return response.json()["result"]
+
+    def enqueue(self, run, items):
+        return self._call("enqueue", run=run, items=[list(item) for item in items])
+
+    def lease(self, worker, n=1):
+        return [_item_from_json(item) for item in self._call("lease", worker=worker, n=n)]
+
+    def renew(self, items, worker):
+        return self._call("renew", items=[_item_to_json(item) for item in items], worker=worker)
+
+    def finish(self, item, worker, table_name=None, rows=None, follow_ups=()):
+        return self._call("finish", item=_item_to_json(item), worker=worker, table_name=table_name,
+                          rows=_rows_to_json(rows), follow_ups=[list(f) for f in follow_ups])
+
+    def fail(self, item, worker, error):
+        self._call("fail", item=_item_to_json(item), worker=worker, error=error)
+
+    def nicknames(self, comment_ids):
+        return self._call("nicknames", comment_ids=list(comment_ids))
+
+    def stats(self, run=None):
+        return self._call("stats", run=run)
+
+    def unfinished(self, run=None):
+        return self._call("unfinished", run=run)
+
+    def close(self):
+        self.client.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    backend: LocalBackend = None
+    token: str = ""
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.token}"):
+            self._reply(401, {"error": "invalid token"})
+            return
+        method = self.path.strip("/")
+        try:
+            args = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            result = self.dispatch(method, args)
+        except KeyError as e:
+            self._reply(400, {"error": f"bad request: {e!r}"})
+            return
+        except Exception as e:
+            logging.error(f"Queue server {method} failed: {e!r}", exc_info=True)
+            self._reply(500, {"error": repr(e)})
+            return
+        self._reply(200, {"result": result})
+
+    def dispatch(self, method: str, args: dict):
+        backend = self.backend
+        if method == "info":
+            return {"lease_time": backend.lease_time}
+        if method == "enqueue":
+            return backend.enqueue(args["run"], [tuple(item) for item in args["items"]])
+        if method == "lease":
+            return [_item_to_json(item) for item in backend.lease(args["worker"], args.get("n", 1))]
+        if method == "renew":
+            return backend.renew([_item_from_json(item) for item in args["items"]], args["worker"])
+        if method == "finish":
+            return backend.finish(_item_from_json(args["item"]), args["worker"], args.get("table_name"),
+                                  _rows_from_json(args.get("rows")), [tuple(f) for f in args.get("follow_ups", [])])
+        if method == "fail":
+            return backend.fail(_item_from_json(args["item"]), args["worker"], args["error"])
+        if method == "nicknames":
+            return backend.nicknames(args["comment_ids"])
+        if method == "stats":
+            return backend.stats(args.get("run"))
+        if method == "unfinished":
+            return backend.unfinished(args.get("run"))
+        raise KeyError(method)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(backend: LocalBackend, host: str = "127.0.0.1", port: int = 8766, token: str = "") -> HTTPServer:
+    """
+    返回的服务器需要调用 serve_forever。请求在同一个线程里逐个处理：sqlite 连接只能在创建它的线程里使用，
+    而且写库本来就是串行的
+    """
+    handler = type("QueueHandler", (_Handler,), {"backend": backend, "token": token})
+    server = HTTPServer((host, port), handler)
+    logging.info(f"Queue server listening on http://{host}:{server.server_address[1]}")
+    return server
+
+
+def backend_from_config(config, incremental_csv: bool = True, archive=None) -> WorkBackend:
+    """config 中设置了 queue_url 时连接远程的队列服务器，否则直接使用本机的队列和数据库"""
+    url = getattr(config, "queue_url", None)
+    if url:
+        return RemoteBackend(url, getattr(config, "queue_token", ""))
+    return LocalBackend(config, incremental_csv, archive)